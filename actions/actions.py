@@ -11,16 +11,33 @@ from rasa_sdk.events import ActionExecuted, AllSlotsReset, EventType, SessionSta
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.forms import FormAction, REQUESTED_SLOT
 
-from cora.api import get_user_records, put_user_record, put_survey_response
+from cora import api, async_api, config, metrics
+from cora.api import get_user_records, patch_user_record, put_user_record, put_survey_response, record_cache
+from cora.instrumentation import instrument_action, timed
 from cora.models import Symptom, UserRecord, SurveyResponse
 from cora.responses import UserRecordResponse
 from cora.utils import normalize_phone_number
+from cora.writebehind import SurveyWriteBuffer
 
 logger = logging.getLogger(__name__)
 vers = 'Vers: 0.1.5, Date: Mar 31, 2020'
 logger.info(f"Starting vers: {vers}")
 
-
+survey_buffer = SurveyWriteBuffer(
+    async_api.put_survey_response,
+    batch_size=config.survey_batch_size,
+    flush_interval=config.survey_flush_interval,
+    spill_path=config.survey_spill_path,
+)
+metrics.registry.register_stats("cora_survey_buffer", survey_buffer.stats)
+metrics.registry.register_stats("cora_record_cache", record_cache.stats)
+metrics.registry.register_stats("cora_api_flight", lambda: api.get_client().flight.stats())
+metrics.registry.register_stats("cora_async_api_flight", lambda: async_api.get_client().flight.stats())
+if config.metrics_port:
+    metrics.start_http_server(config.metrics_port)
+
+
+@instrument_action
 class ActionSessionStart(Action):
     def name(self) -> Text:
         return "action_session_start"
@@ -54,6 +71,7 @@ class ActionSessionStart(Action):
         return events
 
 
+@instrument_action
 class Triage(FormAction):
 
     def name(self) -> Text:
@@ -177,6 +195,7 @@ class Triage(FormAction):
             return {"cov_severity": None}
 
 
+@instrument_action
 class QuestionnaireForm(FormAction):
     """Example of a custom form action"""
 
@@ -212,7 +231,7 @@ class QuestionnaireForm(FormAction):
             ]
         }
 
-    def submit(
+    async def submit(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
@@ -220,10 +239,11 @@ class QuestionnaireForm(FormAction):
     ) -> List[Dict]:
         """Define what the form has to do
             after all required slots are filled"""
-        send_survey_response(tracker)
+        await send_survey_response_async(tracker)
         return [AllSlotsReset()]
 
 
+@instrument_action
 class DailyQuestionnaireForm(FormAction):
     """Example of a custom form action"""
 
@@ -283,7 +303,7 @@ class DailyQuestionnaireForm(FormAction):
         logger.debug(f"Validating extracted slots: {slot_values}")
         return await self.validate_slots(slot_values, dispatcher, tracker, domain)
 
-    def submit(
+    async def submit(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
@@ -291,10 +311,11 @@ class DailyQuestionnaireForm(FormAction):
     ) -> List[Dict]:
         """Define what the form has to do
             after all required slots are filled"""
-        send_survey_response(tracker)
+        await send_survey_response_async(tracker)
         return [AllSlotsReset()]
 
 
+@instrument_action
 class ShortResponseForm(FormAction):
     """Example of a custom form action"""
 
@@ -323,7 +344,7 @@ class ShortResponseForm(FormAction):
             ]
         }
 
-    def submit(
+    async def submit(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
@@ -331,10 +352,11 @@ class ShortResponseForm(FormAction):
     ) -> List[Dict]:
         """Define what the form has to do
             after all required slots are filled"""
-        send_survey_response(tracker)
+        await send_survey_response_async(tracker)
         return [AllSlotsReset()]
 
 
+@instrument_action
 class WeeklyForm(FormAction):
     """Example of a custom form action"""
 
@@ -366,7 +388,7 @@ class WeeklyForm(FormAction):
             ]
         }
 
-    def submit(
+    async def submit(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
@@ -374,10 +396,11 @@ class WeeklyForm(FormAction):
     ) -> List[Dict]:
         """Define what the form has to do
             after all required slots are filled"""
-        send_survey_response(tracker)
+        await send_survey_response_async(tracker)
         return [AllSlotsReset()]
 
 
+@instrument_action
 class FollowupForm(FormAction):
     """Example of a custom form action"""
 
@@ -385,6 +408,18 @@ class FollowupForm(FormAction):
         """Unique identifier of the form"""
         return "followup_form"
 
+    @overrides
+    async def run(
+            self,
+            dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any],
+    ) -> List[EventType]:
+        # rasa_sdk calls required_slots and request_next_slot synchronously, loading the record without
+        # blocking first lets their lookups be served from the record cache shared with the sync client
+        await async_api.get_user_records(normalize_phone_number(tracker.sender_id), latest_only=True)
+        return await super().run(dispatcher, tracker, domain)
+
     @staticmethod
     def required_slots(tracker: Tracker) -> List[Text]:
         """A list of required slots that the form has to fill"""
@@ -437,7 +472,7 @@ class FollowupForm(FormAction):
         # no more required slots to fill
         return None
 
-    def validate_fever(
+    async def validate_fever(
             self,
             value: Text,
             dispatcher: CollectingDispatcher,
@@ -445,9 +480,9 @@ class FollowupForm(FormAction):
             domain: Dict[Text, Any],
     ) -> Dict[Text, Any]:
         """Validate symptoms by replying appropriately to changes in the symptom ratings over time."""
-        return self.validate_symptom_severity("fever", 0, 120, value, dispatcher, tracker)
+        return await self.validate_symptom_severity("fever", 0, 120, value, dispatcher, tracker)
 
-    def validate_sob(
+    async def validate_sob(
             self,
             value: Text,
             dispatcher: CollectingDispatcher,
@@ -455,9 +490,9 @@ class FollowupForm(FormAction):
             domain: Dict[Text, Any],
     ) -> Dict[Text, Any]:
         """Validate symptoms by replying appropriately to changes in the symptom ratings over time."""
-        return self.validate_symptom_severity("sob", 0, 10, value, dispatcher, tracker)
+        return await self.validate_symptom_severity("sob", 0, 10, value, dispatcher, tracker)
 
-    def validate_cough(
+    async def validate_cough(
             self,
             value: Text,
             dispatcher: CollectingDispatcher,
@@ -465,20 +500,20 @@ class FollowupForm(FormAction):
             domain: Dict[Text, Any],
     ) -> Dict[Text, Any]:
         """Validate symptoms by replying appropriately to changes in the symptom ratings over time."""
-        return self.validate_symptom_severity("cough", 0, 10, value, dispatcher, tracker)
-
-    def validate_symptom_severity(self,
-                                  symptom_name: Text,
-                                  min_value: float,
-                                  max_value: float,
-                                  value: Text,
-                                  dispatcher: CollectingDispatcher,
-                                  tracker: Tracker,
-                                  ) -> Dict[Text, Any]:
+        return await self.validate_symptom_severity("cough", 0, 10, value, dispatcher, tracker)
+
+    async def validate_symptom_severity(self,
+                                        symptom_name: Text,
+                                        min_value: float,
+                                        max_value: float,
+                                        value: Text,
+                                        dispatcher: CollectingDispatcher,
+                                        tracker: Tracker,
+                                        ) -> Dict[Text, Any]:
         """Validate symptoms by replying appropriately to changes in the symptom ratings over time."""
         new_severity = float(value)
         if min_value <= new_severity <= max_value:
-            prev_severity = get_symptom_severity(tracker.sender_id, symptom_name)
+            prev_severity = await get_symptom_severity_async(tracker.sender_id, symptom_name)
 
             if prev_severity is not None:
                 prev_severity = float(prev_severity)
@@ -498,7 +533,7 @@ class FollowupForm(FormAction):
             # user will be asked for the slot again
             return {symptom_name: None}
 
-    def submit(
+    async def submit(
             self,
             dispatcher: CollectingDispatcher,
             tracker: Tracker,
@@ -508,18 +543,40 @@ class FollowupForm(FormAction):
             after all required slots are filled"""
 
         # utter submit template
-        res = update_symptoms(tracker)
+        res = await update_symptoms_async(tracker)
         if res is not None:
             logger.info(res.status_code, res.text)
         return [AllSlotsReset()]
 
 
+@timed
 def update_symptoms(tracker: Tracker) -> Optional[Response]:
     """This function takes the data stored in the form and stores it for long-term use."""
     user_id = normalize_phone_number(tracker.sender_id)
     logger.info(f"Posting new record for {user_id}.")
-    user_record = get_user_records(user_id).most_recent()
-    symptom_frame = tracker.current_slot_values()
+    user_record = get_user_records(user_id, latest_only=True).most_recent()
+    if apply_symptom_updates(user_record, tracker.current_slot_values()) == 0:
+        return None
+    if config.api_partial_updates:
+        return patch_user_record(user_record)
+    return put_user_record(user_record)
+
+
+@timed
+async def update_symptoms_async(tracker: Tracker) -> Optional[async_api.ApiResponse]:
+    """Async variant of update_symptoms that does not block the action server."""
+    user_id = normalize_phone_number(tracker.sender_id)
+    logger.info(f"Posting new record for {user_id}.")
+    user_record = (await async_api.get_user_records(user_id, latest_only=True)).most_recent()
+    if apply_symptom_updates(user_record, tracker.current_slot_values()) == 0:
+        return None
+    if config.api_partial_updates:
+        return await async_api.patch_user_record(user_record)
+    return await async_api.put_user_record(user_record)
+
+
+def apply_symptom_updates(user_record: UserRecord, symptom_frame: Dict[Text, Any]) -> int:
+    """Copy the severities filled in the form onto the record, returning the number of symptoms updated."""
     updated_symptoms = []
     updates = 0
     for symptom in user_record.symptoms:
@@ -531,19 +588,30 @@ def update_symptoms(tracker: Tracker) -> Optional[Response]:
             updates += 1
         updated_symptoms.append(symptom)
 
-    if updates == 0:
-        return None
-
     user_record.symptoms = updated_symptoms
-    return put_user_record(user_record)
+    return updates
 
 
+@timed
 def get_symptoms_by_severity(sender_id: Text) -> List[Symptom]:
     logger.debug(f", get_symptoms_by_severity, sender_id: {sender_id}")
     user_id = normalize_phone_number(sender_id)
     logger.warning(f"user_id: {user_id}")
-    records = get_user_records(user_id)
+    records = get_user_records(user_id, latest_only=True)
+    logger.debug(f"records: {records}, typeof: {type(records)}")
+    return symptoms_by_severity(records)
+
+
+@timed
+async def get_symptoms_by_severity_async(sender_id: Text) -> List[Symptom]:
+    logger.debug(f", get_symptoms_by_severity_async, sender_id: {sender_id}")
+    user_id = normalize_phone_number(sender_id)
+    records = await async_api.get_user_records(user_id, latest_only=True)
     logger.debug(f"records: {records}, typeof: {type(records)}")
+    return symptoms_by_severity(records)
+
+
+def symptoms_by_severity(records: UserRecordResponse) -> List[Symptom]:
     if records.data:
         record = records.most_recent()
         return record.symptoms_by_severity()
@@ -551,15 +619,28 @@ def get_symptoms_by_severity(sender_id: Text) -> List[Symptom]:
         return []
 
 
+@timed
 def get_symptom_severity(sender_id: Text, slot_name: Text) -> Optional[int]:
     user_id: Text = normalize_phone_number(sender_id)
-    records: UserRecordResponse = get_user_records(user_id)
+    records: UserRecordResponse = get_user_records(user_id, latest_only=True)
+    return symptom_severity(records, slot_name)
+
+
+@timed
+async def get_symptom_severity_async(sender_id: Text, slot_name: Text) -> Optional[int]:
+    user_id: Text = normalize_phone_number(sender_id)
+    records: UserRecordResponse = await async_api.get_user_records(user_id, latest_only=True)
+    return symptom_severity(records, slot_name)
+
+
+def symptom_severity(records: UserRecordResponse, slot_name: Text) -> Optional[int]:
     symptom_severities: Dict[Text, int] = {symptom.name.lower(): symptom.severity for symptom in
                                            records.most_recent().symptoms}
     logger.info(slot_name, symptom_severities)
     return symptom_severities.get(slot_name)
 
 
+@instrument_action
 class Suggest(Action):
 
     def name(self) -> Text:
@@ -569,6 +650,7 @@ class Suggest(Action):
         pass
 
 
+@instrument_action
 class Empathize(Action):
 
     def name(self) -> Text:
@@ -583,6 +665,7 @@ class Empathize(Action):
         return []
 
 
+@instrument_action
 class UpdateSymptoms(Action):
     """
     This action retrieves slots from the user record and asks questions to follow-up.
@@ -603,7 +686,7 @@ class UpdateSymptoms(Action):
         events = []
 
         try:
-            for symptom in get_symptoms_by_severity(tracker.sender_id):
+            for symptom in await get_symptoms_by_severity_async(tracker.sender_id):
                 if tracker.get_slot(symptom.name) is not None:
                     if symptom.severity is not None:
                         dispatcher.utter_message(self.templates["ask_severity"].format(symptom=symptom.name,
@@ -616,6 +699,7 @@ class UpdateSymptoms(Action):
             return []
 
 
+@instrument_action
 class AddSymptom(Action):
     """
     This action retrieves slots from the user record and asks questions to follow-up.
@@ -641,6 +725,7 @@ class AddSymptom(Action):
         return []
 
 
+@instrument_action
 class CheckSymptoms(Action):
     """
     This action retrieves slots from the user record and asks questions to follow-up.
@@ -661,7 +746,7 @@ class CheckSymptoms(Action):
         events = []
 
         try:
-            for symptom in get_symptoms_by_severity(tracker.sender_id):
+            for symptom in await get_symptoms_by_severity_async(tracker.sender_id):
                 if tracker.get_slot(symptom.name) is not None:
                     if symptom.severity is not None:
                         dispatcher.utter_message(self.templates["ask_severity"].format(symptom=symptom.name,
@@ -674,6 +759,7 @@ class CheckSymptoms(Action):
             return []
 
 
+@instrument_action
 class ActionVersion(Action):
     def name(self):
         logger.info("ActionVersion self called")
@@ -703,12 +789,24 @@ class ActionVersion(Action):
         return []
 
 
+@timed
 def send_survey_response(tracker):
-    tracker.slots.pop("requested_slot")
-    res = put_survey_response(SurveyResponse(tracker.sender_id, {k: v for k, v in tracker.slots.items() if v is not None}))
+    res = put_survey_response(survey_response(tracker))
     logger.info(res.json())
 
 
+@timed
+async def send_survey_response_async(tracker):
+    """Hand the survey response to the write-behind buffer so the form can reset without waiting on the API."""
+    survey_buffer.add(survey_response(tracker))
+
+
+def survey_response(tracker) -> SurveyResponse:
+    tracker.slots.pop("requested_slot")
+    return SurveyResponse(tracker.sender_id, {k: v for k, v in tracker.slots.items() if v is not None})
+
+
+@instrument_action
 class ActionResetFull(Action):
     def name(self):
         return "action_reset_full"
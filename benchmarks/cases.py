@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Text
+
+from benchmarks.memory import record_model
+from benchmarks.suite import case
+from cora.fake_api import FakeRecordsApi
+from cora.json_codec import BACKENDS, load_codec
+from cora.metrics import Registry
+from cora.models import Symptom, UserRecord
+from cora.responses import UserRecordResponse
+from cora.utils import convert_camel_to_snake, normalize_phone_number
+
+ACTION_SERVER = ("rasa_sdk", "overrides", "requests", "aws_requests_auth", "aiohttp")
+CONNECTOR = ("rasa", "sanic", "aiohttp", "requests")
+
+
+def symptom_model(i: int) -> Dict[Text, Any]:
+    return {"name": f"Symptom {i}", "startDate": 1584818778, "endDate": 0, "severity": i % 10,
+            "description": "Follow-up Form"}
+
+
+def history(records: int) -> Dict[Text, Any]:
+    return {"userId": "2065550000", "data": [record_model(i) for i in range(records)]}
+
+
+@case("models.to_dynamo_model", {"symptoms": [0, 3, 10, 30]})
+def to_dynamo_model(symptoms: int) -> Callable[[], Any]:
+    record = UserRecord(user_id="2065550000", timestamp=1584818778, age=34, zip_code="98105",
+                        symptoms=[Symptom().load_from_model(symptom_model(i)) for i in range(symptoms)])
+    return record.to_dynamo_model
+
+
+@case("models.load_from_model", {"symptoms": [0, 3, 10, 30]})
+def load_from_model(symptoms: int) -> Callable[[], Any]:
+    model = dict(record_model(0), symptoms=[symptom_model(i) for i in range(symptoms)])
+    return lambda: UserRecord().load_from_model(model)
+
+
+@case("responses.load_most_recent", {"records": [1, 10, 100, 1000]})
+def load_most_recent(records: int) -> Callable[[], Any]:
+    model = history(records)
+    return lambda: UserRecordResponse().load_from_model(model).most_recent()
+
+
+@case("responses.load_latest_only", {"records": [1, 10, 100, 1000]})
+def load_latest_only(records: int) -> Callable[[], Any]:
+    model = history(records)
+    return lambda: UserRecordResponse().load_from_records(model["data"], latest_only=True).most_recent()
+
+
+@case("utils.normalize_phone_number")
+def normalize() -> Callable[[], Any]:
+    numbers = ["+1 (206) 555-0100", "206.555.0101", "+12065550102", "2065550103"]
+    return lambda: [normalize_phone_number(n) for n in numbers]
+
+
+@case("utils.convert_camel_to_snake")
+def camel_to_snake() -> Callable[[], Any]:
+    keys = list(record_model(0))
+    return lambda: [convert_camel_to_snake(k) for k in keys]
+
+
+@case("json.dumps", {"backend": list(BACKENDS), "records": [1, 100]})
+def json_dumps(backend: Text, records: int) -> Any:
+    codec = load_codec(backend)
+    if codec.name != backend:
+        return {"skipped": f"requires {backend}"}
+    body = history(records)
+    return lambda: codec.dumps_bytes(body)
+
+
+@case("json.loads", {"backend": list(BACKENDS), "records": [1, 100]})
+def json_loads(backend: Text, records: int) -> Any:
+    codec = load_codec(backend)
+    if codec.name != backend:
+        return {"skipped": f"requires {backend}"}
+    body = codec.dumps_bytes(history(records))
+    return lambda: codec.loads(body)
+
+
+@case("actions.followup_turn", {"records": [1, 50], "cache": [False, True]}, requires=ACTION_SERVER)
+def followup_turn(records: int, cache: bool) -> Dict[Text, Any]:
+    """A full FollowupForm turn, from required_slots to submit, against the local records API."""
+    from rasa_sdk import Tracker
+    from rasa_sdk.executor import CollectingDispatcher
+
+    from actions.actions import FollowupForm
+    from cora import api, async_api
+    from cora.cache import TTLCache
+
+    fake = FakeRecordsApi(seed_records=records)
+    url = fake.start()
+    record_cache = TTLCache(ttl=60) if cache else None
+    api._client = api.ApiClient(endpoint=url, cache=record_cache)
+    async_api._client = async_api.AsyncApiClient(endpoint=url, cache=record_cache)
+    form = FollowupForm()
+    domain: Dict[Text, Any] = {}
+    turns = 50
+
+    async def turn(user_id: Text) -> None:
+        slots = {"fever": None, "cough": None, "requested_slot": None, "severity": None, "symptom": None}
+        tracker = Tracker(user_id, slots, {}, [], False, None, {"name": form.name()}, None)
+        dispatcher = CollectingDispatcher()
+        form.required_slots(tracker)
+        form.request_next_slot(dispatcher, tracker, domain)
+        slots.update(await form.validate_fever("101", dispatcher, tracker, domain))
+        slots.update(await form.validate_cough("3", dispatcher, tracker, domain))
+        await form.submit(dispatcher, tracker, domain)
+
+    async def run_turns() -> float:
+        started = time.perf_counter()
+        for i in range(turns):
+            await turn(f"206555{i % 10:04d}")
+        elapsed = time.perf_counter() - started
+        await async_api._client.close()
+        return elapsed
+
+    try:
+        elapsed = asyncio.run(run_turns())
+    finally:
+        api._client.close()
+        api._client = async_api._client = None
+        fake.stop()
+    calls = sum(fake.stats()["requests"].values())
+    return {"ops_per_sec": turns / elapsed, "us_per_op": elapsed / turns * 1e6, "http_calls_per_turn": calls / turns}
+
+
+@case("connector.zipwhip_webhook", {"background": [True]}, requires=CONNECTOR)
+def zipwhip_webhook(background: bool) -> Dict[Text, Any]:
+    """Webhook requests per second through Sanic with Rasa and the Zipwhip API replaced by stubs."""
+    import aiohttp
+    from sanic import Sanic
+
+    from cora.connectors.zipwhip import ZipwhipConnector
+
+    class StubConnector(ZipwhipConnector):
+        async def deliver(self, recipient: Text, messages: List[Dict[Text, Any]]) -> None:
+            # Counted as sent without calling Zipwhip or pacing replies a second apart
+            for _ in messages:
+                self._record_send(200)
+
+    async def on_new_message(message: Any) -> None:
+        await message.output_channel.send_text_message(message.sender_id, f"Echo: {message.text}")
+
+    connector = StubConnector("session", background=background)
+    app = Sanic("zipwhip_benchmark")
+    app.blueprint(connector.blueprint(on_new_message), url_prefix="/webhooks/zipwhip")
+    requests, concurrency = 2000, 50
+
+    async def load() -> float:
+        server = await app.create_server(host="127.0.0.1", port=0, return_asyncio_server=True)
+        if hasattr(server, "startup"):
+            await server.startup()
+        port = server.server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/webhooks/zipwhip/webhook"
+        semaphore = asyncio.Semaphore(concurrency)
+        async with aiohttp.ClientSession() as session:
+            async def post(i: int) -> None:
+                async with semaphore:
+                    body = {"id": i, "body": "hello", "finalSource": f"+1206555{i % 500:04d}"}
+                    async with session.post(url, json=body) as response:
+                        await response.read()
+
+            started = time.perf_counter()
+            await asyncio.gather(*[post(i) for i in range(requests)])
+            elapsed = time.perf_counter() - started
+        await connector.workers.stop()
+        await connector.close()
+        server.close()
+        await server.wait_closed()
+        return elapsed
+
+    elapsed = asyncio.run(load())
+    return {"ops_per_sec": requests / elapsed, "us_per_op": elapsed / requests * 1e6, "sent": connector.sent}
+
+
+@case("metrics.counter_inc")
+def counter_inc() -> Callable[[], Any]:
+    counter = Registry().counter("bench_total", "Benchmark counter.", ["endpoint", "status"])
+    return lambda: counter.inc("GET /users", "200")
+
+
+@case("metrics.histogram_observe")
+def histogram_observe() -> Callable[[], Any]:
+    histogram = Registry().histogram("bench_seconds", "Benchmark histogram.", ["endpoint"])
+    return lambda: histogram.observe(0.042, "GET /users")
+
+
+@case("instrumentation.action_turn")
+def action_turn() -> Callable[[], Any]:
+    """Cost of instrumenting a turn, with the per-turn log line filtered out."""
+    from cora.instrumentation import instrument_action
+
+    @instrument_action
+    class Noop:
+        def name(self) -> Text:
+            return "action_noop"
+
+        def run(self, tracker: Any) -> List[Any]:
+            return []
+
+    logging.getLogger("cora.instrumentation").setLevel(logging.WARNING)
+    action = Noop()
+    return lambda: action.run(None)
@@ -0,0 +1,41 @@
+"""Encode and decode throughput of the JSON backends on /users response bodies.
+
+    python -m benchmarks.json_codec [--records 200] [--repeat 200]
+"""
+import argparse
+import timeit
+from typing import Dict, Text
+
+from benchmarks.memory import record_model
+from cora.json_codec import BACKENDS, load_codec
+
+
+def run(records: int, repeat: int) -> Dict[Text, Dict[Text, float]]:
+    body = {"userId": "2065550000", "data": [record_model(i) for i in range(records)]}
+    results = {}
+    for name in BACKENDS:
+        codec = load_codec(name)
+        if codec.name != name:
+            print(f"{name} is not installed, skipping.")
+            continue
+        encoded = codec.dumps_bytes(body)
+        results[name] = {
+            "dumps_ms": min(timeit.repeat(lambda: codec.dumps_bytes(body), number=repeat, repeat=3)) / repeat * 1e3,
+            "loads_ms": min(timeit.repeat(lambda: codec.loads(encoded), number=repeat, repeat=3)) / repeat * 1e3,
+            "bytes": len(encoded),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    for name, result in run(args.records, args.repeat).items():
+        print(f"{name:>8}: dumps {result['dumps_ms']:7.3f} ms  loads {result['loads_ms']:7.3f} ms  "
+              f"({result['bytes']} bytes, {args.records} records)")
+
+
+if __name__ == "__main__":
+    main()
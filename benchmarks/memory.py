@@ -0,0 +1,71 @@
+"""Memory held by 100k user records in each representation.
+
+    python -m benchmarks.memory [--records 100000]
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Any, Callable, Dict, List, Text
+
+from cora.history import SymptomHistory
+from cora.models import UserRecord
+
+SYMPTOMS = ["Fever", "Cough", "Shortness of breath"]
+
+
+def record_model(i: int) -> Dict[Text, Any]:
+    return {
+        "userId": f"206555{i % 10000:04d}",
+        "timestamp": 1584818778 + i,
+        "phoneNumber": f"206555{i % 10000:04d}",
+        "age": 20 + i % 60,
+        "zipCode": "98105",
+        "gender": "female",
+        "healthCondition": False,
+        "internationalTravel": False,
+        "covidContact": i % 7 == 0,
+        "symptoms": [{"name": name, "startDate": 1584818778, "endDate": 0, "severity": (i + j) % 10,
+                      "description": "Follow-up Form"} for j, name in enumerate(SYMPTOMS)],
+    }
+
+
+class DictBacked:
+    """Stand-in for the models before they had __slots__, attributes in an instance __dict__."""
+
+    def __init__(self, m: Dict[Text, Any]):
+        for k, v in m.items():
+            setattr(self, k, [DictBacked(s) for s in v] if k == "symptoms" else v)
+
+
+def measure(build: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current
+
+
+def run(records: int) -> Dict[Text, int]:
+    models: List[Dict[Text, Any]] = [record_model(i) for i in range(records)]
+    return {
+        "dict_backed": measure(lambda: [DictBacked(m) for m in models]),
+        "slotted": measure(lambda: [UserRecord().load_from_model(m) for m in models]),
+        "columnar_symptoms": measure(
+            lambda: SymptomHistory.from_records(UserRecord().load_from_model(m) for m in models)
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+    results = run(args.records)
+    for name, size in results.items():
+        print(f"{name:>20}: {size / 2 ** 20:8.1f} MiB  {size / args.records:8.0f} B/record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Run the benchmark suite, optionally saving results and comparing them with an earlier run.
+
+    python -m benchmarks.run --output after.json --compare before.json
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import cases  # noqa: F401, registers the cases
+from benchmarks.suite import compare, metadata, run
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", nargs="*", help="Name prefixes of the cases to run, e.g. models json.loads")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Slowdown counted as a regression, as a fraction of the earlier throughput")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds spent timing each case")
+    args = parser.parse_args()
+
+    results = {"meta": metadata(), "results": run(args.cases, args.min_time)}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} ({baseline['meta'].get('commit')}):")
+        regressions = compare(baseline["results"], results["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.threshold:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
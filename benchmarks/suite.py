@@ -0,0 +1,120 @@
+import datetime
+import importlib.util
+import itertools
+import platform
+import subprocess
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Text, Union
+
+from cora import json_codec
+
+Result = Dict[Text, Any]
+# A case returns the callable to time, or the metrics of a run it timed itself
+Body = Callable[..., Union[Callable[[], Any], Result]]
+
+
+class Case(NamedTuple):
+    name: Text
+    body: Body
+    params: Dict[Text, Sequence[Any]]
+    requires: Sequence[Text]
+
+
+CASES: List[Case] = []
+
+
+def case(name: Text, params: Optional[Dict[Text, Sequence[Any]]] = None, requires: Sequence[Text] = ()):
+    """Register a benchmark, run once per combination of params and skipped if a required module is missing."""
+    def register(body: Body) -> Body:
+        CASES.append(Case(name, body, params or {}, requires))
+        return body
+
+    return register
+
+
+def measure(fn: Callable[[], Any], min_time: float = 0.2, rounds: int = 5) -> Result:
+    """Best of several rounds, each calling fn often enough to run for about min_time / rounds seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / rounds:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / rounds / elapsed) + 1)
+    best = elapsed
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return {"ops_per_sec": number / best, "us_per_op": best / number * 1e6}
+
+
+def missing(modules: Iterable[Text]) -> List[Text]:
+    return [module for module in modules if importlib.util.find_spec(module) is None]
+
+
+def run(selected: Optional[Sequence[Text]] = None, min_time: float = 0.2) -> Dict[Text, Result]:
+    """
+    Run the registered cases
+
+    :param selected: Name prefixes to run, all cases when empty
+    :param min_time: Seconds spent timing each case and parameter combination
+    :return: Metrics keyed by case name and parameters, e.g. models.load_from_model[symptoms=3]
+    """
+    results = {}
+    for benchmark in CASES:
+        if selected and not any(benchmark.name.startswith(prefix) for prefix in selected):
+            continue
+        names = list(benchmark.params)
+        for values in itertools.product(*benchmark.params.values()):
+            kwargs = dict(zip(names, values))
+            key = benchmark.name + ("[" + ",".join(f"{k}={v}" for k, v in kwargs.items()) + "]" if kwargs else "")
+            absent = missing(benchmark.requires)
+            if absent:
+                results[key] = {"skipped": f"requires {', '.join(absent)}"}
+            else:
+                outcome = benchmark.body(**kwargs)
+                results[key] = outcome if isinstance(outcome, dict) else measure(outcome, min_time)
+            print(f"{key:<60} {format_result(results[key])}", flush=True)
+    return results
+
+
+def format_result(result: Result) -> Text:
+    if "skipped" in result:
+        return f"skipped, {result['skipped']}"
+    extra = "  ".join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}"
+                      for k, v in result.items() if k not in ("ops_per_sec", "us_per_op"))
+    return f"{result['ops_per_sec']:>12,.0f} ops/s {result.get('us_per_op', 0):>10.1f} us  {extra}".rstrip()
+
+
+def metadata() -> Dict[Text, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": json_codec.codec.name,
+    }
+
+
+def compare(baseline: Dict[Text, Result], current: Dict[Text, Result], threshold: float = 0.1) -> List[Text]:
+    """Print the throughput change of every case run in both, returning the ones slower by more than threshold."""
+    regressions = []
+    for key, result in current.items():
+        before = baseline.get(key, {})
+        if "ops_per_sec" not in result or "ops_per_sec" not in before:
+            continue
+        change = result["ops_per_sec"] / before["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<60} {before['ops_per_sec']:>12,.0f} -> {result['ops_per_sec']:>12,.0f} ops/s {change:+7.1%}{flag}")
+    return regressions
@@ -1,14 +1,19 @@
 import os
-import json
+import time
 import requests
-from typing import Text, Union
+from typing import Any, Dict, Optional, Text, Tuple, Union
 from aws_requests_auth.aws_auth import AWSRequestsAuth
 from requests import Response
-from cora import config
+from requests.adapters import HTTPAdapter
+from cora import config, json_codec, metrics
+from cora.cache import TTLCache
+from cora.singleflight import SingleFlight
 import logging
 
 from cora.models import UserRecord, SurveyResponse
 from cora.responses import UserRecordResponse
+from cora.streaming import STREAM_CHUNK_SIZE, ByteCount, iter_records
+from cora.utils import normalize_phone_number
 
 SIGV4_HEADERS: AWSRequestsAuth = AWSRequestsAuth(
     aws_access_key=config.aws_access_key,
@@ -24,29 +29,195 @@ logger = logging.getLogger(__name__)
 logger.info(f"api.py, aws_access_key: {config.aws_access_key}")
 logger.info(f"api.py, API_ENDPOINT: {API_ENDPOINT}")
 
+Timeout = Union[float, Tuple[float, float]]
 
-def get_user_records(user_id: Text) -> Union[Response, UserRecordResponse]:
-    response: Response = requests.get(
-        API_ENDPOINT + "/users" + "?userId={}".format(user_id), auth=SIGV4_HEADERS
-    )
-    if response.status_code == 200:
-        return UserRecordResponse().load_from_model(response.json())
-    else:
+# Bodies are encoded with json_codec rather than requests' json= so the faster backend is used when installed
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Parsed record lists keyed by normalized user id, shared by the sync and async clients
+record_cache = TTLCache(maxsize=config.record_cache_size, ttl=config.record_cache_ttl)
+
+# Asks the /users endpoint for the newest record only (Dynamo Limit=1, ScanIndexForward=false)
+LATEST_PARAMS = {"limit": 1, "sort": "desc"}
+
+
+def records_params(user_id: Text, latest_only: bool = False) -> Dict[Text, Any]:
+    """Query of a records lookup, without API_LATEST_QUERY latest-only ones fetch all records and keep the newest."""
+    params = {"userId": user_id}
+    if latest_only and config.api_latest_query:
+        params.update(LATEST_PARAMS)
+    return params
+
+
+def records_key(user_id: Text, latest_only: bool = False) -> Text:
+    key = normalize_phone_number(user_id)
+    return key + ":latest" if latest_only else key
+
+
+def cached_records(cache: Optional[TTLCache], user_id: Text, latest_only: bool) -> Optional[UserRecordResponse]:
+    if cache is None:
+        return None
+    records = cache.get(records_key(user_id, latest_only))
+    if records is None and latest_only:
+        # A cached full history answers a latest-only lookup as well
+        history = cache.get(records_key(user_id))
+        if history is not None:
+            records = history.latest()
+    return records
+
+
+def invalidate_records(cache: Optional[TTLCache], user_id: Text) -> None:
+    if cache is not None:
+        cache.invalidate(records_key(user_id))
+        cache.invalidate(records_key(user_id, latest_only=True))
+
+
+class ApiClient:
+    def __init__(
+            self,
+            endpoint: Text = API_ENDPOINT,
+            auth: AWSRequestsAuth = SIGV4_HEADERS,
+            pool_size: int = config.api_pool_size,
+            keep_alive: bool = config.api_keep_alive,
+            connect_timeout: float = config.api_connect_timeout,
+            read_timeout: float = config.api_read_timeout,
+            cache: Optional[TTLCache] = record_cache,
+    ):
+        """
+        Client for the records API that reuses pooled keep-alive connections
+
+        :param endpoint: Base URL of the API Gateway stage
+        :param auth: SigV4 signer applied to every request
+        :param pool_size: Maximum number of connections kept open per host
+        :param keep_alive: Keep connections open between calls
+        :param connect_timeout: Seconds to wait for a connection to be established
+        :param read_timeout: Seconds to wait for the server to send a response
+        :param cache: Read-through cache of user records, None to always fetch
+        """
+        self.endpoint = endpoint
+        self.auth = auth
+        self.timeout: Timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.flight = SingleFlight()
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def _request(self, method: Text, path: Text, timeout: Optional[Timeout], **kwargs: Any) -> Response:
+        """Send a request, recording its status and duration unless the body is streamed and still unread."""
+        started = time.perf_counter()
+        sent = len(kwargs.get("data") or b"")
+        try:
+            response = self.session.request(method, self.endpoint + path, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException as e:
+            metrics.observe_api_call(method, path, type(e).__name__, time.perf_counter() - started, sent)
+            raise
+        if not kwargs.get("stream"):
+            metrics.observe_api_call(
+                method, path, response.status_code, time.perf_counter() - started, sent, len(response.content)
+            )
         return response
 
+    def get_user_records(
+            self, user_id: Text, timeout: Optional[Timeout] = None, latest_only: bool = False
+    ) -> Union[Response, UserRecordResponse]:
+        """
+        Fetch a user's records
+
+        :param user_id: Normalized phone number of the user
+        :param timeout: Overrides the client's (connect, read) timeout for this call
+        :param latest_only: Only fetch and parse the most recent record
+        :return: Parsed records, or the failed response
+        """
+        records = cached_records(self.cache, user_id, latest_only)
+        if records is not None:
+            return records
+
+        # Concurrent lookups for the same user share one request and its parsed response
+        key = records_key(user_id, latest_only)
+        return self.flight.do(key, lambda: self._fetch_user_records(user_id, key, timeout, latest_only))
+
+    def _fetch_user_records(
+            self, user_id: Text, key: Text, timeout: Optional[Timeout], latest_only: bool
+    ) -> Union[Response, UserRecordResponse]:
+        params = records_params(user_id, latest_only)
+        started = time.perf_counter()
+        response = self._request("GET", "/users", timeout, params=params, stream=True)
+        if response.status_code != 200:
+            metrics.observe_api_call(
+                "GET", "/users", response.status_code, time.perf_counter() - started, 0, len(response.content)
+            )
+            return response
+        # Records are decoded as the body arrives instead of building the whole document first
+        received = ByteCount()
+        with response:
+            records = UserRecordResponse(user_id).load_from_records(
+                iter_records(received.count(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))), latest_only
+            )
+        metrics.observe_api_call("GET", "/users", 200, time.perf_counter() - started, 0, received.total)
+        if self.cache is not None:
+            self.cache.set(key, records)
+        return records
+
+    def put_user_record(self, record: UserRecord, timeout: Optional[Timeout] = None) -> Response:
+        body = json_codec.dumps_bytes(record.to_dynamo_model())
+        print(body.decode("utf-8"))
+        try:
+            return self._request("POST", "/users", timeout, data=body, headers=JSON_HEADERS)
+        finally:
+            # Callers mutate the cached record before writing it, so drop it whatever the outcome
+            invalidate_records(self.cache, record.user_id)
+
+    def patch_user_record(self, record: UserRecord, timeout: Optional[Timeout] = None) -> Response:
+        """Send only the attributes changed since the record was loaded, records built locally are put whole."""
+        if not record.tracked:
+            return self.put_user_record(record, timeout)
+        try:
+            return self._request(
+                "PATCH", "/users", timeout, data=json_codec.dumps_bytes(record.to_dynamo_delta()), headers=JSON_HEADERS
+            )
+        finally:
+            invalidate_records(self.cache, record.user_id)
+
+    def put_survey_response(self, response: SurveyResponse, timeout: Optional[Timeout] = None) -> Response:
+        body = json_codec.dumps_bytes(response.to_dynamo_model())
+        print(body.decode("utf-8"))
+        return self._request("POST", "/surveys", timeout, data=body, headers=JSON_HEADERS)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[ApiClient] = None
+
+
+def get_client() -> ApiClient:
+    """Shared client used by the module-level helpers, created on first use."""
+    global _client
+    if _client is None:
+        _client = ApiClient()
+    return _client
+
+
+def get_user_records(user_id: Text, latest_only: bool = False) -> Union[Response, UserRecordResponse]:
+    return get_client().get_user_records(user_id, latest_only=latest_only)
+
 
 def put_user_record(record: UserRecord) -> Response:
-    print(json.dumps(record.to_dynamo_model()))
-    return requests.post(
-        API_ENDPOINT + "/users", json=record.to_dynamo_model(), auth=SIGV4_HEADERS
-    )
+    return get_client().put_user_record(record)
+
+
+def patch_user_record(record: UserRecord) -> Response:
+    return get_client().patch_user_record(record)
 
 
 def put_survey_response(response: SurveyResponse) -> Response:
-    print(json.dumps(response.to_dynamo_model()))
-    return requests.post(
-        API_ENDPOINT + "/surveys", json=response.to_dynamo_model(), auth=SIGV4_HEADERS
-    )
+    return get_client().put_survey_response(response)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Text, Union
+
+import aiohttp
+import requests
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+from yarl import URL
+
+from cora import config, json_codec, metrics
+from cora.api import (
+    API_ENDPOINT, JSON_HEADERS, SIGV4_HEADERS, cached_records, invalidate_records, record_cache, records_key,
+    records_params,
+)
+from cora.cache import TTLCache
+from cora.models import UserRecord, SurveyResponse
+from cora.responses import UserRecordResponse
+from cora.singleflight import AsyncSingleFlight
+from cora.streaming import STREAM_CHUNK_SIZE, ByteCount, aiter_records
+
+logger = logging.getLogger(__name__)
+
+
+class ApiResponse:
+    """Buffered response exposing the parts of requests.Response the actions rely on."""
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self) -> Text:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json_codec.loads(self.content)
+
+
+class AsyncApiClient:
+    def __init__(
+            self,
+            endpoint: Text = API_ENDPOINT,
+            auth: AWSRequestsAuth = SIGV4_HEADERS,
+            pool_size: int = config.api_pool_size,
+            keep_alive: bool = config.api_keep_alive,
+            connect_timeout: float = config.api_connect_timeout,
+            read_timeout: float = config.api_read_timeout,
+            cache: Optional[TTLCache] = record_cache,
+    ):
+        """
+        Asyncio client for the records API
+
+        Requests are prepared and SigV4 signed exactly as the synchronous
+        client does, then sent over a pooled aiohttp session so awaiting a
+        call never blocks the event loop.
+
+        :param endpoint: Base URL of the API Gateway stage
+        :param auth: SigV4 signer applied to every request
+        :param pool_size: Maximum number of open connections
+        :param keep_alive: Keep connections open between calls
+        :param connect_timeout: Seconds to wait for a connection to be established
+        :param read_timeout: Seconds to wait for the server to send data
+        :param cache: Read-through cache of user records, None to always fetch
+        """
+        self.endpoint = endpoint
+        self.auth = auth
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.cache = cache
+        self.flight = AsyncSingleFlight()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # The session binds to the running loop, so it is created on first use
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    def _send(
+            self,
+            method: Text,
+            path: Text,
+            params: Optional[Dict[Text, Any]] = None,
+            data: Optional[bytes] = None,
+    ) -> "aiohttp.client._RequestContextManager":
+        prepared = requests.Request(
+            method,
+            self.endpoint + path,
+            params=params,
+            data=data,
+            headers=JSON_HEADERS if data is not None else None,
+        ).prepare()
+        self.auth(prepared)
+        return self.session.request(
+            prepared.method,
+            URL(prepared.url, encoded=True),
+            data=prepared.body,
+            headers=dict(prepared.headers),
+        )
+
+    async def _request(
+            self,
+            method: Text,
+            path: Text,
+            params: Optional[Dict[Text, Any]] = None,
+            body: Optional[Dict[Text, Any]] = None,
+    ) -> ApiResponse:
+        data = json_codec.dumps_bytes(body) if body is not None else None
+        sent = len(data or b"")
+        started = time.perf_counter()
+        try:
+            async with self._send(method, path, params, data) as response:
+                result = ApiResponse(response.status, await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.observe_api_call(method, path, type(e).__name__, time.perf_counter() - started, sent)
+            raise
+        metrics.observe_api_call(
+            method, path, result.status_code, time.perf_counter() - started, sent, len(result.content)
+        )
+        return result
+
+    async def get_user_records(
+            self, user_id: Text, latest_only: bool = False
+    ) -> Union[ApiResponse, UserRecordResponse]:
+        records = cached_records(self.cache, user_id, latest_only)
+        if records is not None:
+            return records
+
+        # Concurrent lookups for the same user share one request and its parsed response
+        key = records_key(user_id, latest_only)
+        return await self.flight.do(key, lambda: self._fetch_user_records(user_id, key, latest_only))
+
+    async def _fetch_user_records(
+            self, user_id: Text, key: Text, latest_only: bool
+    ) -> Union[ApiResponse, UserRecordResponse]:
+        params = records_params(user_id, latest_only)
+        started = time.perf_counter()
+        received = ByteCount()
+        try:
+            async with self._send("GET", "/users", params=params) as response:
+                if response.status != 200:
+                    failed = ApiResponse(response.status, await response.read())
+                    metrics.observe_api_call(
+                        "GET", "/users", failed.status_code, time.perf_counter() - started, 0, len(failed.content)
+                    )
+                    return failed
+                # Records are decoded as the body arrives instead of building the whole document first
+                records = UserRecordResponse(user_id, [])
+                chunks = received.acount(response.content.iter_chunked(STREAM_CHUNK_SIZE))
+                async for record in aiter_records(chunks):
+                    records.add_model(record, latest_only)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.observe_api_call(
+                "GET", "/users", type(e).__name__, time.perf_counter() - started, 0, received.total
+            )
+            raise
+        metrics.observe_api_call("GET", "/users", 200, time.perf_counter() - started, 0, received.total)
+        if self.cache is not None:
+            self.cache.set(key, records)
+        return records
+
+    async def put_user_record(self, record: UserRecord) -> ApiResponse:
+        try:
+            return await self._request("POST", "/users", body=record.to_dynamo_model())
+        finally:
+            # Callers mutate the cached record before writing it, so drop it whatever the outcome
+            invalidate_records(self.cache, record.user_id)
+
+    async def patch_user_record(self, record: UserRecord) -> ApiResponse:
+        """Send only the attributes changed since the record was loaded, records built locally are put whole."""
+        if not record.tracked:
+            return await self.put_user_record(record)
+        try:
+            return await self._request("PATCH", "/users", body=record.to_dynamo_delta())
+        finally:
+            invalidate_records(self.cache, record.user_id)
+
+    async def put_survey_response(self, response: SurveyResponse) -> ApiResponse:
+        return await self._request("POST", "/surveys", body=response.to_dynamo_model())
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+_client: Optional[AsyncApiClient] = None
+
+
+def get_client() -> AsyncApiClient:
+    """Shared async client used by the module-level helpers, created on first use."""
+    global _client
+    if _client is None:
+        _client = AsyncApiClient()
+    return _client
+
+
+async def get_user_records(user_id: Text, latest_only: bool = False) -> Union[ApiResponse, UserRecordResponse]:
+    return await get_client().get_user_records(user_id, latest_only=latest_only)
+
+
+async def put_user_record(record: UserRecord) -> ApiResponse:
+    return await get_client().put_user_record(record)
+
+
+async def patch_user_record(record: UserRecord) -> ApiResponse:
+    return await get_client().patch_user_record(record)
+
+
+async def put_survey_response(response: SurveyResponse) -> ApiResponse:
+    return await get_client().put_survey_response(response)
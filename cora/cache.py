@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Text, Tuple
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries expire a fixed number of seconds after they are set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 10.0, timer: Callable[[], float] = time.monotonic):
+        """
+        :param maxsize: Maximum number of entries, the least recently used entry is evicted first
+        :param ttl: Seconds an entry stays valid, a ttl of 0 disables caching
+        :param timer: Monotonic clock used to stamp entries
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires <= self.timer():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value under key, ttl overrides the cache wide time-to-live for this entry."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (self.timer() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > self.timer()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[Text, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
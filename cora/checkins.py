@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import sqlite3
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Text, Tuple
+
+from cora.connectors.ratelimit import backoff
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+# Text injected as a user message to start each check-in, see data/stories.md
+CHECKIN_TRIGGERS: Dict[Text, Text] = {
+    "daily_form": "/daily_event",
+    "weekly_form": "/weekly_event",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkins (
+    user_id TEXT NOT NULL,
+    checkin TEXT NOT NULL,
+    text TEXT NOT NULL,
+    due REAL NOT NULL,
+    interval REAL NOT NULL,
+    PRIMARY KEY (user_id, checkin)
+);
+"""
+
+Trigger = Callable[[Text, Text], Awaitable[Any]]
+
+
+class Checkin(NamedTuple):
+    user_id: Text
+    checkin: Text
+    text: Text
+    due: float
+    interval: float
+
+
+class CheckinScheduler:
+    """Fires recurring check-ins for many users from a min-heap ordered by next due time.
+
+    Each (user, check-in) pair has one entry. The heap may hold stale copies
+    of an entry after it was rescheduled or removed, these are skipped when
+    popped. Due times get a stable per-user offset within spread seconds so
+    check-ins scheduled for the same wall-clock time do not all fire at once.
+    A check-in whose trigger fails is retried with backoff until its next
+    period comes up, retries are kept in memory only."""
+
+    def __init__(
+            self,
+            trigger: Trigger,
+            path: Optional[Text] = None,
+            spread: float = 900,
+            max_concurrency: int = 50,
+            max_retry_delay: float = 300,
+            timer: Callable[[], float] = time.time,
+    ):
+        """
+        :param trigger: Coroutine called with (user_id, text) when a check-in is due, it may return a future
+            resolved once the check-in has actually started, lag is measured then
+        :param path: Optional SQLite file so the schedule survives restarts
+        :param spread: Seconds over which check-ins due at the same time are spread
+        :param max_concurrency: Maximum number of triggers awaited at once
+        :param max_retry_delay: Upper bound of the backoff between retries of a failed trigger
+        :param timer: Wall clock, due times are epoch seconds
+        """
+        self.trigger = trigger
+        self.spread = spread
+        self.max_concurrency = max_concurrency
+        self.max_retry_delay = max_retry_delay
+        self.timer = timer
+        self.fired = 0
+        self.failed = 0
+        self.retried = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._entries: Dict[Tuple[Text, Text], Checkin] = {}
+        self._heap: List[Tuple[float, int, Tuple[Text, Text]]] = []
+        # Failed check-ins as (retry at, counter, entry at its original due time, attempts)
+        self._retries: List[Tuple[float, int, Checkin, int]] = []
+        self._counter = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: Text) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        for row in self._db.execute("SELECT user_id, checkin, text, due, interval FROM checkins"):
+            self._push(Checkin(*row))
+        logger.info(f"Loaded {len(self._entries)} scheduled check-ins from {path}.")
+
+    def offset(self, user_id: Text, checkin: Text) -> float:
+        """Stable offset in [0, spread) seconds for a user's check-in."""
+        if self.spread <= 0:
+            return 0.0
+        return zlib.crc32(f"{user_id}:{checkin}".encode("utf-8")) % int(self.spread * 1000) / 1000
+
+    def _push(self, entry: Checkin) -> None:
+        key = (entry.user_id, entry.checkin)
+        self._entries[key] = entry
+        heapq.heappush(self._heap, (entry.due, next(self._counter), key))
+
+    def _save(self, entry: Checkin) -> None:
+        if self._db is not None:
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO checkins VALUES (?, ?, ?, ?, ?)", entry)
+
+    def schedule(
+            self,
+            user_id: Text,
+            checkin: Text,
+            start: float,
+            interval: float = DAY,
+            text: Optional[Text] = None,
+    ) -> Checkin:
+        """
+        Schedule (or reschedule) a recurring check-in for a user
+
+        :param user_id: Sender id the check-in is sent to, i.e. the phone number
+        :param checkin: Name of the check-in, e.g. daily_form
+        :param start: Epoch seconds of the first check-in, before the spread offset is added
+        :param interval: Seconds between check-ins
+        :param text: Message injected to start the check-in, defaults to CHECKIN_TRIGGERS[checkin]
+        :return: The scheduled entry
+        """
+        text = text or CHECKIN_TRIGGERS.get(checkin)
+        if text is None:
+            raise ValueError(f"No trigger text known for check-in '{checkin}'.")
+        entry = Checkin(user_id, checkin, text, start + self.offset(user_id, checkin), interval)
+        self._push(entry)
+        self._save(entry)
+        self._notify()
+        return entry
+
+    def unschedule(self, user_id: Text, checkin: Text) -> bool:
+        removed = self._entries.pop((user_id, checkin), None) is not None
+        if removed and self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM checkins WHERE user_id = ? AND checkin = ?", (user_id, checkin))
+        return removed
+
+    def _prune(self) -> None:
+        """Drop stale copies from the top of the heap, so its head is a live entry if there is one."""
+        while self._heap:
+            due, _, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry.due == due:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        self._prune()
+        due = self._heap[0][0] if self._heap else None
+        if self._retries and (due is None or self._retries[0][0] < due):
+            return self._retries[0][0]
+        return due
+
+    def retry(self, entry: Checkin, attempts: int) -> bool:
+        """
+        Fire a check-in that failed again after a backoff, unless its next period is due by then
+
+        :param entry: The check-in as popped, at its original due time
+        :param attempts: Number of failed triggers so far
+        :return: Whether a retry was scheduled
+        """
+        retry_at = self.timer() + backoff(attempts, base=1, cap=self.max_retry_delay)
+        scheduled = self._entries.get((entry.user_id, entry.checkin))
+        if scheduled is None or retry_at >= scheduled.due:
+            return False
+        heapq.heappush(self._retries, (retry_at, next(self._counter), entry, attempts))
+        self._notify()
+        return True
+
+    def pop_retries(self, now: float) -> List[Tuple[Checkin, int]]:
+        """Remove and return every retry due at or before now whose check-in is still scheduled."""
+        due = []
+        while self._retries and self._retries[0][0] <= now:
+            _, _, entry, attempts = heapq.heappop(self._retries)
+            scheduled = self._entries.get((entry.user_id, entry.checkin))
+            # Unscheduled or rescheduled since, or superseded by its next period
+            if scheduled is not None and scheduled.text == entry.text and scheduled.due > now:
+                due.append((entry, attempts))
+        return due
+
+    def pop_due(self, now: float) -> List[Checkin]:
+        """Remove and return every check-in due at or before now, rescheduling each for its next period."""
+        due = []
+        self._prune()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            entry = self._entries[key]
+            due.append(entry)
+            next_due = entry.due + entry.interval
+            if next_due <= now:
+                # Skip periods missed while the process was down instead of firing them all
+                next_due += ((now - next_due) // entry.interval + 1) * entry.interval
+            rescheduled = entry._replace(due=next_due)
+            self._push(rescheduled)
+            self._save(rescheduled)
+            self._prune()
+        return due
+
+    def _started(self, entry: Checkin) -> None:
+        lag = max(0.0, self.timer() - entry.due)
+        self.fired += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_lag = lag
+
+    async def fire(self, entries: List[Checkin], attempts: Optional[List[int]] = None) -> None:
+        """
+        Trigger due check-ins, retrying the ones that fail
+
+        :param entries: Check-ins at their due times, as returned by pop_due
+        :param attempts: Failed triggers so far for each entry, none by default
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fire_one(entry: Checkin, attempt: int) -> None:
+            async with semaphore:
+                try:
+                    started = await self.trigger(entry.user_id, entry.text)
+                except Exception as e:
+                    self.failed += 1
+                    if self.retry(entry, attempt + 1):
+                        self.retried += 1
+                        logger.warning(f"Check-in {entry.checkin} for {entry.user_id} failed, retrying: {e}")
+                    else:
+                        logger.exception(f"Check-in {entry.checkin} for {entry.user_id} failed.")
+                    return
+                if isinstance(started, asyncio.Future):
+                    started.add_done_callback(lambda _: self._started(entry))
+                else:
+                    self._started(entry)
+
+        attempts = attempts or [0] * len(entries)
+        await asyncio.gather(*[fire_one(entry, attempt) for entry, attempt in zip(entries, attempts)])
+
+    def _notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            next_due = self.next_due()
+            wait = None if next_due is None else max(0.0, next_due - self.timer())
+            if wait is None or wait > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                now = self.timer()
+                retries = self.pop_retries(now)
+                due = self.pop_due(now)
+                await self.fire(
+                    [entry for entry, _ in retries] + due,
+                    [attempts for _, attempts in retries] + [0] * len(due),
+                )
+            except Exception:
+                # Keep firing later check-ins, pausing so a persistent error does not spin the loop
+                logger.exception("Firing due check-ins failed.")
+                await asyncio.sleep(1)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[Text, Any]:
+        return {
+            "scheduled": len(self._entries),
+            "fired": self.fired,
+            "failed": self.failed,
+            "retried": self.retried,
+            "retrying": len(self._retries),
+            "avg_lag_seconds": self.total_lag / self.fired if self.fired else 0.0,
+            "max_lag_seconds": self.max_lag,
+            "last_lag_seconds": self.last_lag,
+        }
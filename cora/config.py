@@ -1,5 +1,6 @@
 import os
 import logging
+import tempfile
 
 aws_access_key = os.environ.get("AWS_ACCESS_KEY", "")
 aws_secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
@@ -9,6 +10,36 @@ aws_host = os.environ.get("AWS_HOST", "")
 aws_profile_name = os.environ.get("AWS_PROFILE_NAME", "")
 aws_api_endpoint = os.environ.get("AWS_API_ENDPOINT", "")
 
+api_pool_size = int(os.environ.get("API_POOL_SIZE", "10"))
+api_keep_alive = os.environ.get("API_KEEP_ALIVE", "true").lower() == "true"
+api_connect_timeout = float(os.environ.get("API_CONNECT_TIMEOUT", "3.05"))
+api_read_timeout = float(os.environ.get("API_READ_TIMEOUT", "10"))
+# Requires the /users endpoint to accept PATCH with a partial update, see UserRecord.to_dynamo_delta
+api_partial_updates = os.environ.get("API_PARTIAL_UPDATES", "false").lower() == "true"
+# Requires the /users endpoint to honour both limit and sort, otherwise limit=1 may return the oldest record
+api_latest_query = os.environ.get("API_LATEST_QUERY", "false").lower() == "true"
+
+record_cache_size = int(os.environ.get("RECORD_CACHE_SIZE", "1024"))
+record_cache_ttl = float(os.environ.get("RECORD_CACHE_TTL", "10"))
+
+survey_batch_size = int(os.environ.get("SURVEY_BATCH_SIZE", "25"))
+survey_flush_interval = float(os.environ.get("SURVEY_FLUSH_INTERVAL", "1"))
+survey_spill_path = os.environ.get(
+    "SURVEY_SPILL_PATH", os.path.join(tempfile.gettempdir(), "cora_survey_spill.jsonl")
+)
+
+# Overridden to point replies at a local sink when load testing, see cora.loadgen
+zipwhip_send_url = os.environ.get("ZIPWHIP_SEND_URL", "https://api.zipwhip.com/message/send")
+
+# Port the action server exposes its metrics on, 0 disables them, see cora.metrics
+metrics_port = int(os.environ.get("METRICS_PORT", "0"))
+
+# Seconds between logging the per-action report, 0 disables it, see cora.instrumentation
+action_report_interval = float(os.environ.get("ACTION_REPORT_INTERVAL", "300"))
+
+# auto uses orjson when it is installed, json forces the standard library
+json_backend = os.environ.get("JSON_BACKEND", "auto")
+
 logger = logging.getLogger(__name__)
 logger.info(f"config.py, aws_access_key: {aws_access_key}")
 logger.info(f"         aws_api_endpoint: {aws_api_endpoint}")
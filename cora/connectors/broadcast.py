@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Text
+
+from cora.connectors.packing import split_message
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[Text, Text, Optional[float]], Awaitable[int]]
+
+
+class BatchResult(NamedTuple):
+    index: int
+    recipients: List[Text]
+    status: Optional[int]
+    error: Optional[Text]
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and self.status < 400
+
+
+class BroadcastReport:
+    """Outcome of a broadcast, per batch and in total."""
+
+    def __init__(self, batches: List[BatchResult], seconds: float):
+        self.batches = batches
+        self.seconds = seconds
+
+    @property
+    def delivered(self) -> int:
+        return sum(len(b.recipients) for b in self.batches if b.ok)
+
+    @property
+    def failed(self) -> List[BatchResult]:
+        return [b for b in self.batches if not b.ok]
+
+    @property
+    def recipients_per_second(self) -> float:
+        return self.delivered / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[Text, Any]:
+        return {
+            "batches": len(self.batches),
+            "delivered": self.delivered,
+            "failed_batches": [
+                {"index": b.index, "recipients": b.recipients, "status": b.status, "error": b.error}
+                for b in self.failed
+            ],
+            "seconds": self.seconds,
+            "recipients_per_second": self.recipients_per_second,
+        }
+
+
+def make_batches(recipients: Iterable[Text], batch_size: int) -> List[List[Text]]:
+    """Split recipients into batches of at most batch_size, dropping blanks and duplicates."""
+    unique = list(dict.fromkeys(r.strip() for r in recipients if r and r.strip()))
+    return [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+
+
+async def broadcast(
+        send: Send,
+        recipients: Iterable[Text],
+        message: Text,
+        delivery_time: Optional[float] = None,
+        batch_size: int = 50,
+        concurrency: int = 4,
+        stagger: float = 0,
+) -> BroadcastReport:
+    """
+    Send one message to many recipients using Zipwhip's comma-separated contacts
+
+    :param send: Coroutine sending a message to a comma-separated contact list, e.g. ZipwhipConnector.send_async
+    :param recipients: Phone numbers to message
+    :param message: Message body, split into several sends if longer than 600 bytes
+    :param delivery_time: Pacific epoch time in milliseconds passed as scheduledDate, default sends immediately
+    :param batch_size: Number of contacts per send
+    :param concurrency: Number of batches in flight at once
+    :param stagger: Milliseconds added to the delivery time of each successive batch to spread the load
+    :return: Report with per-batch status and overall throughput
+    """
+    parts = split_message(message)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_batch(index: int, batch: List[Text]) -> BatchResult:
+        scheduled = delivery_time + index * stagger if delivery_time is not None else None
+        async with semaphore:
+            started = time.perf_counter()
+            status = None
+            try:
+                for part in parts:
+                    status = await send(",".join(batch), part, scheduled)
+                    if status >= 400:
+                        break
+                error = None
+            except Exception as e:
+                logger.exception(f"Broadcast batch {index} failed.")
+                error = repr(e)
+            return BatchResult(index, batch, status, error, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *[send_batch(index, batch) for index, batch in enumerate(make_batches(recipients, batch_size))]
+    )
+    report = BroadcastReport(list(results), time.perf_counter() - started)
+    logger.info(f"Broadcast finished: {report.as_dict()}")
+    return report
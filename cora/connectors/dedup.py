@@ -0,0 +1,93 @@
+import logging
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Optional, Text
+
+from cora.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDeduplicator:
+    """Remembers recently seen Zipwhip message ids so redelivered webhooks can be dropped."""
+
+    def __init__(
+            self,
+            maxsize: int = 10000,
+            ttl: float = 3600,
+            path: Optional[Text] = None,
+            timer: Callable[[], float] = time.time,
+    ):
+        """
+        :param maxsize: Maximum number of message ids remembered
+        :param ttl: Seconds a message id is remembered, should exceed Zipwhip's retry window
+        :param path: Optional SQLite file so seen ids survive a restart
+        :param timer: Wall clock, persisted timestamps must be comparable across processes
+        """
+        self.ttl = ttl
+        self.timer = timer
+        self.suppressed = 0
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: Text) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._prune()
+
+        now = self.timer()
+        rows = self._db.execute(
+            "SELECT key, seen_at FROM (SELECT key, seen_at FROM seen ORDER BY seen_at DESC LIMIT ?) "
+            "ORDER BY seen_at ASC",
+            (self._seen.maxsize,),
+        ).fetchall()
+        for key, seen_at in rows:
+            self._seen.set(key, True, ttl=seen_at + self.ttl - now)
+        logger.info(f"Restored {len(rows)} recently seen message ids from {path}.")
+
+    def _prune(self) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM seen WHERE seen_at <= ?", (self.timer() - self.ttl,))
+
+    @staticmethod
+    def message_key(payload: Optional[Dict[Text, Any]]) -> Optional[Text]:
+        """Identity of a webhook payload, the message id or failing that its fingerprint."""
+        if not payload:
+            return None
+        for field in ("id", "fingerprint"):
+            value = payload.get(field)
+            if value is not None:
+                return f"{field}:{value}"
+        return None
+
+    def is_duplicate(self, key: Optional[Text]) -> bool:
+        """Check whether key was already processed, counting it as suppressed if so."""
+        if key is None or self._seen.get(key) is None:
+            return False
+        self.suppressed += 1
+        return True
+
+    def mark_seen(self, key: Optional[Text]) -> None:
+        if key is None:
+            return
+        self._seen.set(key, True)
+        if self._db is not None:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO seen (key, seen_at) VALUES (?, ?)", (key, self.timer())
+                )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._prune()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[Text, int]:
+        return {"remembered": len(self._seen), "suppressed": self.suppressed}
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from itertools import groupby
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Text
+
+from cora.connectors.ratelimit import backoff
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    body TEXT NOT NULL,
+    delivery_time REAL,
+    created REAL NOT NULL,
+    leased_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_recipient ON outbox (recipient, id);
+"""
+
+
+class OutboxMessage(NamedTuple):
+    id: int
+    recipient: Text
+    body: Text
+    delivery_time: Optional[float]
+    attempts: int
+
+
+class Outbox:
+    """Crash-safe queue of outbound SMS kept in a SQLite database in WAL mode.
+
+    Claimed messages are leased rather than removed and only deleted once
+    acknowledged, so a message whose sender died is handed out again when
+    its lease runs out (at-least-once delivery). A recipient's messages are
+    claimed strictly in order: nothing is handed out while an earlier
+    message to the same recipient is leased or waiting for a retry."""
+
+    def __init__(self, path: Text, lease: float = 60, max_attempts: int = 8, timer: Callable[[], float] = time.time):
+        """
+        :param path: SQLite database file
+        :param lease: Seconds a claimed message is reserved before it is handed out again
+        :param max_attempts: Failed sends after which a message is set aside as dead
+        :param timer: Wall clock, leases must survive a restart
+        """
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.timer = timer
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def put_all(self, recipient: Text, bodies: Iterable[Text], delivery_time: Optional[float] = None) -> int:
+        """Append messages for one recipient in a single transaction, returning how many were stored."""
+        now = self.timer()
+        rows = [(recipient, body, delivery_time, now) for body in bodies if body]
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO outbox (recipient, body, delivery_time, created) VALUES (?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def claim(self, limit: int) -> List[OutboxMessage]:
+        """Lease up to limit deliverable messages, oldest first."""
+        now = self.timer()
+        with self._db:
+            rows = self._db.execute(
+                """
+                SELECT id, recipient, body, delivery_time, attempts FROM outbox m
+                WHERE dead = 0 AND leased_until <= :now AND NOT EXISTS (
+                    SELECT 1 FROM outbox e
+                    WHERE e.recipient = m.recipient AND e.id < m.id AND e.dead = 0 AND e.leased_until > :now
+                )
+                ORDER BY id LIMIT :limit
+                """,
+                {"now": now, "limit": limit},
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET leased_until = ? WHERE id = ?", [(now + self.lease, row[0]) for row in rows]
+            )
+        return [OutboxMessage(*row) for row in rows]
+
+    def ack(self, ids: Iterable[int]) -> None:
+        with self._db:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, message: OutboxMessage, delay: float) -> None:
+        """Record a failed send, holding the message (and the recipient's later ones) back for delay seconds."""
+        dead = int(message.attempts + 1 >= self.max_attempts)
+        if dead:
+            logger.error(f"Giving up on outbox message {message.id} to {message.recipient}.")
+        with self._db:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, leased_until = ?, dead = ? WHERE id = ?",
+                (self.timer() + delay, dead, message.id),
+            )
+
+    def release(self, ids: Iterable[int]) -> None:
+        """Hand claimed messages back without counting an attempt."""
+        with self._db:
+            self._db.executemany("UPDATE outbox SET leased_until = 0 WHERE id = ?", [(i,) for i in ids])
+
+    def recover(self) -> int:
+        """Release every lease, for use at startup when no sender can still be holding one."""
+        with self._db:
+            return self._db.execute("UPDATE outbox SET leased_until = 0 WHERE dead = 0 AND leased_until > 0").rowcount
+
+    def backlog(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    def dead(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class OutboxSender:
+    """Background loop draining an Outbox through an async send function.
+
+    Each recipient's claimed messages are sent by a task of their own, and
+    the loop keeps claiming while those run, so one recipient's pacing or a
+    send stuck in retries never holds up delivery to the others."""
+
+    def __init__(
+            self,
+            outbox: Outbox,
+            send: Callable[[Text, Text, Optional[float]], Awaitable[int]],
+            batch_size: int = 50,
+            poll_interval: float = 1.0,
+            delay: float = 1,
+    ):
+        """
+        :param outbox: Queue of pending messages
+        :param send: Coroutine sending one message, returning the provider status code
+        :param batch_size: Maximum number of messages claimed at once, and of recipients sent to concurrently
+        :param poll_interval: Seconds to wait for new messages when the outbox is empty
+        :param delay: Seconds between consecutive messages to the same recipient
+        """
+        self.outbox = outbox
+        self.send = send
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.delay = delay
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.started: Optional[float] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        # Recipient to the task sending its claimed messages
+        self._sending: Dict[Text, "asyncio.Task[None]"] = {}
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        recovered = self.outbox.recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} unsent outbox messages.")
+        self.started = time.perf_counter()
+        self._wake = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def notify(self) -> None:
+        """Wake the loop up after new messages were put in the outbox."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            limit = self.batch_size - len(self._sending)
+            batch = self.outbox.claim(limit) if limit > 0 else []
+            # A batch only holding messages queued behind running sends is released, and waits for them
+            if batch and self.dispatch(batch):
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def dispatch(self, batch: List[OutboxMessage]) -> List["asyncio.Task[None]"]:
+        """Start sending a claimed batch, one task per recipient sending its messages in order."""
+        self.batches += 1
+        tasks = []
+        by_recipient = groupby(sorted(batch, key=lambda m: (m.recipient, m.id)), key=lambda m: m.recipient)
+        for recipient, messages in by_recipient:
+            messages = list(messages)
+            if recipient in self._sending:
+                # Claimable once the running task is done with the messages before them
+                self.outbox.release([m.id for m in messages])
+                continue
+            task = self._sending[recipient] = asyncio.ensure_future(self._send_in_order(messages))
+            task.add_done_callback(lambda _, r=recipient: self._sent(r))
+            tasks.append(task)
+        return tasks
+
+    def _sent(self, recipient: Text) -> None:
+        del self._sending[recipient]
+        # Frees a slot, and the recipient may have had messages queued behind the ones just sent
+        self.notify()
+
+    async def drain(self, batch: List[OutboxMessage]) -> None:
+        """Send one claimed batch and wait until it is done."""
+        await asyncio.gather(*self.dispatch(batch))
+
+    async def _send_in_order(self, messages: List[OutboxMessage]) -> None:
+        for index, message in enumerate(messages):
+            if message.delivery_time is None and index > 0:
+                await asyncio.sleep(self.delay)
+            try:
+                status = await self.send(message.recipient, message.body, message.delivery_time)
+            except Exception:
+                logger.exception(f"Sending outbox message {message.id} failed.")
+                status = None
+            if status is not None and status < 400:
+                self.outbox.ack([message.id])
+                self.sent += 1
+                continue
+            self.failed += 1
+            self.outbox.retry(message, backoff(message.attempts, base=1, cap=300))
+            # Later messages to this recipient are claimed again once the failed one has gone out
+            self.outbox.release([m.id for m in messages[index + 1:]])
+            return
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            # Messages of cancelled sends stay leased and are handed out again on the next start
+            sending = list(self._sending.values())
+            for task in sending:
+                task.cancel()
+            await asyncio.gather(self._task, *sending, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[Text, float]:
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "batches": self.batches,
+            "backlog": self.outbox.backlog(),
+            "dead": self.outbox.dead(),
+            "sent_per_second": self.sent / elapsed if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,85 @@
+import re
+from typing import Any, Dict, List, Text
+
+MAX_BODY_BYTES = 600
+
+sentence_end = re.compile(r"(?<=[.!?])\s+")
+
+
+def byte_length(text: Text) -> int:
+    return len(text.encode("utf-8"))
+
+
+def split_message(text: Text, limit: int = MAX_BODY_BYTES) -> List[Text]:
+    """Split text into bodies of at most limit UTF-8 bytes, preferring sentence then word boundaries."""
+    if byte_length(text) <= limit:
+        return [text]
+
+    pieces = []
+    for sentence in sentence_end.split(text):
+        if byte_length(sentence) <= limit:
+            pieces.append(sentence)
+            continue
+        for word in sentence.split():
+            while byte_length(word) > limit:
+                # Cut on a character boundary so no multi-byte character is broken
+                cut = word.encode("utf-8")[:limit].decode("utf-8", errors="ignore")
+                pieces.append(cut)
+                word = word[len(cut):]
+            pieces.append(word)
+
+    parts = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if byte_length(candidate) <= limit:
+            current = candidate
+        else:
+            parts.append(current)
+            current = piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def is_plain_text(message: Dict[Text, Any]) -> bool:
+    return bool(message.get("text")) and set(message) <= {"recipient_id", "text"}
+
+
+def pack_messages(
+        messages: List[Dict[Text, Any]], limit: int = MAX_BODY_BYTES, separator: Text = "\n"
+) -> List[Dict[Text, Any]]:
+    """
+    Concatenate consecutive plain text replies into as few bodies of at most limit bytes as possible
+
+    Messages carrying anything besides text (images, buttons, ...) are kept as
+    they are and break the run of packed text, so the order of the
+    conversation is preserved.
+
+    :param messages: Bot replies as collected by CollectingOutputChannel
+    :param limit: Maximum body size in UTF-8 bytes
+    :param separator: Text placed between two packed replies
+    :return: Replies to send, in order
+    """
+    packed = []
+    current = None
+    for message in messages:
+        if not is_plain_text(message):
+            if current is not None:
+                packed.append(current)
+                current = None
+            packed.append(message)
+            continue
+
+        for part in split_message(message["text"], limit):
+            if current is not None:
+                candidate = current["text"] + separator + part
+                if byte_length(candidate) <= limit:
+                    current["text"] = candidate
+                    continue
+                packed.append(current)
+            current = dict(message, text=part)
+
+    if current is not None:
+        packed.append(current)
+    return packed
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Mapping, Optional, Text
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class TokenBucket:
+    """Allows rate events per second on average with bursts of up to capacity events."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, timer: Callable[[], float] = time.monotonic):
+        """
+        :param rate: Tokens added per second
+        :param capacity: Maximum number of tokens held, defaults to one second worth of tokens
+        :param timer: Monotonic clock
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.timer = timer
+        self.tokens = self.capacity
+        self.updated = timer()
+
+    def _refill(self) -> None:
+        now = self.timer()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, tokens: float = 1) -> float:
+        """Seconds until tokens are available, without consuming them.
+
+        Asking for more than capacity waits for a full bucket, consuming them
+        then leaves the bucket in debt so the average rate still holds."""
+        self._refill()
+        needed = min(tokens, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, tokens: float = 1) -> None:
+        self._refill()
+        self.tokens -= tokens
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Global token bucket combined with a token bucket per recipient.
+
+    A send is only allowed when both the global and the recipient's bucket
+    have a token, so a burst to one user cannot use up the provider limit
+    for everybody else. A send to a comma-separated contact list takes one
+    global token per contact and one token from each contact's bucket. Recipient buckets are kept in an LRU bounded by
+    max_recipients, an evicted bucket was idle long enough to refill anyway."""
+
+    def __init__(
+            self,
+            rate: float = 20,
+            burst: Optional[float] = None,
+            recipient_rate: float = 1,
+            recipient_burst: Optional[float] = 5,
+            max_recipients: int = 10000,
+            timer: Callable[[], float] = time.monotonic,
+    ):
+        self.timer = timer
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_recipients = max_recipients
+        self.bucket = TokenBucket(rate, burst, timer)
+        self.throttled = 0
+        self._recipients: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recipient_bucket(self, recipient: Hashable) -> TokenBucket:
+        bucket = self._recipients.get(recipient)
+        if bucket is None:
+            bucket = self._recipients[recipient] = TokenBucket(self.recipient_rate, self.recipient_burst, self.timer)
+            while len(self._recipients) > self.max_recipients:
+                self._recipients.popitem(last=False)
+        self._recipients.move_to_end(recipient)
+        return bucket
+
+    def try_acquire(self, recipient: Hashable) -> float:
+        """
+        Take a token from both buckets if they have one
+
+        :param recipient: Phone number the message is sent to, or a comma-separated list of them
+        :return: 0 if the send may go ahead, otherwise seconds to wait before trying again
+        """
+        contacts = recipient.split(",") if isinstance(recipient, str) else [recipient]
+        with self._lock:
+            buckets = [self._recipient_bucket(contact) for contact in contacts]
+            wait = max([self.bucket.delay(len(contacts))] + [bucket.delay() for bucket in buckets])
+            if wait == 0:
+                self.bucket.consume(len(contacts))
+                for bucket in buckets:
+                    bucket.consume()
+            else:
+                self.throttled += 1
+            return wait
+
+    async def acquire(self, recipient: Hashable) -> None:
+        wait = self.try_acquire(recipient)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire(recipient)
+
+    def acquire_sync(self, recipient: Hashable) -> None:
+        wait = self.try_acquire(recipient)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire(recipient)
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30, rand: Callable[[], float] = random.random) -> float:
+    """Full-jitter exponential backoff, a random delay up to base * 2 ** attempt capped at cap seconds."""
+    return rand() * min(cap, base * 2 ** attempt)
+
+
+def retry_after(headers: Optional[Mapping[Text, Text]]) -> Optional[float]:
+    """Seconds requested by a Retry-After header, None if absent or given as an HTTP date."""
+    if not headers:
+        return None
+    value = headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class WorkerPool:
+    """Keyed job queue drained by a fixed number of background tasks.
+
+    Jobs sharing a key (e.g. a sender's phone number) run one at a time in
+    submission order, while jobs for different keys run in parallel up to the
+    number of workers. A key is forgotten as soon as it has no queued or
+    running job, so memory stays proportional to the backlog rather than to
+    the number of distinct senders seen."""
+
+    def __init__(self, workers: int = 4, max_queue: int = 1000):
+        """
+        :param workers: Number of jobs processed concurrently
+        :param max_queue: Maximum number of jobs waiting, further submissions are rejected
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.processing_time = 0.0
+        self.max_processing_time = 0.0
+        self._pending: Dict[Hashable, Deque[Tuple[float, Job, "asyncio.Future[None]"]]] = {}
+        self._queued = 0
+        self._ready: Optional["asyncio.Queue[Hashable]"] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Start the worker tasks on the running loop, does nothing if they already run."""
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def submit(self, key: Hashable, job: Job) -> Optional["asyncio.Future[None]"]:
+        """
+        Enqueue a job behind any earlier jobs with the same key
+
+        :param key: Ordering key, jobs with equal keys never overlap
+        :param job: Zero-argument coroutine function to run in the background
+        :return: Future resolved once the job has run, None if the queue is full and the job was dropped
+        """
+        self.start()
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            return None
+
+        done = asyncio.get_event_loop().create_future()
+        jobs = self._pending.get(key)
+        if jobs is None:
+            # Only keys without a queued or running job are handed to the workers,
+            # everything else waits behind the job currently holding the key
+            jobs = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        jobs.append((time.perf_counter(), job, done))
+        self._queued += 1
+        self._idle.clear()
+        return done
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._ready.get()
+            jobs = self._pending[key]
+            enqueued, job, done = jobs.popleft()
+            self._queued -= 1
+            started = time.perf_counter()
+            try:
+                await job()
+            except Exception:
+                self.failed += 1
+                logger.exception("Background job failed.")
+            finally:
+                finished = time.perf_counter()
+                self.processed += 1
+                self.wait_time += started - enqueued
+                self.processing_time += finished - started
+                self.max_processing_time = max(self.max_processing_time, finished - started)
+                if not done.done():
+                    done.set_result(None)
+
+                if jobs:
+                    # Requeue at the back so one busy sender cannot starve the others
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    if not self._pending:
+                        self._idle.set()
+
+    async def stop(self) -> None:
+        """Wait for queued jobs to finish, then cancel the workers."""
+        if not self.running:
+            return
+        await self._idle.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[Text, Any]:
+        processed = max(self.processed, 1)
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queued,
+            "active_keys": len(self._pending),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.wait_time / processed,
+            "avg_processing_seconds": self.processing_time / processed,
+            "max_processing_seconds": self.max_processing_time,
+        }
@@ -1,11 +1,13 @@
 import asyncio
 import inspect
-import json
+import logging
+import time
 from time import sleep
 
+import aiohttp
 import requests
 from asyncio import Queue, CancelledError
-from typing import Any, Awaitable, Callable, Dict, Optional, Text, List
+from typing import Any, Awaitable, Callable, Dict, Optional, Text, List, Union
 
 from rasa.core.channels import InputChannel, UserMessage
 from rasa.core.channels.channel import QueueOutputChannel, CollectingOutputChannel, logger
@@ -13,6 +15,42 @@ from sanic import Blueprint, response
 from sanic.request import Request
 from sanic.response import HTTPResponse
 
+from cora import config, json_codec, metrics
+from cora.checkins import DAY, CheckinScheduler
+from cora.connectors.broadcast import BroadcastReport, broadcast
+from cora.connectors.dedup import MessageDeduplicator
+from cora.connectors.outbox import Outbox, OutboxSender
+from cora.connectors.packing import pack_messages
+from cora.connectors.ratelimit import RETRY_STATUSES, RateLimiter, backoff, retry_after
+from cora.connectors.workers import WorkerPool
+
+ZIPWHIP_SEND_URL = config.zipwhip_send_url
+
+
+def request_json(request: Request) -> Any:
+    """Body decoded with json_codec once per request, Sanic's request.json returns the same object afterwards."""
+    if request.parsed_json is None and request.body:
+        request.parsed_json = json_codec.loads(request.body)
+    return request.parsed_json
+
+
+def json_response(body: Any, status: int = 200) -> HTTPResponse:
+    return response.json(body, status=status, dumps=json_codec.dumps)
+
+
+def webhook_response(outcome: Text, started: float, body: Any, status: int = 200) -> HTTPResponse:
+    metrics.webhooks.inc(outcome)
+    metrics.webhook_seconds.observe(time.perf_counter() - started)
+    return json_response(body, status)
+
+
+class _RecipientLock:
+    """Lock serializing outbound sends to one recipient, with a count of tasks holding or awaiting it."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
 
 class ZipwhipConnector(InputChannel):
     """A custom http input channel.
@@ -21,13 +59,71 @@ class ZipwhipConnector(InputChannel):
     frontend. You can customize this to send messages to Rasa Core and
     retrieve responses from the agent."""
 
-    def __init__(self, session_key: Text) -> None:
+    def __init__(
+            self,
+            session_key: Text,
+            pool_size: int = 10,
+            background: bool = False,
+            workers: int = 4,
+            queue_size: int = 1000,
+            dedup_size: int = 10000,
+            dedup_ttl: float = 3600,
+            dedup_path: Optional[Text] = None,
+            rate_limit: float = 20,
+            recipient_rate_limit: float = 1,
+            recipient_burst: float = 5,
+            max_retries: int = 4,
+            send_timeout: float = 10,
+            outbox_path: Optional[Text] = None,
+            outbox_batch_size: int = 50,
+            pack: bool = False,
+            checkins_path: Optional[Text] = None,
+            checkin_spread: float = 900,
+    ) -> None:
         """
         Connector for Zipwhip SMS service
 
         :param session_key Session key from Zipwhip retrieved through /login endpoint
+        :param pool_size Maximum number of open connections to api.zipwhip.com
+        :param background Acknowledge webhooks immediately and process messages in background workers
+        :param workers Number of messages processed concurrently, each sender is handled one message at a time
+        :param queue_size Maximum number of messages waiting to be processed
+        :param dedup_size Number of recent message ids remembered to drop redelivered webhooks
+        :param dedup_ttl Seconds a message id is remembered
+        :param dedup_path Optional SQLite file keeping seen message ids across restarts
+        :param rate_limit Messages per second sent to Zipwhip across all recipients
+        :param recipient_rate_limit Messages per second sent to a single recipient
+        :param recipient_burst Messages a single recipient may receive back to back
+        :param max_retries Retries of a send throttled (429) or failed (5xx, connection error) by Zipwhip
+        :param send_timeout Seconds to wait for Zipwhip to answer a send
+        :param outbox_path Optional SQLite file, replies are then queued there and delivered by a background sender
+        :param outbox_batch_size Maximum number of queued replies the background sender claims at once
+        :param pack Concatenate consecutive text replies into as few 600 byte messages as possible
+        :param checkins_path Optional SQLite file persisting the check-in schedule
+        :param checkin_spread Seconds over which check-ins due at the same time are spread
         """
         self.session_key = session_key
+        self.pool_size = pool_size
+        self.background = background
+        self.workers = WorkerPool(workers, queue_size)
+        self.deduplicator = MessageDeduplicator(dedup_size, dedup_ttl, dedup_path)
+        self.limiter = RateLimiter(rate_limit, None, recipient_rate_limit, recipient_burst)
+        self.max_retries = max_retries
+        self.send_timeout = send_timeout
+        self.sent = 0
+        self.send_retries = 0
+        self.send_failures = 0
+        self.pack = pack
+        self.checkins = CheckinScheduler(self._trigger_checkin, checkins_path, checkin_spread)
+        self._on_new_message: Optional[Callable[[UserMessage], Awaitable[None]]] = None
+        self.sends_saved = 0
+        self.outbox: Optional[Outbox] = None
+        self.outbox_sender: Optional[OutboxSender] = None
+        if outbox_path:
+            self.outbox = Outbox(outbox_path)
+            self.outbox_sender = OutboxSender(self.outbox, self.send_async, outbox_batch_size)
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._recipient_locks: Dict[Text, _RecipientLock] = {}
         super().__init__()
 
     @classmethod
@@ -41,7 +137,24 @@ class ZipwhipConnector(InputChannel):
 
         # pytype: disable=attribute-error
         return cls(
-            credentials.get("session_token")
+            credentials.get("session_token"),
+            pool_size=int(credentials.get("pool_size", 10)),
+            background=str(credentials.get("background_processing", False)).lower() == "true",
+            workers=int(credentials.get("workers", 4)),
+            queue_size=int(credentials.get("queue_size", 1000)),
+            dedup_size=int(credentials.get("dedup_size", 10000)),
+            dedup_ttl=float(credentials.get("dedup_ttl", 3600)),
+            dedup_path=credentials.get("dedup_path"),
+            rate_limit=float(credentials.get("rate_limit", 20)),
+            recipient_rate_limit=float(credentials.get("recipient_rate_limit", 1)),
+            recipient_burst=float(credentials.get("recipient_burst", 5)),
+            max_retries=int(credentials.get("max_retries", 4)),
+            send_timeout=float(credentials.get("send_timeout", 10)),
+            outbox_path=credentials.get("outbox_path"),
+            outbox_batch_size=int(credentials.get("outbox_batch_size", 50)),
+            pack=str(credentials.get("pack_messages", False)).lower() == "true",
+            checkins_path=credentials.get("checkins_path"),
+            checkin_spread=float(credentials.get("checkin_spread", 900)),
         )
         # pytype: enable=attribute-error
 
@@ -64,14 +177,14 @@ class ZipwhipConnector(InputChannel):
         await queue.put("DONE")  # pytype: disable=bad-return-type
 
     async def _extract_sender(self, req: Request) -> Optional[Text]:
-        return req.json.get("finalSource", None)
+        return request_json(req).get("finalSource", None)
 
     # noinspection PyMethodMayBeStatic
     def _extract_message(self, req: Request) -> Optional[Text]:
-        return req.json.get("body", None)
+        return request_json(req).get("body", None)
 
     def _extract_input_channel(self, req: Request) -> Text:
-        return req.json.get("input_channel") or self.name()
+        return request_json(req).get("input_channel") or self.name()
 
     def stream_response(
         self,
@@ -94,7 +207,7 @@ class ZipwhipConnector(InputChannel):
                 if result == "DONE":
                     break
                 else:
-                    await resp.write(json.dumps(result) + "\n")
+                    await resp.write(json_codec.dumps(result) + "\n")
             await task
 
         return stream  # pytype: disable=bad-return-type
@@ -107,24 +220,237 @@ class ZipwhipConnector(InputChannel):
         :param delivery_time: Pacific epoch time in milliseconds, default sends immediately
         :return: Status code of the response
         """
+        payload = self._payload(recipient, message, delivery_time)
+        logger.debug("Sending %d characters to %s, scheduled for %s.", len(message or ""), recipient, delivery_time)
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            self.limiter.acquire_sync(recipient)
+            try:
+                resp = requests.post(
+                    ZIPWHIP_SEND_URL, data=payload, timeout=self.send_timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._record_send(type(e).__name__, started)
+                    raise
+                resp = None
+            if resp is not None and (resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries):
+                self._record_send(resp.status_code, started)
+                return resp
+            sleep(self._retry_delay(attempt, resp.headers if resp is not None else None))
+            attempt += 1
+
+    def send_all(self, recipient: Text, messages: List[Dict[Text, Any]], delivery_time: int = None, delay: int = 1):
+        for index, message in enumerate(messages):
+            if delivery_time is not None:
+                resp = self.send(recipient, message.get("text"), float(delivery_time + delay * index))
+            else:
+                sleep(delay)
+                resp = self.send(recipient, message.get("text"))
+            logger.debug("Zipwhip answered %d: %s", resp.status_code, resp.text)
+
+    def _payload(self, recipient: Text, message: Text, delivery_time: float = None) -> Dict[Text, Any]:
         payload = {
             "session": self.session_key,
             "contacts": recipient,
             "body": message,
-            "scheduledDate": delivery_time,
         }
-        print(payload)
-        return requests.post(
-            "https://api.zipwhip.com/message/send", data=payload
+        if delivery_time is not None:
+            payload["scheduledDate"] = delivery_time
+        return payload
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        # The session binds to the running loop, so it is created on first use
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._http
+
+    async def send_async(self, recipient: Text, message: Text, delivery_time: float = None) -> int:
+        """
+        Sends a (SMS) text message without blocking the event loop.
+        :param recipient: Phone number of recipient or comma-separated list for multiple recipients
+        :param message: The message to be sent, max 600 bytes
+        :param delivery_time: Pacific epoch time in milliseconds, default sends immediately
+        :return: Status code of the response
+        """
+        payload = self._payload(recipient, message, delivery_time)
+        logger.debug("Sending %d characters to %s, scheduled for %s.", len(message or ""), recipient, delivery_time)
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            await self.limiter.acquire(recipient)
+            headers = None
+            try:
+                async with self.http.post(
+                        ZIPWHIP_SEND_URL, data=payload, timeout=aiohttp.ClientTimeout(total=self.send_timeout)
+                ) as resp:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Zipwhip answered {resp.status}: {await resp.text()}")
+                    if resp.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                        self._record_send(resp.status, started)
+                        return resp.status
+                    headers = resp.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    self._record_send(type(e).__name__, started)
+                    raise
+            await asyncio.sleep(self._retry_delay(attempt, headers))
+            attempt += 1
+
+    def outbound_stats(self) -> Dict[Text, int]:
+        return {
+            "sent": self.sent,
+            "retries": self.send_retries,
+            "failures": self.send_failures,
+            "throttled": self.limiter.throttled,
+            "sends_saved": self.sends_saved,
+        }
+
+    def _retry_delay(self, attempt: int, headers: Optional[Dict[Text, Text]]) -> float:
+        self.send_retries += 1
+        delay = backoff(attempt)
+        requested = retry_after(headers)
+        return max(delay, requested) if requested is not None else delay
+
+    def _record_send(self, status: Union[int, Text], started: Optional[float] = None) -> None:
+        """Count a finished send, status is the final HTTP status or the name of the exception that ended it."""
+        if isinstance(status, int) and status < 400:
+            self.sent += 1
+        else:
+            self.send_failures += 1
+        metrics.sends.inc(str(status))
+        if started is not None:
+            metrics.send_seconds.observe(time.perf_counter() - started)
+
+    async def send_all_async(
+            self, recipient: Text, messages: List[Dict[Text, Any]], delivery_time: int = None, delay: int = 1
+    ) -> None:
+        """
+        Sends messages in order and spaced by delay seconds, without blocking other webhooks.
+
+        Concurrent calls for the same recipient queue behind each other so their
+        messages never interleave.
+        """
+        state = self._recipient_locks.get(recipient)
+        if state is None:
+            state = self._recipient_locks[recipient] = _RecipientLock()
+        state.users += 1
+        try:
+            async with state.lock:
+                for index, message in enumerate(messages):
+                    if delivery_time is not None:
+                        await self.send_async(recipient, message.get("text"), float(delivery_time + delay * index))
+                    else:
+                        await asyncio.sleep(delay)
+                        await self.send_async(recipient, message.get("text"))
+        finally:
+            state.users -= 1
+            if state.users == 0:
+                del self._recipient_locks[recipient]
+
+    async def broadcast(
+            self,
+            recipients: List[Text],
+            message: Text,
+            delivery_time: float = None,
+            batch_size: int = 50,
+            concurrency: int = 4,
+            stagger: float = 0,
+    ) -> BroadcastReport:
+        """
+        Sends one message to many contacts, batching them into comma-separated sends.
+        :param recipients: Phone numbers of the recipients
+        :param message: The message to be sent
+        :param delivery_time: Pacific epoch time in milliseconds, default sends immediately
+        :param batch_size: Number of contacts per send
+        :param concurrency: Number of batches sent at once, each send takes a rate limit token per contact
+        :param stagger: Milliseconds between the scheduled delivery of successive batches
+        :return: Per-batch success and failure with overall throughput
+        """
+        return await broadcast(
+            self.send_async, recipients, message, delivery_time, batch_size, concurrency, stagger
         )
 
-    def send_all(self, recipient: Text, messages: List[Dict[Text, Any]], delivery_time: int = None, delay: int = 1):
-        for index, message in enumerate(messages):
-            if delivery_time is not None:
-                print(self.send(recipient, message.get("text"), float(delivery_time + delay * index)).text)
-            else:
-                sleep(delay)
-                print(self.send(recipient, message.get("text")).text)
+    async def deliver(self, recipient: Text, messages: List[Dict[Text, Any]]) -> None:
+        """Send replies directly, or queue them in the outbox when one is configured."""
+        if self.pack:
+            packed = pack_messages(messages)
+            self.sends_saved += len(messages) - len(packed)
+            messages = packed
+        if self.outbox is None:
+            await self.send_all_async(recipient, messages)
+            return
+        self.outbox.put_all(recipient, [message.get("text") for message in messages])
+        self.outbox_sender.start()
+        self.outbox_sender.notify()
+
+    async def _trigger_checkin(self, user_id: Text, text: Text) -> "asyncio.Future[None]":
+        """
+        Start a scheduled check-in as if the user had sent text, in order with their own messages
+
+        :return: Future resolved once a worker picks the check-in up, for the scheduler to measure lag
+        """
+        if self._on_new_message is None:
+            raise RuntimeError("Check-ins can only fire once the webhook blueprint is registered.")
+        started = asyncio.get_event_loop().create_future()
+
+        async def job() -> None:
+            if not started.done():
+                started.set_result(None)
+            await self.handle_message(self._on_new_message, text, user_id, self.name(), None)
+
+        if self.workers.submit(user_id, job) is None:
+            raise RuntimeError(f"Worker queue full, check-in for {user_id} not queued.")
+        return started
+
+    async def close(self) -> None:
+        if self.outbox_sender is not None:
+            await self.outbox_sender.stop()
+            self.outbox.close()
+        if self._http is not None:
+            await self._http.close()
+        self.deduplicator.close()
+
+    async def handle_message(
+        self,
+        on_new_message: Callable[[UserMessage], Awaitable[None]],
+        text: Text,
+        sender_id: Text,
+        input_channel: Text,
+        metadata: Optional[Dict[Text, Any]],
+    ) -> None:
+        """Run a message through Rasa and send the collected replies back to the sender."""
+        collector = CollectingOutputChannel()
+        started = time.perf_counter()
+        outcome = "ok"
+        # noinspection PyBroadException
+        try:
+            await on_new_message(
+                UserMessage(
+                    text,
+                    collector,
+                    sender_id,
+                    input_channel=input_channel,
+                    metadata=metadata,
+                )
+            )
+        except CancelledError:
+            outcome = "timeout"
+            logger.error(
+                "Message handling timed out for "
+                "user message '{}'.".format(text)
+            )
+        except Exception:
+            outcome = "error"
+            logger.exception(
+                "An exception occured while handling "
+                "user message '{}'.".format(text)
+            )
+        metrics.message_seconds.observe(time.perf_counter() - started, outcome)
+
+        await self.deliver(sender_id, collector.messages)
 
     def blueprint(
         self, on_new_message: Callable[[UserMessage], Awaitable[None]]
@@ -133,11 +459,78 @@ class ZipwhipConnector(InputChannel):
             "custom_webhook_{}".format(type(self).__name__),
             inspect.getmodule(self).__name__,
         )
+        self._on_new_message = on_new_message
+        metrics.registry.register_stats("cora_workers", self.workers.stats)
+        metrics.registry.register_stats("cora_dedup", self.deduplicator.stats)
+        metrics.registry.register_stats("cora_outbound", self.outbound_stats)
+        metrics.registry.register_stats(
+            "cora_outbox", lambda: self.outbox_sender.stats() if self.outbox_sender is not None else None
+        )
+        metrics.registry.register_stats("cora_checkins", self.checkins.stats)
+
+        @custom_webhook.listener("after_server_start")
+        async def start_outbox(app: Any, loop: Any) -> None:
+            # Picks up replies left unsent by a previous process straight away
+            if self.outbox_sender is not None:
+                self.outbox_sender.start()
+            self.checkins.start()
+
+        @custom_webhook.listener("before_server_stop")
+        async def drain_workers(app: Any, loop: Any) -> None:
+            await self.checkins.stop()
+            await self.workers.stop()
+
+        @custom_webhook.listener("after_server_stop")
+        async def close_http(app: Any, loop: Any) -> None:
+            await self.close()
 
         # noinspection PyUnusedLocal
         @custom_webhook.route("/", methods=["GET"])
         async def health(request: Request) -> HTTPResponse:
-            return response.json({"status": "ok"})
+            return json_response(
+                {
+                    "status": "ok",
+                    "workers": self.workers.stats(),
+                    "dedup": self.deduplicator.stats(),
+                    "outbound": self.outbound_stats(),
+                    "outbox": self.outbox_sender.stats() if self.outbox_sender is not None else None,
+                    "checkins": self.checkins.stats(),
+                }
+            )
+
+        # noinspection PyUnusedLocal
+        @custom_webhook.route("/metrics", methods=["GET"])
+        async def metrics_endpoint(request: Request) -> HTTPResponse:
+            """Counters, latency histograms and component stats in the Prometheus text format."""
+            return response.text(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+        @custom_webhook.route("/checkins", methods=["POST"])
+        async def schedule_checkin(request: Request) -> HTTPResponse:
+            """
+            Schedule a recurring check-in for a user
+
+            :param request: {"user_id": "+12063996756", "checkin": "daily_form", "start": 1585000000,
+                             "interval": 86400, "text": "/daily_event"}, interval and text are optional
+            :return: The scheduled check-in with its spread due time
+            """
+            body = request_json(request) or {}
+            try:
+                entry = self.checkins.schedule(
+                    body["user_id"],
+                    body["checkin"],
+                    float(body["start"]),
+                    float(body.get("interval", DAY)),
+                    body.get("text"),
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                return json_response({"error": str(e)}, status=400)
+            return json_response(entry._asdict())
+
+        @custom_webhook.route("/checkins", methods=["DELETE"])
+        async def unschedule_checkin(request: Request) -> HTTPResponse:
+            body = request_json(request) or {}
+            removed = self.checkins.unschedule(body.get("user_id"), body.get("checkin"))
+            return json_response({"removed": removed})
 
         @custom_webhook.route("/webhook", methods=["POST"])
         async def receive(request: Request) -> HTTPResponse:
@@ -172,6 +565,12 @@ class ZipwhipConnector(InputChannel):
             }
             :return: HTTP response to return to Zipwhip
             """
+            started = time.perf_counter()
+            message_key = self.deduplicator.message_key(request_json(request))
+            if self.deduplicator.is_duplicate(message_key):
+                logger.info(f"Dropping redelivered message {message_key}.")
+                return webhook_response("duplicate", started, "Success.")
+
             sender_id = await self._extract_sender(request)
             text = self._extract_message(request)
             print(text)
@@ -179,30 +578,23 @@ class ZipwhipConnector(InputChannel):
             input_channel = self._extract_input_channel(request)
             metadata = self.get_metadata(request)
 
-            collector = CollectingOutputChannel()
-            # noinspection PyBroadException
-            try:
-                await on_new_message(
-                    UserMessage(
-                        text,
-                        collector,
-                        sender_id,
-                        input_channel=input_channel,
-                        metadata=metadata,
-                    )
-                )
-            except CancelledError:
-                logger.error(
-                    "Message handling timed out for "
-                    "user message '{}'.".format(text)
-                )
-            except Exception:
-                logger.exception(
-                    "An exception occured while handling "
-                    "user message '{}'.".format(text)
-                )
+            if self.background and (sender_id is None or text is None):
+                return webhook_response("invalid", started, "Missing finalSource or body.", status=400)
 
-            self.send_all(sender_id, collector.messages)
-            return response.json("Success.")
+            # Messages from one sender are handled strictly in arrival order so
+            # concurrent webhooks cannot interleave turns of the same form
+            done = self.workers.submit(
+                sender_id,
+                lambda: self.handle_message(on_new_message, text, sender_id, input_channel, metadata)
+            )
+            if done is None:
+                # Zipwhip retries failed deliveries, so shed load instead of holding the request open
+                logger.warning(f"Worker queue full, rejecting message from {sender_id}.")
+                return webhook_response("busy", started, "Busy.", status=503)
+            # Only accepted messages are remembered, a rejected one must be processed when Zipwhip retries
+            self.deduplicator.mark_seen(message_key)
+            if not self.background:
+                await done
+            return webhook_response("accepted", started, "Success.")
 
         return custom_webhook
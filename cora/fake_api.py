@@ -0,0 +1,234 @@
+"""Local stand-in for the records API, for load testing without AWS.
+
+    python -m cora.fake_api --port 8088 --latency 0.05 --error-rate 0.01 --seed-records 50
+    AWS_API_ENDPOINT=http://localhost:8088 rasa run actions
+"""
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from cora import json_codec
+
+logger = logging.getLogger(__name__)
+
+SYMPTOMS = ["Fever", "Cough", "Shortness of breath"]
+
+path_token = re.compile(r"(\w+)|\[(\d+)\]")
+
+Result = Tuple[int, Any]
+
+
+def synthetic_record(user_id: Text, index: int, padding: int = 0) -> Dict[Text, Any]:
+    """A plausible stored record, the index-th newest of a user's history."""
+    record = {
+        "userId": user_id,
+        "timestamp": int(time.time()) - index * 86400,
+        "phoneNumber": user_id,
+        "age": 20 + index % 60,
+        "zipCode": "98105",
+        "gender": "female",
+        "symptoms": [{"name": name, "startDate": 1584818778, "endDate": 0, "severity": (index + j) % 10,
+                      "description": "Follow-up Form"} for j, name in enumerate(SYMPTOMS)],
+    }
+    if padding:
+        record["notes"] = "x" * padding
+    return record
+
+
+def apply_path(item: Dict[Text, Any], path: Text, value: Any) -> None:
+    """Assign value at a Dynamo document path such as "age" or "symptoms[2].severity"."""
+    tokens = [name or int(index) for name, index in path_token.findall(path)]
+    target = item
+    for token in tokens[:-1]:
+        target = target[token]
+    target[tokens[-1]] = value
+
+
+class FakeRecordsApi:
+    """In-memory /users and /surveys endpoints with injected latency, errors and payload sizes.
+
+    Requests are accepted whatever their signature. Records are keyed by
+    (userId, timestamp) as in DynamoDB, so posting a record with an existing
+    timestamp replaces it. Users that have no records get seed_records
+    synthetic ones the first time they are read."""
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            error_status: int = 503,
+            seed_records: int = 0,
+            padding: int = 0,
+            rand: Callable[[], float] = random.random,
+    ):
+        """
+        :param latency: Seconds added to every response
+        :param jitter: Up to this many seconds added at random on top of latency
+        :param error_rate: Fraction of requests answered with error_status instead
+        :param error_status: Status code of injected errors
+        :param seed_records: Records generated for users without any
+        :param padding: Characters of filler added to each generated record
+        :param rand: Random number generator in [0, 1)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed_records = seed_records
+        self.padding = padding
+        self.rand = rand
+        self.users: Dict[Text, Dict[int, Dict[Text, Any]]] = {}
+        self.surveys: List[Dict[Text, Any]] = []
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def delay(self) -> float:
+        return self.latency + self.jitter * self.rand()
+
+    def handle(self, method: Text, path: Text, query: Dict[Text, Text], body: Any) -> Result:
+        """Answer one request, without the injected latency."""
+        with self._lock:
+            self.requests[f"{method} {path}"] += 1
+        if self.error_rate and self.rand() < self.error_rate:
+            return self.error_status, {"message": "Injected error"}
+        route = {
+            ("GET", "/users"): self.get_users,
+            ("POST", "/users"): self.post_user,
+            ("PATCH", "/users"): self.patch_user,
+            ("POST", "/surveys"): self.post_survey,
+            ("GET", "/_stats"): lambda q, b: (200, self.stats()),
+        }.get((method, path))
+        if route is None:
+            return 404, {"message": f"No route for {method} {path}"}
+        try:
+            return route(query, body)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return 400, {"message": repr(e)}
+
+    def _records(self, user_id: Text, seed: bool = False) -> Dict[int, Dict[Text, Any]]:
+        """A user's records, generating seed_records of them on a read of a user that has none."""
+        records = self.users.get(user_id)
+        if records is None:
+            generated = [synthetic_record(user_id, i, self.padding) for i in range(self.seed_records if seed else 0)]
+            records = self.users[user_id] = {r["timestamp"]: r for r in generated}
+        return records
+
+    def get_users(self, query: Dict[Text, Text], body: Any) -> Result:
+        user_id = query["userId"]
+        with self._lock:
+            records = sorted(self._records(user_id, seed=True).values(), key=lambda r: r["timestamp"],
+                             reverse=query.get("sort") == "desc")
+        if "limit" in query:
+            records = records[:int(query["limit"])]
+        return 200, {"userId": user_id, "data": records}
+
+    def post_user(self, query: Dict[Text, Text], body: Any) -> Result:
+        with self._lock:
+            self._records(body["userId"])[int(body["timestamp"])] = body
+        return 200, body
+
+    def patch_user(self, query: Dict[Text, Text], body: Any) -> Result:
+        with self._lock:
+            item = self.users.get(body["userId"], {}).get(int(body["timestamp"]))
+            if item is None:
+                return 404, {"message": "No such record"}
+            for path, value in body["set"].items():
+                apply_path(item, path, value)
+        return 200, item
+
+    def post_survey(self, query: Dict[Text, Text], body: Any) -> Result:
+        with self._lock:
+            self.surveys.append(body)
+        return 200, body
+
+    def stats(self) -> Dict[Text, Any]:
+        return {
+            "requests": dict(self.requests),
+            "users": len(self.users),
+            "records": sum(len(records) for records in self.users.values()),
+            "surveys": len(self.surveys),
+        }
+
+    def start(self, host: Text = "127.0.0.1", port: int = 0) -> Text:
+        """Serve on a background thread, returning the base URL, port 0 picks a free one."""
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self) -> Text:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so the clients' connection pools are exercised as against API Gateway
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self) -> None:
+        api: FakeRecordsApi = self.server.api
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        delay = api.delay()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            body = json_codec.loads(data) if data else None
+        except ValueError as e:
+            status, payload = 400, {"message": repr(e)}
+        else:
+            status, payload = api.handle(self.command, url.path, query, body)
+        data = json_codec.dumps_bytes(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = _respond
+
+    def log_message(self, format: Text, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed-records", type=int, default=0, help="Records generated per unknown user")
+    parser.add_argument("--padding", type=int, default=0, help="Filler characters per generated record")
+    args = parser.parse_args()
+    api = FakeRecordsApi(args.latency, args.jitter, args.error_rate, args.error_status, args.seed_records,
+                         args.padding)
+    print(f"Serving the fake records API on {api.start(args.host, args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
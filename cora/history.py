@@ -0,0 +1,81 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Text, Tuple
+
+from cora.models import Symptom, UserRecord, dynamo_value
+
+
+class StringTable:
+    """Interns the few distinct strings of a column, storing each once and referring to it by index."""
+
+    __slots__ = ("values", "index")
+
+    def __init__(self):
+        self.values: List[Optional[Text]] = []
+        self.index: Dict[Optional[Text], int] = {}
+
+    def add(self, value: Optional[Text]) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+class SymptomHistory:
+    """A user's symptom reports across records, stored column-wise in typed arrays.
+
+    Each row is one symptom of one record. Integers are kept as the Dynamo
+    model stores them, so a missing date or severity reads back as 0, and
+    names and descriptions are interned, making a row a few dozen bytes
+    instead of a Symptom object with its attribute values."""
+
+    __slots__ = ("timestamps", "names", "start_dates", "end_dates", "severities", "descriptions", "strings")
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.names = array("I")
+        self.start_dates = array("q")
+        self.end_dates = array("q")
+        self.severities = array("h")
+        self.descriptions = array("I")
+        self.strings = StringTable()
+
+    @classmethod
+    def from_records(cls, records: Iterable[UserRecord]) -> "SymptomHistory":
+        history = cls()
+        for record in sorted(records, key=lambda r: r.timestamp or 0):
+            history.add_record(record)
+        return history
+
+    def add_record(self, record: UserRecord) -> None:
+        for symptom in record.symptoms:
+            self.append(record.timestamp, symptom)
+
+    def append(self, timestamp: Optional[int], symptom: Symptom) -> None:
+        self.timestamps.append(dynamo_value("timestamp", timestamp))
+        self.names.append(self.strings.add(symptom.name))
+        self.start_dates.append(dynamo_value("start_date", symptom.start_date))
+        self.end_dates.append(dynamo_value("end_date", symptom.end_date))
+        self.severities.append(dynamo_value("severity", symptom.severity))
+        self.descriptions.append(self.strings.add(symptom.description))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def symptom(self, row: int) -> Symptom:
+        return Symptom(
+            self.strings.values[self.names[row]],
+            self.start_dates[row],
+            self.end_dates[row],
+            self.severities[row],
+            self.strings.values[self.descriptions[row]],
+        )
+
+    def __iter__(self) -> Iterator[Tuple[int, Symptom]]:
+        for row in range(len(self)):
+            yield self.timestamps[row], self.symptom(row)
+
+    def severities_of(self, name: Text) -> List[Tuple[int, int]]:
+        """(timestamp, severity) of every report of a symptom, matched case-insensitively, in record order."""
+        wanted = {i for i, value in enumerate(self.strings.values) if value and value.lower() == name.lower()}
+        return [(self.timestamps[row], self.severities[row]) for row in range(len(self)) if self.names[row] in wanted]
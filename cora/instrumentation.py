@@ -0,0 +1,249 @@
+"""Wall time, records API calls and bytes transferred per action turn.
+
+Classes decorated with instrument_action have their run, validate,
+validate_<slot>, required_slots, request_next_slot and submit methods timed.
+The first instrumented call of a turn (normally run, called by the action
+server) opens it, calls nested in it are timed as part of it, and when it
+returns the turn is added to the per-action report and logged as one line:
+
+    {"event": "action_turn", "action": "followup_form", "sender_id": "2065550100", "seconds": 0.0123,
+     "api_calls": 2, "api_seconds": 0.0101, "bytes_sent": 412, "bytes_received": 1893, "error": false,
+     "methods": {"run": {"calls": 1, "seconds": 0.0123}, "validate_fever": {"calls": 1, "seconds": 0.0061}}}
+
+Method times are inclusive, run covers the validate and submit calls it makes.
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Tuple, TypeVar
+
+from cora import config, json_codec
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Methods rasa_sdk calls on actions and forms, validate_<slot> methods are found per class
+ACTION_METHODS = ("run", "validate", "required_slots", "request_next_slot", "submit")
+
+_turn: "ContextVar[Optional[Turn]]" = ContextVar("cora_action_turn", default=None)
+
+
+class Turn:
+    """Measurements of one action invocation, shared by the tasks it starts."""
+
+    __slots__ = ("action", "sender_id", "api_calls", "api_seconds", "bytes_sent", "bytes_received", "methods")
+
+    def __init__(self, action: Text, sender_id: Optional[Text] = None):
+        self.action = action
+        self.sender_id = sender_id
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Method name to [calls, seconds]
+        self.methods: Dict[Text, List[float]] = {}
+
+    def add_method(self, name: Text, seconds: float) -> None:
+        timing = self.methods.get(name)
+        if timing is None:
+            self.methods[name] = [1, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+
+    def to_dict(self, seconds: float, error: bool = False) -> Dict[Text, Any]:
+        return {
+            "event": "action_turn",
+            "action": self.action,
+            "sender_id": self.sender_id,
+            "seconds": round(seconds, 6),
+            "api_calls": self.api_calls,
+            "api_seconds": round(self.api_seconds, 6),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "error": error,
+            "methods": {name: {"calls": calls, "seconds": round(total, 6)}
+                        for name, (calls, total) in self.methods.items()},
+        }
+
+
+def current_turn() -> Optional[Turn]:
+    return _turn.get()
+
+
+def record_api_call(seconds: float, sent: int = 0, received: int = 0) -> None:
+    """Count a records API call towards the turn in progress, if any."""
+    turn = _turn.get()
+    if turn is not None:
+        turn.api_calls += 1
+        turn.api_seconds += seconds
+        turn.bytes_sent += sent
+        turn.bytes_received += received
+
+
+class ActionReport:
+    """Totals per action across turns, logged every interval seconds."""
+
+    def __init__(self, interval: float = 0, timer: Callable[[], float] = time.monotonic):
+        """
+        :param interval: Seconds between logging the report, 0 to only build it on request
+        :param timer: Clock the interval is measured with
+        """
+        self.interval = interval
+        self.timer = timer
+        self.actions: Dict[Text, Dict[Text, Any]] = {}
+        self._last_logged = timer()
+        self._lock = threading.Lock()
+
+    def add(self, turn: Turn, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            totals = self.actions.get(turn.action)
+            if totals is None:
+                totals = self.actions[turn.action] = {
+                    "turns": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "api_calls": 0,
+                    "api_seconds": 0.0, "bytes_sent": 0, "bytes_received": 0, "methods": {},
+                }
+            totals["turns"] += 1
+            totals["errors"] += error
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["api_calls"] += turn.api_calls
+            totals["api_seconds"] += turn.api_seconds
+            totals["bytes_sent"] += turn.bytes_sent
+            totals["bytes_received"] += turn.bytes_received
+            methods = totals["methods"]
+            for name, (calls, total) in turn.methods.items():
+                timing = methods.setdefault(name, [0, 0.0])
+                timing[0] += calls
+                timing[1] += total
+        if self.interval and self.timer() - self._last_logged >= self.interval:
+            self._last_logged = self.timer()
+            logger.info("Action report\n" + self.format())
+
+    def stats(self) -> Dict[Text, Dict[Text, Any]]:
+        """Totals and per-turn averages of every action, slowest in total first."""
+        with self._lock:
+            actions = {name: dict(totals, methods=dict(totals["methods"])) for name, totals in self.actions.items()}
+        for totals in actions.values():
+            turns = totals["turns"]
+            totals["avg_seconds"] = totals["seconds"] / turns
+            totals["api_calls_per_turn"] = totals["api_calls"] / turns
+            totals["bytes_per_turn"] = (totals["bytes_sent"] + totals["bytes_received"]) / turns
+            totals["methods"] = {name: {"calls": calls, "seconds": total}
+                                 for name, (calls, total) in totals["methods"].items()}
+        return dict(sorted(actions.items(), key=lambda item: -item[1]["seconds"]))
+
+    def format(self) -> Text:
+        lines = [f"{'action':<28} {'turns':>7} {'avg ms':>9} {'max ms':>9} {'calls/turn':>10} "
+                 f"{'api ms/turn':>11} {'bytes/turn':>10} {'errors':>6}"]
+        for name, totals in self.stats().items():
+            lines.append(
+                f"{name:<28} {totals['turns']:>7} {totals['avg_seconds'] * 1e3:>9.2f} "
+                f"{totals['max_seconds'] * 1e3:>9.2f} {totals['api_calls_per_turn']:>10.2f} "
+                f"{totals['api_seconds'] / totals['turns'] * 1e3:>11.2f} {totals['bytes_per_turn']:>10.0f} "
+                f"{totals['errors']:>6}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.actions.clear()
+
+
+report = ActionReport(config.action_report_interval)
+
+
+def _sender_id(args: Sequence[Any]) -> Optional[Text]:
+    # The tracker is among the arguments of every instrumented method
+    for arg in args:
+        sender_id = getattr(arg, "sender_id", None)
+        if sender_id is not None:
+            return sender_id
+    return None
+
+
+def _enter(action: Optional[Text], args: Sequence[Any]) -> Tuple[Optional[Turn], Any]:
+    turn = _turn.get()
+    if turn is not None or action is None:
+        return turn, None
+    turn = Turn(action, _sender_id(args))
+    return turn, _turn.set(turn)
+
+
+def _exit(turn: Optional[Turn], token: Any, method: Text, started: float, error: bool) -> None:
+    if turn is None:
+        return
+    seconds = time.perf_counter() - started
+    turn.add_method(method, seconds)
+    if token is not None:
+        _turn.reset(token)
+        report.add(turn, seconds, error)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json_codec.dumps(turn.to_dict(seconds, error)))
+
+
+def _wrap(fn: Callable[..., Any], method: Text, action: Optional[Text]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            turn, token = _enter(action, args)
+            started = time.perf_counter()
+            error = True
+            try:
+                result = await fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                _exit(turn, token, method, started, error)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            turn, token = _enter(action, args)
+            started = time.perf_counter()
+            error = True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                _exit(turn, token, method, started, error)
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def timed(fn: Callable[..., T]) -> Callable[..., T]:
+    """Time a helper as a method of the turn calling it, calls outside of a turn are not recorded."""
+    return _wrap(fn, fn.__name__, None)
+
+
+def action_name(cls: type) -> Text:
+    try:
+        # name() returns a constant in every action, so it does not need an instance
+        return cls.name(None)
+    except Exception:
+        return cls.__name__
+
+
+def instrument_action(cls: T) -> T:
+    """Class decorator timing the methods rasa_sdk calls on an Action or FormAction, inherited ones included."""
+    action = action_name(cls)
+    names = list(ACTION_METHODS) + sorted(name for name in dir(cls) if name.startswith("validate_"))
+    for name in names:
+        attribute = inspect.getattr_static(cls, name, None)
+        if isinstance(attribute, staticmethod):
+            fn, rewrap = attribute.__func__, staticmethod
+        elif isinstance(attribute, classmethod):
+            fn, rewrap = attribute.__func__, classmethod
+        elif inspect.isfunction(attribute):
+            fn, rewrap = attribute, None
+        else:
+            continue
+        if getattr(fn, "__instrumented__", False):
+            continue
+        wrapped = _wrap(fn, name, action)
+        setattr(cls, name, rewrap(wrapped) if rewrap is not None else wrapped)
+    return cls
@@ -0,0 +1,91 @@
+import json
+import logging
+from typing import Any, Text, Union
+
+from cora import config
+
+logger = logging.getLogger(__name__)
+
+Data = Union[bytes, bytearray, memoryview, Text]
+
+
+class JsonCodec:
+    """Encodes and decodes the JSON bodies exchanged with the records API and Zipwhip."""
+
+    name = "json"
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode("utf-8")
+
+    def dumps(self, obj: Any) -> Text:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(self, data: Data) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson backed codec, values orjson cannot encode (e.g. integers beyond 64 bits) go through the stdlib."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._options = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        try:
+            return self._orjson.dumps(obj, option=self._options)
+        except TypeError:
+            return super().dumps(obj).encode("utf-8")
+
+    def dumps(self, obj: Any) -> Text:
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, data: Data) -> Any:
+        return self._orjson.loads(data)
+
+
+BACKENDS = {"json": JsonCodec, "orjson": OrjsonCodec}
+
+
+def load_codec(name: Text = "auto") -> JsonCodec:
+    """
+    Create the codec for a backend
+
+    :param name: json, orjson or auto to use orjson when it is installed
+    :return: The codec, the stdlib one if orjson was asked for but is missing
+    """
+    if name == "auto":
+        name = "orjson"
+    elif name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend '{name}', expected one of {', '.join(BACKENDS)} or auto.")
+    try:
+        return BACKENDS[name]()
+    except ImportError:
+        logger.info(f"JSON backend {name} is not installed, using the standard library.")
+        return JsonCodec()
+
+
+codec = load_codec(config.json_backend)
+
+
+def set_codec(new_codec: JsonCodec) -> None:
+    global codec
+    codec = new_codec
+
+
+def dumps(obj: Any) -> Text:
+    return codec.dumps(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    return codec.dumps_bytes(obj)
+
+
+def loads(data: Data) -> Any:
+    return codec.loads(data)
@@ -0,0 +1,401 @@
+"""Synthetic SMS conversations driving the Zipwhip webhook at a target rate.
+
+Start the sink first so the server's replies are captured instead of sent:
+
+    python -m cora.loadgen --rate 50 --duration 60 --users 2000 --sink-port 8089
+    ZIPWHIP_SEND_URL=http://127.0.0.1:8089/message/send rasa run --credentials credentials.yml
+
+Raise the connector's rate_limit and recipient_rate_limit in credentials.yml,
+otherwise reply latency measures the Zipwhip rate limits.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Text
+from urllib.parse import parse_qs
+
+from cora import json_codec
+
+logger = logging.getLogger(__name__)
+
+STORIES_PATH = "data/stories.md"
+WEBHOOK_URL = "http://localhost:5005/webhooks/zipwhip/webhook"
+DESTINATION = "+12068163958"
+
+SCALE = "scale"
+TEXT = "text"
+
+# Slots each form asks for, in order, see the required_slots of the forms in actions/actions.py
+FORM_SLOTS: Dict[Text, List[Text]] = {
+    "daily_form": [SCALE, SCALE, SCALE, SCALE],
+    "short_response_form": [TEXT, TEXT],
+    "weekly_form": [TEXT, TEXT, TEXT],
+    "questionnaire_form": [SCALE, TEXT, TEXT, SCALE],
+    "triage_form": [TEXT, SCALE, TEXT],
+    "followup_form": [SCALE, SCALE],
+}
+
+SHORT_RESPONSES = [
+    "Talking to my family on the phone",
+    "Going for a walk in the park",
+    "The news about the virus",
+    "Not knowing when I can go back to work",
+    "Cooking dinner with my roommates",
+    "Maybe I could call a friend every day",
+    "I don't have much free time",
+    "I will try to plan ahead",
+]
+
+story_heading = re.compile(r"^##\s*(.+)$")
+story_intent = re.compile(r"^\*\s*(\w+)")
+story_form = re.compile(r'^-\s*form\{"name":\s*"(\w+)"\}')
+
+
+class Story(NamedTuple):
+    name: Text
+    intent: Text
+    forms: List[Text]
+
+
+def parse_stories(path: Text = STORIES_PATH) -> List[Story]:
+    """Paths of the Markdown stories, each as the intent starting it and the forms it runs through."""
+    stories = []
+    name = intent = None
+    forms: List[Text] = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            heading = story_heading.match(line)
+            if heading:
+                if intent:
+                    stories.append(Story(name, intent, forms))
+                name, intent, forms = heading.group(1).strip(), None, []
+                continue
+            if intent is None:
+                match = story_intent.match(line)
+                intent = match.group(1) if match else None
+                continue
+            form = story_form.match(line)
+            if form:
+                forms.append(form.group(1))
+    if intent:
+        stories.append(Story(name, intent, forms))
+    return stories
+
+
+def script(story: Story, rand: random.Random) -> List[Text]:
+    """The messages a texter sends along a story: the triggering intent, then an answer per form slot."""
+    messages = [f"/{story.intent}"]
+    for form in story.forms:
+        for kind in FORM_SLOTS.get(form, []):
+            messages.append(str(rand.randint(1, 10)) if kind == SCALE else rand.choice(SHORT_RESPONSES))
+    return messages
+
+
+def zipwhip_payload(message_id: int, sender: Text, body: Text, destination: Text = DESTINATION) -> Dict[Text, Any]:
+    """A message receive webhook as Zipwhip sends it, see ZipwhipConnector.blueprint."""
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    return {
+        "body": body,
+        "bodySize": len(body),
+        "address": f"ptn:/{sender}",
+        "finalSource": sender,
+        "finalDestination": destination,
+        "fingerprint": str(1514465037 + message_id),
+        "id": message_id,
+        "contactId": 14543967707 + int(sender.lstrip("+")) % 100000,
+        "deviceId": 377265507,
+        "messageType": "MO",
+        "cc": None,
+        "bcc": None,
+        "visible": True,
+        "read": False,
+        "scheduledDate": None,
+        "dateDeleted": None,
+        "messageTransport": 5,
+        "dateDelivered": None,
+        "hasAttachment": False,
+        "dateCreated": now,
+        "deleted": False,
+        "dateRead": None,
+        "statusCode": 4,
+    }
+
+
+def arrivals(rate: float, duration: float, rand: random.Random) -> Iterator[float]:
+    """Offsets in seconds of a Poisson process with the given rate, independent of how the server responds."""
+    t = rand.expovariate(rate)
+    while t < duration:
+        yield t
+        t += rand.expovariate(rate)
+
+
+def percentiles(values: Sequence[float], ps: Sequence[float] = (50, 90, 99)) -> Dict[Text, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {f"p{p:g}": ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)] for p in ps}
+    summary.update({"mean": sum(ordered) / len(ordered), "max": ordered[-1]})
+    return summary
+
+
+class Conversation:
+    """One simulated texter working through a story."""
+
+    def __init__(self, sender: Text, messages: List[Text]):
+        self.sender = sender
+        self.messages = messages
+        self.position = 0
+        self.in_flight = False
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.messages)
+
+    def next_message(self) -> Text:
+        message = self.messages[self.position]
+        self.position += 1
+        return message
+
+
+class ReplySink:
+    """Local stand-in for Zipwhip's message/send, matching each reply to the oldest unanswered message.
+
+    Reply latency is the time from posting a webhook to the first send back
+    to its sender. Sends to a sender with no unanswered message are counted
+    as follow-up replies only."""
+
+    def __init__(self, timer: Callable[[], float] = time.perf_counter):
+        self.timer = timer
+        self.replies = 0
+        self.latencies: List[float] = []
+        self._pending: Dict[Text, Deque[float]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def expect(self, sender: Text, sent: float) -> None:
+        with self._lock:
+            self._pending[sender].append(sent)
+
+    def record(self, contacts: Text) -> None:
+        now = self.timer()
+        with self._lock:
+            for contact in contacts.split(","):
+                self.replies += 1
+                pending = self._pending.get(contact)
+                if pending:
+                    self.latencies.append(now - pending.popleft())
+
+    def unanswered(self) -> int:
+        with self._lock:
+            return sum(len(pending) for pending in self._pending.values())
+
+    def start(self, host: Text = "127.0.0.1", port: int = 0) -> Text:
+        self._server = ThreadingHTTPServer((host, port), _SinkHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/message/send"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self.server.sink.record(form.get("contacts", [""])[0])
+        data = json_codec.dumps_bytes({"success": True, "response": {}})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: Text, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+class LoadGenerator:
+    """Posts the messages of many concurrent conversations at Poisson arrival times.
+
+    Every arrival is the next message of a conversation without a request in
+    flight. A new conversation starts only when every active one is waiting
+    on a request and fewer than users are active, finished ones are replaced.
+    When all users are busy the arrival is counted as dropped, a sender never
+    has two messages in flight. Requests are fired without waiting for earlier
+    ones to complete (open loop), so a slow server shows up as latency rather
+    than as a lower offered rate."""
+
+    def __init__(
+            self,
+            url: Text,
+            stories: List[Story],
+            rate: float,
+            duration: float,
+            users: int = 1000,
+            sink: Optional[ReplySink] = None,
+            seed: Optional[int] = None,
+    ):
+        """
+        :param url: Webhook URL of the Zipwhip connector
+        :param stories: Paths conversations follow, picked at random
+        :param rate: Messages per second offered
+        :param duration: Seconds to offer load for
+        :param users: Maximum number of concurrent conversations, each from a distinct number
+        :param sink: Captures replies to measure reply latency, None to measure acknowledgements only
+        :param seed: Seed for reproducible arrivals and conversations
+        """
+        self.url = url
+        self.stories = stories
+        self.rate = rate
+        self.duration = duration
+        self.users = users
+        self.sink = sink
+        self.rand = random.Random(seed)
+        self.conversations: List[Conversation] = []
+        self.started_conversations = 0
+        self.ack_latencies: List[float] = []
+        self.statuses: Dict[Text, int] = defaultdict(int)
+        self.max_lag = 0.0
+        self.dropped = 0
+        self._message_id = 1195453017123205120
+
+    def _new_conversation(self) -> Conversation:
+        sender = f"+1{2065550000 + self.started_conversations % 10000000}"
+        self.started_conversations += 1
+        return Conversation(sender, script(self.rand.choice(self.stories), self.rand))
+
+    def pick(self) -> Optional[Conversation]:
+        """The conversation sending the next message, marked in flight, or None when all users are busy."""
+        self.conversations = [c for c in self.conversations if not c.finished]
+        idle = [c for c in self.conversations if not c.in_flight]
+        if idle:
+            conversation = self.rand.choice(idle)
+        elif len(self.conversations) < self.users:
+            conversation = self._new_conversation()
+            self.conversations.append(conversation)
+        else:
+            return None
+        # Marked here rather than when the request starts, arrivals that are late run back to back
+        conversation.in_flight = True
+        return conversation
+
+    async def _post(self, session: Any, conversation: Conversation) -> None:
+        self._message_id += 1
+        payload = zipwhip_payload(self._message_id, conversation.sender, conversation.next_message())
+        started = time.perf_counter()
+        if self.sink is not None:
+            self.sink.expect(conversation.sender, started)
+        try:
+            async with session.post(self.url, data=json_codec.dumps_bytes(payload),
+                                    headers={"Content-Type": "application/json"}) as response:
+                await response.read()
+                self.statuses[str(response.status)] += 1
+                self.ack_latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            self.statuses[type(e).__name__] += 1
+        finally:
+            conversation.in_flight = False
+
+    async def run(self, drain: float = 10) -> Dict[Text, Any]:
+        """
+        Offer the load, then wait up to drain seconds for outstanding replies
+
+        :return: Report with throughput, status counts and latency percentiles in milliseconds
+        """
+        import aiohttp
+
+        loop = asyncio.get_event_loop()
+        tasks = []
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = loop.time()
+            for offset in arrivals(self.rate, self.duration, self.rand):
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                conversation = self.pick()
+                if conversation is None:
+                    self.dropped += 1
+                    continue
+                tasks.append(asyncio.ensure_future(self._post(session, conversation)))
+            offered = loop.time() - start
+            await asyncio.gather(*tasks)
+            elapsed = loop.time() - start
+        deadline = loop.time() + drain
+        while self.sink is not None and self.sink.unanswered() and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        return self.report(len(tasks), offered, elapsed)
+
+    def report(self, sent: int, offered: float, elapsed: float) -> Dict[Text, Any]:
+        report = {
+            "messages": sent,
+            "dropped": self.dropped,
+            "conversations": self.started_conversations,
+            "offered_rate": (sent + self.dropped) / offered if offered > 0 else 0.0,
+            "completed_rate": len(self.ack_latencies) / elapsed if elapsed > 0 else 0.0,
+            "statuses": dict(self.statuses),
+            "max_schedule_lag_ms": self.max_lag * 1e3,
+            "ack_latency_ms": {k: v * 1e3 for k, v in percentiles(self.ack_latencies).items()},
+        }
+        if self.sink is not None:
+            report.update({
+                "replies": self.sink.replies,
+                "unanswered": self.sink.unanswered(),
+                "reply_latency_ms": {k: v * 1e3 for k, v in percentiles(self.sink.latencies).items()},
+            })
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=WEBHOOK_URL, help="Webhook URL of the Zipwhip connector")
+    parser.add_argument("--rate", type=float, default=10, help="Messages per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to offer load for")
+    parser.add_argument("--users", type=int, default=1000, help="Concurrent conversations")
+    parser.add_argument("--stories", default=STORIES_PATH)
+    parser.add_argument("--paths", help="Comma-separated story names to follow, all stories by default")
+    parser.add_argument("--sink-port", type=int, help="Capture replies on this port, set ZIPWHIP_SEND_URL to it")
+    parser.add_argument("--drain", type=float, default=10, help="Seconds to wait for replies after the load")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    stories = parse_stories(args.stories)
+    if args.paths:
+        names = {name.strip() for name in args.paths.split(",")}
+        stories = [story for story in stories if story.name in names]
+    if not stories:
+        parser.error("No stories to follow.")
+    sink = None
+    if args.sink_port is not None:
+        sink = ReplySink()
+        print(f"Capturing replies on {sink.start(port=args.sink_port)}")
+    generator = LoadGenerator(args.url, stories, args.rate, args.duration, args.users, sink, args.seed)
+    try:
+        report = asyncio.get_event_loop().run_until_complete(generator.run(args.drain))
+    finally:
+        if sink is not None:
+            sink.stop()
+    print(json_codec.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Counters and histograms rendered in the Prometheus text format.
+
+Each thread updates its own shard of a metric without taking a lock and
+scrapes sum the shards, so recording costs a dict update on the hot path.
+Sanic and the action server run one event loop thread per process, with
+several workers each process is scraped on its own.
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Text, Tuple
+
+from cora import instrumentation
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cached lookup up to a request running into its timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Text, ...]
+
+
+def _escape(value: Any) -> Text:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[Text], values: Sequence[Any]) -> Text:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> Text:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """Per-thread dicts of values keyed by label values, only ever written by their own thread."""
+
+    kind = ""
+
+    def __init__(self, name: Text, documentation: Text, labels: Sequence[Text] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[Dict[Labels, Any]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict[Labels, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # Only taken once per thread, shards of finished threads keep counting towards the totals
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> List[Dict[Labels, Any]]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy holds the GIL throughout, so a shard is never read half updated
+        return [shard.copy() for shard in shards]
+
+    def header(self) -> List[Text]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *values: Text, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[values] = shard.get(values, 0) + amount
+
+    def collect(self) -> Dict[Labels, float]:
+        totals: Dict[Labels, float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[Text]:
+        lines = self.header()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: Text,
+            documentation: Text,
+            labels: Sequence[Text] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *values: Text) -> None:
+        shard = self._shard()
+        # Counts per bucket (the last one above every bound), then the sum of observations
+        state = shard.get(values)
+        if state is None:
+            state = shard[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        totals: Dict[Labels, List[float]] = {}
+        for shard in self._snapshots():
+            for key, state in shard.items():
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = list(state)
+                else:
+                    for i, value in enumerate(state):
+                        total[i] += value
+        return totals
+
+    def render(self) -> List[Text]:
+        lines = self.header()
+        names = self.labels + ("le",)
+        for key, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics of a process, plus gauges read from components' stats() when scraped."""
+
+    def __init__(self):
+        self._metrics: Dict[Text, _Sharded] = {}
+        self._stats: Dict[Text, Callable[[], Optional[Dict[Text, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Sharded) -> Any:
+        with self._lock:
+            # Modules may be reloaded, the first registration keeps its values
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: Text, documentation: Text, labels: Sequence[Text] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(
+            self,
+            name: Text,
+            documentation: Text,
+            labels: Sequence[Text] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def register_stats(self, prefix: Text, stats: Callable[[], Optional[Dict[Text, Any]]]) -> None:
+        """
+        Export the numeric values of a stats() dict as gauges
+
+        :param prefix: Metric name prefix, e.g. cora_workers gives cora_workers_queue_depth
+        :param stats: Called on every scrape, replaces the function registered under the same prefix
+        """
+        with self._lock:
+            self._stats[prefix] = stats
+
+    def unregister_stats(self, prefix: Text) -> None:
+        with self._lock:
+            self._stats.pop(prefix, None)
+
+    def render(self) -> Text:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats = list(self._stats.items())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, fn in stats:
+            try:
+                values = fn() or {}
+            except Exception:
+                logger.exception(f"Reading stats for {prefix} failed.")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+webhooks = registry.counter("cora_webhooks_total", "Zipwhip webhooks received by outcome.", ["outcome"])
+webhook_seconds = registry.histogram("cora_webhook_seconds", "Time to answer a Zipwhip webhook.")
+message_seconds = registry.histogram(
+    "cora_message_seconds", "Time Rasa spent handling a message (on_new_message).", ["outcome"]
+)
+sends = registry.counter("cora_sends_total", "Messages sent through Zipwhip by final status.", ["status"])
+send_seconds = registry.histogram("cora_send_seconds", "Time to send a message including retries.")
+api_calls = registry.counter(
+    "cora_api_calls_total", "Records API calls by endpoint and status.", ["endpoint", "status"]
+)
+api_seconds = registry.histogram("cora_api_seconds", "Records API call duration by endpoint.", ["endpoint"])
+
+
+def observe_api_call(
+        method: Text, path: Text, status: Any, seconds: float, sent: int = 0, received: int = 0
+) -> None:
+    """
+    Record a records API call, also counted towards the action turn making it
+
+    :param status: HTTP status code, or the name of the exception raised
+    :param sent: Bytes of request body
+    :param received: Bytes of response body
+    """
+    endpoint = f"{method} {path}"
+    api_calls.inc(endpoint, str(status))
+    api_seconds.observe(seconds, endpoint)
+    instrumentation.record_api_call(seconds, sent, received)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        data = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: Text, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+def start_http_server(port: int, host: Text = "0.0.0.0", metrics: Registry = registry) -> ThreadingHTTPServer:
+    """Serve the metrics on a background thread, for processes without a Sanic app of ours such as the action server."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.registry = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{server.server_address[1]}")
+    return server
@@ -1,22 +1,91 @@
 from typing import Any, Dict, List, Optional, Text
 
-from cora.utils import convert_model_to_snake_case, unix_epoch
+from cora.serialization import INT, LIST, Field, Schema
+from cora.utils import unix_epoch
+
+def load_symptom(m: Dict[Text, Any]) -> "Symptom":
+    return Symptom().load_from_model(m)
+
+
+SYMPTOM_SCHEMA = Schema([Field("name", "name"),
+                         Field("start_date", "startDate", INT),
+                         Field("end_date", "endDate", INT),
+                         Field("severity", "severity", INT),
+                         Field("description", "description")])
+
+USER_RECORD_SCHEMA = Schema([Field("user_id", "userId"),
+                             Field("timestamp", "timestamp", INT),
+                             Field("phone_number", "phoneNumber"),
+                             Field("age", "age", INT),
+                             Field("zip_code", "zipCode"),
+                             Field("dob", "dob", INT),
+                             Field("gender", "gender"),
+                             Field("health_condition", "healthCondition"),
+                             Field("international_travel", "internationalTravel"),
+                             Field("covid_contact", "covidContact"),
+                             Field("symptoms", "symptoms", LIST, load_symptom)])
+
+SURVEY_RESPONSE_SCHEMA = Schema([Field("user_id", "userId"),
+                                 Field("date", "date"),
+                                 Field("answers", "answers")])
+
+# Attribute names in the Dynamo model, used to build partial updates
+SYMPTOM_FIELDS = SYMPTOM_SCHEMA.keys
+
+USER_RECORD_FIELDS = {name: key for name, key in USER_RECORD_SCHEMA.keys.items() if name != "symptoms"}
+
+INT_FIELDS = SYMPTOM_SCHEMA.int_fields | USER_RECORD_SCHEMA.int_fields
+
+
+def dynamo_value(name: Text, value: Any) -> Any:
+    return int(0 if value is None else value) if name in INT_FIELDS else value
+
+
+class ChangeTracking:
+    """Records which attributes are assigned once an object is marked clean, i.e. after it was loaded.
+
+    Subclasses must set _dirty to None before any other attribute. A clean
+    object holds an empty tuple, the set of names is only created on the
+    first assignment so loaded objects that are never changed stay small."""
+
+    __slots__ = ("_dirty",)
+
+    def __setattr__(self, name: Text, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if not name.startswith("_") and self._dirty is not None:
+            if self._dirty:
+                self._dirty.add(name)
+            else:
+                object.__setattr__(self, "_dirty", {name})
+
+    def mark_clean(self) -> None:
+        object.__setattr__(self, "_dirty", ())
+
+    @property
+    def tracked(self) -> bool:
+        return self._dirty is not None
+
+    def is_dirty(self) -> bool:
+        """Objects that were never loaded count as entirely dirty."""
+        return self._dirty is None or bool(self._dirty)
 
 
 class SurveyResponse:
+    __slots__ = tuple(SURVEY_RESPONSE_SCHEMA.keys)
+
     def __init__(self, user_id: Text, answers: Dict[Text, Any], date: float = None):
         self.user_id = user_id
         self.answers = answers
         self.date = date if date is not None else unix_epoch()
 
     def to_dynamo_model(self) -> Dict[Text, Any]:
-        model = {"userId": self.user_id,
-                 "date": self.date,
-                 "answers": self.answers}
-        return {k: v for k, v in model.items() if v is not None and v != ""}
+        return SURVEY_RESPONSE_SCHEMA.encode(self)
+
 
+class Symptom(ChangeTracking):
+    # Fixed attributes, keys of a loaded model outside SYMPTOM_FIELDS are kept in extra
+    __slots__ = tuple(SYMPTOM_FIELDS) + ("extra",)
 
-class Symptom:
     def __init__(
             self,
             name: Optional[Text] = None,
@@ -25,6 +94,8 @@ class Symptom:
             severity: Optional[int] = None,
             description: Optional[Text] = None,
     ):
+        self._dirty = None
+        self.extra: Optional[Dict[Text, Any]] = None
         self.name = name
         self.start_date = start_date
         self.end_date = end_date
@@ -32,22 +103,24 @@ class Symptom:
         self.description = description
 
     def to_dynamo_model(self) -> Dict[Text, Any]:
-        model = {"name": self.name,
-                 "startDate": int(0 if self.start_date is None else self.start_date),
-                 "endDate": int(0 if self.end_date is None else self.end_date),
-                 "severity": int(0 if self.severity is None else self.severity),
-                 "description": self.description
-                 }
-
-        return {k: v for k, v in model.items() if v is not None and v != ""}
+        return SYMPTOM_SCHEMA.encode(self)
 
     def load_from_model(self, m: Dict[Text, Any]):
-        for k, v in convert_model_to_snake_case(m).items():
-            setattr(self, k, v)
+        SYMPTOM_SCHEMA.decode(self, m)
+        self.mark_clean()
         return self
 
+    def to_dynamo_changes(self, prefix: Text = "") -> Dict[Text, Any]:
+        """Changed attributes keyed by their Dynamo document path, all of them if the symptom was never loaded."""
+        if not self.tracked:
+            return {prefix.rstrip("."): self.to_dynamo_model()}
+        return {prefix + SYMPTOM_FIELDS[name]: dynamo_value(name, getattr(self, name))
+                for name in self._dirty if name in SYMPTOM_FIELDS}
+
+
+class UserRecord(ChangeTracking):
+    __slots__ = tuple(USER_RECORD_SCHEMA.keys) + ("extra", "_loaded_symptoms")
 
-class UserRecord:
     def __init__(
             self,
             user_id: Optional[Text] = None,
@@ -62,6 +135,9 @@ class UserRecord:
             covid_contact: Optional[bool] = None,
             symptoms: Optional[List[Symptom]] = None,
     ):
+        self._dirty = None
+        self._loaded_symptoms = 0
+        self.extra: Optional[Dict[Text, Any]] = None
         self.user_id = user_id
         self.timestamp = timestamp
         self.phone_number = phone_number
@@ -78,28 +154,44 @@ class UserRecord:
             self.symptoms = []
 
     def to_dynamo_model(self) -> Dict[Text, Any]:
-        model = {"userId": self.user_id,
-                 "timestamp": int(0 if self.timestamp is None else self.timestamp),
-                 "phoneNumber": self.phone_number,
-                 "age": int(0 if self.age is None else self.age),
-                 "zipCode": self.zip_code,
-                 "dob": int(0 if self.dob is None else self.dob),
-                 "gender": self.gender,
-                 "healthCondition": self.health_condition,
-                 "internationalTravel": self.international_travel,
-                 "covidContact": self.covid_contact,
-                 "symptoms": [symptom.to_dynamo_model() for symptom in self.symptoms]
-                 }
-
-        return {k: v for k, v in model.items() if v is not None and v != ""}
+        return USER_RECORD_SCHEMA.encode(self)
 
     def load_from_model(self, m: Dict[Text, Any]):
-        for k, v in convert_model_to_snake_case(m).items():
-            if k == "symptoms":
-                v = [Symptom().load_from_model(symptom) for symptom in v]
-            setattr(self, k, v)
+        USER_RECORD_SCHEMA.decode(self, m)
+        self.mark_clean()
         return self
 
+    def mark_clean(self) -> None:
+        super().mark_clean()
+        for symptom in self.symptoms:
+            symptom.mark_clean()
+        self._loaded_symptoms = len(self.symptoms)
+
+    def to_dynamo_delta(self) -> Dict[Text, Any]:
+        """
+        Partial update carrying only what changed since the record was loaded
+
+        Changes are keyed by Dynamo document path, e.g. "age" or "symptoms[2].severity",
+        so they map directly onto a SET update expression for the item identified
+        by userId and timestamp. If symptoms were added or removed the whole
+        list is sent instead.
+
+        :return: {"userId": ..., "timestamp": ..., "set": {path: value}}
+        """
+        if not self.tracked:
+            raise ValueError("Only loaded records can be diffed, use to_dynamo_model instead.")
+        changes = {USER_RECORD_FIELDS[name]: dynamo_value(name, getattr(self, name))
+                   for name in self._dirty if name in USER_RECORD_FIELDS and name not in ("user_id", "timestamp")}
+        if len(self.symptoms) != self._loaded_symptoms:
+            changes["symptoms"] = [symptom.to_dynamo_model() for symptom in self.symptoms]
+        else:
+            for index, symptom in enumerate(self.symptoms):
+                if symptom.is_dirty():
+                    changes.update(symptom.to_dynamo_changes(f"symptoms[{index}]."))
+        return {"userId": self.user_id,
+                "timestamp": dynamo_value("timestamp", self.timestamp),
+                "set": changes}
+
     def most_severe_symptom(self) -> Symptom:
         return max(self.symptoms, key=lambda s: s.severity)
 
@@ -1,24 +1,60 @@
-from typing import Any, Dict, List, Optional, Text
+from typing import Any, Dict, Iterable, List, Optional, Text
 import logging
 
+from cora.history import SymptomHistory
 from cora.models import UserRecord
-from cora.utils import convert_model_to_snake_case
+from cora.serialization import LIST, Field, Schema
 
 logger = logging.getLogger(__name__)
 
 
+def load_record(m: Dict[Text, Any]) -> UserRecord:
+    return UserRecord().load_from_model(m)
+
+
+RESPONSE_SCHEMA = Schema([Field("user_id", "userId"),
+                          Field("data", "data", LIST, load_record)])
+
+
 class UserRecordResponse:
+    __slots__ = tuple(RESPONSE_SCHEMA.keys) + ("extra",)
+
     def __init__(self, user_id: Text = None, data: List[UserRecord] = None):
         self.user_id: Optional[Text] = user_id
         self.data: Optional[List[UserRecord]] = data
+        self.extra: Optional[Dict[Text, Any]] = None
 
     def load_from_model(self, m: Dict[Text, Any]):
-        for k, v in convert_model_to_snake_case(m).items():
-            if k == "data":
-                v = [UserRecord().load_from_model(record) for record in v]
-            setattr(self, k, v)
+        RESPONSE_SCHEMA.decode(self, m)
         return self
 
+    def to_dynamo_model(self) -> Dict[Text, Any]:
+        return RESPONSE_SCHEMA.encode(self)
+
+    def load_from_records(self, records: Iterable[Dict[Text, Any]], latest_only: bool = False):
+        """Build the response from raw records as they are decoded, see cora.streaming."""
+        self.data = []
+        for record in records:
+            self.add_model(record, latest_only)
+        return self
+
+    def add_model(self, m: Dict[Text, Any], latest_only: bool = False) -> None:
+        """Add one raw record, with latest_only it replaces the record held only if it is newer."""
+        if self.data is None:
+            self.data = []
+        if not latest_only:
+            self.data.append(UserRecord().load_from_model(m))
+        elif not self.data or (m.get("timestamp") or 0) > (self.data[0].timestamp or 0):
+            self.data = [UserRecord().load_from_model(m)]
+
+    def symptom_history(self) -> SymptomHistory:
+        """All symptoms reported across the records, in a compact columnar form."""
+        return SymptomHistory.from_records(self.data or [])
+
+    def latest(self) -> "UserRecordResponse":
+        """Response holding only the most recent record."""
+        return UserRecordResponse(self.user_id, [self.most_recent()] if self.data else [])
+
     def most_recent(self) -> UserRecord:
         logger.debug(f"most_recent")
         if len(self.data) != 0:
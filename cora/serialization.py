@@ -0,0 +1,87 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Text
+
+from cora.utils import convert_camel_to_snake
+
+# How a field is written to the Dynamo model
+VALUE = "value"  # as is, left out when None or ""
+INT = "int"  # as an int, None written as 0
+LIST = "list"  # list of nested models, each written with its to_dynamo_model
+
+
+class Field(NamedTuple):
+    name: Text
+    key: Text
+    kind: Text = VALUE
+    load: Optional[Callable[[Dict[Text, Any]], Any]] = None
+
+
+class Schema:
+    """Converts between a model class and its camelCase Dynamo model.
+
+    The encode and decode functions are generated and compiled once, when the
+    schema is created, with the attribute names and keys spelled out, so no
+    case conversion happens per record. Keys outside the schema are matched
+    through their snake_case form and, if still unknown, kept in the
+    object's extra dict."""
+
+    def __init__(self, fields: List[Field]):
+        for field in fields:
+            if not field.name.isidentifier():
+                raise ValueError(f"Field name '{field.name}' is not an identifier.")
+        self.fields = fields
+        self.by_name: Dict[Text, Field] = {field.name: field for field in fields}
+        # Attribute name to model key, e.g. start_date -> startDate
+        self.keys: Dict[Text, Text] = {field.name: field.key for field in fields}
+        self.int_fields = {field.name for field in fields if field.kind == INT}
+        self.encode: Callable[[Any], Dict[Text, Any]] = self._compile_encoder()
+        self.decode: Callable[[Any, Dict[Text, Any]], Any] = self._compile_decoder()
+
+    def _compile(self, name: Text, lines: List[Text]) -> Callable:
+        namespace = {"set_": object.__setattr__, "load_extra": self.load_extra}
+        namespace.update({f"load_{field.name}": field.load for field in self.fields if field.load is not None})
+        exec(compile("\n".join(lines), f"<{name} {', '.join(self.keys)}>", "exec"), namespace)
+        return namespace[name]
+
+    def _compile_encoder(self) -> Callable[[Any], Dict[Text, Any]]:
+        lines = ["def encode(obj):", "    model = {}"]
+        for field in self.fields:
+            lines.append(f"    v = obj.{field.name}")
+            if field.kind == INT:
+                lines.append(f"    model[{field.key!r}] = int(0 if v is None else v)")
+            elif field.kind == LIST:
+                lines.append(f"    model[{field.key!r}] = [item.to_dynamo_model() for item in v]")
+            else:
+                lines.append('    if v is not None and v != "":')
+                lines.append(f"        model[{field.key!r}] = v")
+        lines.append("    return model")
+        return self._compile("encode", lines)
+
+    def _compile_decoder(self) -> Callable[[Any, Dict[Text, Any]], Any]:
+        lines = ["def decode(obj, m):", "    found = 0"]
+        for field in self.fields:
+            value = f"m[{field.key!r}]"
+            if field.kind == LIST:
+                value = f"[load_{field.name}(item) for item in {value}]"
+            lines.append(f"    if {field.key!r} in m:")
+            lines.append(f"        set_(obj, {field.name!r}, {value})")
+            lines.append("        found += 1")
+        lines.append("    if found != len(m):")
+        lines.append("        load_extra(obj, m)")
+        lines.append("    return obj")
+        return self._compile("decode", lines)
+
+    def load_extra(self, obj: Any, m: Dict[Text, Any]) -> None:
+        """Set the keys the generated decoder did not recognize, e.g. snake_case ones."""
+        known = set(self.keys.values())
+        for k, v in m.items():
+            if k in known:
+                continue
+            field = self.by_name.get(convert_camel_to_snake(k))
+            if field is None:
+                if obj.extra is None:
+                    obj.extra = {}
+                obj.extra[convert_camel_to_snake(k)] = v
+                continue
+            if field.kind == LIST:
+                v = [field.load(item) for item in v]
+            object.__setattr__(obj, field.name, v)
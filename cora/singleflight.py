@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Text, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key onto a single execution shared by every caller."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Run fn, or wait for the call already running under key and share its outcome
+
+        :param key: Identity of the call, e.g. the normalized user id
+        :param fn: Zero-argument callable performing the work
+        :return: Result of the single execution, its exception is raised to every caller
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self) -> Dict[Text, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+
+class AsyncSingleFlight:
+    """Asyncio counterpart of SingleFlight, callers await one shared task per key."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[Text, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
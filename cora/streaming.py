@@ -0,0 +1,185 @@
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Text, Union
+
+from cora.models import UserRecord
+
+# Bytes read from the response body at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+Chunk = Union[bytes, Text]
+
+SEEK, VALUE, ITEMS, DONE = range(4)
+
+
+class ArrayFieldParser:
+    """Push parser returning the elements of one array field of a JSON object as they complete.
+
+    Everything up to the element being decoded is dropped from the buffer, so
+    memory stays bounded by the largest element instead of growing with the
+    response. Elements are expected to be objects, as the records in a /users
+    response are. Parsing stops at the end of the array, fields after it are
+    not read."""
+
+    def __init__(self, field: Text = "data"):
+        """
+        :param field: Top-level key of the array whose elements are returned
+        """
+        self.field = field
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = SEEK
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[Text] = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == DONE
+
+    def feed(self, chunk: Chunk) -> List[Dict[Text, Any]]:
+        """Add part of the body, returning the elements completed by it."""
+        if self._state == DONE:
+            return []
+        self._buffer += self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        items = []
+        while self._state != DONE and self._pos < len(self._buffer):
+            if self._state == SEEK:
+                self._seek()
+            elif self._state == VALUE:
+                self._value()
+            elif not self._item(items):
+                break
+        self._compact()
+        return items
+
+    def close(self) -> List[Dict[Text, Any]]:
+        """Signal the end of the body, raising if it ended inside the array."""
+        items = self.feed(self._utf8.decode(b"", final=True))
+        if self._state in (VALUE, ITEMS) or (self._state == SEEK and self._depth > 0):
+            raise json.JSONDecodeError("Unexpected end of data", self._buffer, len(self._buffer))
+        self._state = DONE
+        return items
+
+    def _seek(self) -> None:
+        # Walk the enclosing object until the field's key and colon at depth 1
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            c = buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._key = json.loads(buffer[self._string_start:self._pos + 1])
+            elif c == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif c in "{[":
+                self._depth += 1
+                self._key = None
+            elif c in "}]":
+                self._depth -= 1
+                self._key = None
+                if self._depth == 0:
+                    self._state = DONE
+                    return
+            elif c == ",":
+                self._key = None
+            elif c == ":" and self._depth == 1 and self._key == self.field:
+                self._pos += 1
+                self._state = VALUE
+                return
+            self._pos += 1
+
+    def _value(self) -> None:
+        c = self._buffer[self._pos]
+        if c.isspace():
+            self._pos += 1
+        elif c == "[":
+            self._pos += 1
+            self._state = ITEMS
+        else:
+            # null or any other non-array value holds no elements
+            self._state = DONE
+
+    def _item(self, items: List[Dict[Text, Any]]) -> bool:
+        c = self._buffer[self._pos]
+        if c.isspace() or c == ",":
+            self._pos += 1
+            return True
+        if c == "]":
+            self._state = DONE
+            return True
+        try:
+            item, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            # The element is incomplete, wait for more of the body
+            return False
+        items.append(item)
+        return True
+
+    def _compact(self) -> None:
+        keep = self._string_start if self._in_string else self._pos
+        if keep:
+            self._buffer = self._buffer[keep:]
+            self._pos -= keep
+            if self._in_string:
+                self._string_start -= keep
+
+
+def iter_records(chunks: Iterable[Chunk], field: Text = "data") -> Iterator[Dict[Text, Any]]:
+    """
+    Lazily decode the records of a response body
+
+    :param chunks: Body as it is read, e.g. requests' Response.iter_content
+    :param field: Top-level key holding the records
+    :return: Raw records in the order they appear, stop iterating to stop reading
+    """
+    parser = ArrayFieldParser(field)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.close()
+
+
+async def aiter_records(chunks: AsyncIterable[Chunk], field: Text = "data") -> AsyncIterator[Dict[Text, Any]]:
+    """Async variant of iter_records, e.g. for aiohttp's StreamReader.iter_chunked."""
+    parser = ArrayFieldParser(field)
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+        if parser.done:
+            return
+    for item in parser.close():
+        yield item
+
+
+class ByteCount:
+    """Total size of the chunks passed through count or acount, for reporting bytes received."""
+
+    def __init__(self):
+        self.total = 0
+
+    def count(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        for chunk in chunks:
+            self.total += len(chunk)
+            yield chunk
+
+    async def acount(self, chunks: AsyncIterable[Chunk]) -> AsyncIterator[Chunk]:
+        async for chunk in chunks:
+            self.total += len(chunk)
+            yield chunk
+
+
+def iter_user_records(chunks: Iterable[Chunk]) -> Iterator[UserRecord]:
+    for record in iter_records(chunks):
+        yield UserRecord().load_from_model(record)
@@ -0,0 +1,192 @@
+import asyncio
+import atexit
+import logging
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Text
+
+from cora import json_codec
+from cora.models import SurveyResponse
+
+logger = logging.getLogger(__name__)
+
+Put = Callable[[SurveyResponse], Awaitable[Any]]
+
+
+class SurveyWriteBuffer:
+    """Write-behind buffer taking survey responses off the form submission path.
+
+    Responses are written by a background task in batches, as soon as
+    batch_size are waiting or flush_interval seconds after the first one
+    arrived. Responses the API rejects or that pile up beyond max_buffered
+    while it is slow are appended to a JSON lines spill file, which is
+    replayed once the buffer is idle again. The replayed file is only removed
+    once each of its responses has been written or spilled again, so a crash
+    mid-replay repeats rather than loses them. Whatever is still buffered
+    when the process exits is spilled as well."""
+
+    def __init__(
+            self,
+            put: Put,
+            batch_size: int = 25,
+            flush_interval: float = 1.0,
+            concurrency: int = 8,
+            max_buffered: int = 1000,
+            spill_path: Optional[Text] = None,
+            retry_interval: float = 30,
+    ):
+        """
+        :param put: Coroutine writing one response, returning a response with a status_code
+        :param batch_size: Number of responses written per flush
+        :param flush_interval: Seconds a response may wait before it is flushed
+        :param concurrency: Number of concurrent writes within a batch
+        :param max_buffered: Responses kept in memory, older ones are spilled to disk beyond this
+        :param spill_path: JSON lines file for responses that could not be written, None to drop them
+        :param retry_interval: Seconds after a failed write before spilled responses are replayed
+        """
+        self.put = put
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.concurrency = concurrency
+        self.max_buffered = max_buffered
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self.written = 0
+        self.failed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.corrupt = 0
+        # Ids of replayed responses not yet written or spilled again, their file is kept until none are left
+        self._replaying: Set[int] = set()
+        self._last_failure = float("-inf")
+        self._buffer: Deque[SurveyResponse] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        atexit.register(self._spill_buffer)
+
+    def add(self, response: SurveyResponse) -> None:
+        """Queue a response for writing without waiting for the API."""
+        self._buffer.append(response)
+        if len(self._buffer) > self.max_buffered:
+            overflow = self._buffer.popleft()
+            self._spill([overflow])
+            self._settle([overflow])
+        self._start()
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if len(self._buffer) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            if self._buffer:
+                await self.flush()
+            elif asyncio.get_event_loop().time() - self._last_failure >= self.retry_interval:
+                self.replay()
+
+    async def flush(self) -> None:
+        """Write up to one batch of buffered responses concurrently."""
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def write(response: SurveyResponse) -> bool:
+            async with semaphore:
+                try:
+                    result = await self.put(response)
+                    if result.status_code < 400:
+                        return True
+                    logger.warning(f"Survey write for {response.user_id} returned {result.status_code}.")
+                except Exception:
+                    logger.exception(f"Survey write for {response.user_id} failed.")
+                return False
+
+        results = await asyncio.gather(*[write(response) for response in batch])
+        self.written += sum(results)
+        failed = [response for response, ok in zip(batch, results) if not ok]
+        self.failed += len(failed)
+        if failed:
+            self._last_failure = asyncio.get_event_loop().time()
+            self._spill(failed)
+        self._settle(batch)
+
+    def _spill(self, responses: List[SurveyResponse]) -> None:
+        if not responses:
+            return
+        if self.spill_path is None:
+            logger.error(f"Dropping {len(responses)} survey responses, no spill file configured.")
+            return
+        with open(self.spill_path, "a") as f:
+            for response in responses:
+                f.write(json_codec.dumps(response.to_dynamo_model()) + "\n")
+        self.spilled += len(responses)
+
+    def _spill_buffer(self) -> None:
+        # Replayed responses are still in the replay file, which is loaded again on the next start
+        self._spill([response for response in self._buffer if id(response) not in self._replaying])
+        self._buffer.clear()
+
+    def _replay_path(self) -> Text:
+        return self.spill_path + ".replaying"
+
+    def _settle(self, responses: List[SurveyResponse]) -> None:
+        """Forget responses written or spilled again, removing the replay file once all of its are."""
+        if not self._replaying:
+            return
+        for response in responses:
+            self._replaying.discard(id(response))
+        if not self._replaying:
+            os.remove(self._replay_path())
+
+    def replay(self) -> int:
+        """Move spilled responses back into the buffer, returning how many were loaded."""
+        if self.spill_path is None or self._replaying:
+            return 0
+        replaying = self._replay_path()
+        # A leftover replay file means the process died mid-replay, load it before taking the spill file
+        if not os.path.exists(replaying):
+            if not os.path.exists(self.spill_path):
+                return 0
+            os.replace(self.spill_path, replaying)
+        responses = []
+        corrupt = []
+        with open(replaying) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    m: Dict[Text, Any] = json_codec.loads(line)
+                    responses.append(SurveyResponse(m["userId"], m.get("answers", {}), m.get("date")))
+                except (ValueError, TypeError, KeyError):
+                    # Typically the last line, cut short by a crash while spilling
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            logger.warning(f"Moving {len(corrupt)} unreadable survey responses to {self.spill_path}.corrupt.")
+            with open(self.spill_path + ".corrupt", "a") as f:
+                f.writelines(corrupt)
+            self.corrupt += len(corrupt)
+        if not responses:
+            os.remove(replaying)
+            return 0
+        self._replaying.update(id(response) for response in responses)
+        self._buffer.extend(responses)
+        self.replayed += len(responses)
+        return len(responses)
+
+    def stats(self) -> Dict[Text, int]:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "corrupt": self.corrupt,
+        }
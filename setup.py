@@ -15,7 +15,8 @@ setup(
     maintainer="Will Kearns",
     maintainer_email="kearnsw@uw.edu",
     license="GPLv3",
-    url="https://www.symptoms.bot", install_requires=['requests']
+    url="https://www.symptoms.bot", install_requires=['requests', 'aiohttp'],
+    extras_require={'fast': ['orjson']}
 )
 
 print("\n")
@@ -0,0 +1,87 @@
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("aws_requests_auth")
+
+from cora import api, config  # noqa: E402
+from cora.api import ApiClient, records_params  # noqa: E402
+from cora.cache import TTLCache  # noqa: E402
+from cora.fake_api import FakeRecordsApi  # noqa: E402
+from cora.models import SurveyResponse, UserRecord  # noqa: E402
+
+
+@pytest.fixture
+def fake():
+    api = FakeRecordsApi(seed_records=3)
+    api.start()
+    yield api
+    api.stop()
+
+
+def test_failed_write_drops_cached_record(fake):
+    client = ApiClient(endpoint=fake.url, auth=None, cache=TTLCache(ttl=60))
+    record = client.get_user_records("2065550100", latest_only=True).most_recent()
+    record.symptoms[0].severity = 9
+
+    fake.latency = 0.5
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.put_user_record(record, timeout=(1, 0.1))
+    fake.latency = 0
+
+    reloaded = client.get_user_records("2065550100", latest_only=True).most_recent()
+    assert(reloaded is not record)
+    assert(reloaded.symptoms[0].severity == fake.users["2065550100"][record.timestamp]["symptoms"][0]["severity"])
+    client.close()
+
+
+def test_latest_query_only_sent_when_enabled(monkeypatch):
+    monkeypatch.setattr(config, "api_latest_query", False)
+    assert(records_params("2065550100", latest_only=True) == {"userId": "2065550100"})
+    monkeypatch.setattr(config, "api_latest_query", True)
+    assert(records_params("2065550100", latest_only=True) == {"userId": "2065550100", "limit": 1, "sort": "desc"})
+    assert(records_params("2065550100") == {"userId": "2065550100"})
+
+
+def test_records_round_trip(fake):
+    client = ApiClient(endpoint=fake.url, auth=None, cache=None)
+    record = client.get_user_records("2065550100").most_recent()
+    assert(record.timestamp == max(fake.users["2065550100"]))
+
+    record.symptoms[1].severity = 9
+    assert(client.patch_user_record(record).status_code == 200)
+    assert(fake.users["2065550100"][record.timestamp]["symptoms"][1]["severity"] == 9)
+
+    created = UserRecord(user_id="2065550101", timestamp=1584818778, age=40)
+    assert(client.put_user_record(created).status_code == 200)
+    # Written records come back as they are, without seeded history in front of them
+    written = client.get_user_records("2065550101")
+    assert(len(written.data) == 1 and written.most_recent().age == 40)
+
+    assert(client.put_survey_response(SurveyResponse("2065550101", {"happy": 7})).status_code == 200)
+    assert(fake.stats()["surveys"] == 1)
+    assert(fake.stats()["requests"] == {"GET /users": 2, "PATCH /users": 1, "POST /users": 1, "POST /surveys": 1})
+    client.close()
+
+
+def test_failed_lookup_returns_response(fake):
+    fake.error_rate = 1
+    client = ApiClient(endpoint=fake.url, auth=None, cache=TTLCache(ttl=60))
+
+    response = client.get_user_records("2065550100")
+    assert(response.status_code == 503)
+    assert(response.json() == {"message": "Injected error"})
+    # Failures are not cached, the next lookup goes to the API again
+    fake.error_rate = 0
+    assert(len(client.get_user_records("2065550100").data) == 3)
+    client.close()
+
+
+def test_module_helpers_share_one_client(fake, monkeypatch):
+    client = ApiClient(endpoint=fake.url, auth=None, cache=None)
+    monkeypatch.setattr(api, "_client", client)
+
+    assert(api.get_client() is client)
+    assert(len(api.get_user_records("2065550100").data) == 3)
+    assert(api.put_survey_response(SurveyResponse("2065550100", {"happy": 7})).status_code == 200)
+    assert(fake.stats()["requests"] == {"GET /users": 1, "POST /surveys": 1})
+    client.close()
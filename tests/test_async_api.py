@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("requests")
+pytest.importorskip("aws_requests_auth")
+
+from cora import async_api  # noqa: E402
+from cora.async_api import ApiResponse, AsyncApiClient  # noqa: E402
+from cora.cache import TTLCache  # noqa: E402
+from cora.fake_api import FakeRecordsApi  # noqa: E402
+from cora.models import SurveyResponse, UserRecord  # noqa: E402
+
+
+@pytest.fixture
+def fake():
+    api = FakeRecordsApi(seed_records=3)
+    api.start()
+    yield api
+    api.stop()
+
+
+def test_api_response():
+    response = ApiResponse(200, b'{"userId": "2065550100", "data": []}')
+    assert(response.json() == {"userId": "2065550100", "data": []})
+    assert(ApiResponse(502, b"\xffBad gateway").text == "\ufffdBad gateway")
+
+
+def test_records_round_trip(fake):
+    async def run():
+        client = AsyncApiClient(endpoint=fake.url, auth=lambda prepared: prepared, cache=None)
+        try:
+            record = (await client.get_user_records("2065550100")).most_recent()
+            assert(record.timestamp == max(fake.users["2065550100"]))
+
+            record.symptoms[1].severity = 9
+            assert((await client.patch_user_record(record)).status_code == 200)
+
+            created = UserRecord(user_id="2065550101", timestamp=1584818778, age=40)
+            assert((await client.put_user_record(created)).status_code == 200)
+            # Written records come back as they are, without seeded history in front of them
+            written = await client.get_user_records("2065550101")
+            assert(len(written.data) == 1 and written.most_recent().age == 40)
+
+            response = await client.put_survey_response(SurveyResponse("2065550101", {"happy": 7}))
+            assert(response.json()["userId"] == "2065550101")
+        finally:
+            await client.close()
+        return record
+
+    record = asyncio.run(run())
+    assert(fake.users["2065550100"][record.timestamp]["symptoms"][1]["severity"] == 9)
+    assert(fake.stats()["requests"] == {"GET /users": 2, "PATCH /users": 1, "POST /users": 1, "POST /surveys": 1})
+
+
+def test_failed_lookup_returns_response(fake):
+    fake.error_rate = 1
+
+    async def run():
+        client = AsyncApiClient(endpoint=fake.url, auth=lambda prepared: prepared, cache=TTLCache(ttl=60))
+        try:
+            failed = await client.get_user_records("2065550100")
+            fake.error_rate = 0
+            return failed, await client.get_user_records("2065550100")
+        finally:
+            await client.close()
+
+    failed, records = asyncio.run(run())
+    assert(isinstance(failed, ApiResponse) and failed.status_code == 503)
+    assert(failed.json() == {"message": "Injected error"})
+    assert(len(records.data) == 3)
+
+
+def test_concurrent_lookups_share_one_request(fake):
+    fake.latency = 0.05
+
+    async def run():
+        client = AsyncApiClient(endpoint=fake.url, auth=lambda prepared: prepared, cache=None)
+        try:
+            return await asyncio.gather(*[client.get_user_records("2065550100") for _ in range(5)])
+        finally:
+            await client.close()
+
+    results = asyncio.run(run())
+    assert(all(records is results[0] for records in results))
+    assert(fake.stats()["requests"] == {"GET /users": 1})
+
+
+def test_module_helpers_share_one_client(fake, monkeypatch):
+    client = AsyncApiClient(endpoint=fake.url, auth=lambda prepared: prepared, cache=None)
+    monkeypatch.setattr(async_api, "_client", client)
+
+    async def run():
+        try:
+            records = await async_api.get_user_records("2065550100", latest_only=True)
+            record = records.most_recent()
+            record.age = 33
+            await async_api.patch_user_record(record)
+            await async_api.put_survey_response(SurveyResponse("2065550100", {"happy": 7}))
+            return record
+        finally:
+            await client.close()
+
+    record = asyncio.run(run())
+    assert(async_api.get_client() is client)
+    assert(fake.users["2065550100"][record.timestamp]["age"] == 33)
+    assert(fake.stats()["surveys"] == 1)
@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks.suite import compare, measure
+
+
+def test_compare_flags_regressions():
+    baseline = {"a": {"ops_per_sec": 100.0}, "b": {"ops_per_sec": 100.0}, "c": {"skipped": "requires sanic"}}
+    current = {"a": {"ops_per_sec": 95.0}, "b": {"ops_per_sec": 80.0}, "c": {"ops_per_sec": 10.0}}
+
+    assert(compare(baseline, current, threshold=0.1) == ["b"])
+
+
+def test_measure():
+    result = measure(lambda: sum(range(100)), min_time=0.01)
+
+    assert(result["ops_per_sec"] > 0)
+    assert(result["us_per_op"] == pytest.approx(1e6 / result["ops_per_sec"]))
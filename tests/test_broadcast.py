@@ -0,0 +1,47 @@
+import asyncio
+
+from cora.connectors.broadcast import broadcast, make_batches
+
+
+def test_recipients_are_deduplicated_and_batched():
+    batches = make_batches(["+12065550001", "+12065550002", " +12065550001", "", "+12065550003"], 2)
+
+    assert(batches == [["+12065550001", "+12065550002"], ["+12065550003"]])
+
+
+def test_broadcast_reports_per_batch_outcome():
+    calls = []
+
+    async def send(contacts, body, delivery_time):
+        calls.append((contacts, body, delivery_time))
+        if contacts == "+12065550003":
+            return 500
+        return 200
+
+    recipients = ["+12065550001", "+12065550002", "+12065550003"]
+    report = asyncio.run(broadcast(send, recipients, "Time for your daily check-in!",
+                                   delivery_time=1585000000000, batch_size=2, stagger=1000))
+
+    assert(sorted(calls) == [("+12065550001,+12065550002", "Time for your daily check-in!", 1585000000000),
+                             ("+12065550003", "Time for your daily check-in!", 1585000001000)])
+    assert(report.delivered == 2)
+    assert([b.index for b in report.failed] == [1])
+    assert(report.as_dict()["failed_batches"][0]["status"] == 500)
+
+
+def test_broadcast_limits_concurrent_batches():
+    in_flight = []
+    peak = []
+
+    async def send(contacts, body, delivery_time):
+        in_flight.append(contacts)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.001)
+        in_flight.remove(contacts)
+        return 200
+
+    recipients = [f"+1206555{i:04d}" for i in range(20)]
+    report = asyncio.run(broadcast(send, recipients, "hi", batch_size=2, concurrency=3))
+
+    assert(max(peak) == 3)
+    assert(report.delivered == 20)
@@ -0,0 +1,62 @@
+from cora.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, timer=clock)
+    cache.set("14252210134", "records")
+
+    clock.now = 4.9
+    assert(cache.get("14252210134") == "records")
+
+    clock.now = 5.0
+    assert(cache.get("14252210134") is None)
+    assert(len(cache) == 0)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert("a" in cache)
+    assert("b" not in cache)
+    assert("c" in cache)
+
+
+def test_invalidate_and_hit_counters():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.invalidate("a")
+    cache.get("a")
+
+    assert(cache.hits == 1)
+    assert(cache.misses == 1)
+
+
+def test_zero_ttl_disables_cache():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+
+    assert(cache.get("a") is None)
+
+
+def test_stats_count_hits_and_misses():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+
+    assert(cache.stats() == {"size": 1, "hits": 2, "misses": 1, "hit_ratio": 2 / 3})
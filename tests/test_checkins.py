@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from cora.checkins import DAY, CheckinScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1585000000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def no_trigger(user_id, text):
+    pass
+
+
+def test_due_checkins_pop_in_order_and_reschedule():
+    clock = FakeClock()
+    scheduler = CheckinScheduler(no_trigger, spread=0, timer=clock)
+    scheduler.schedule("+12065550002", "weekly_form", clock.now + 20, interval=7 * DAY)
+    scheduler.schedule("+12065550001", "daily_form", clock.now + 10)
+
+    assert(scheduler.pop_due(clock.now + 5) == [])
+    due = scheduler.pop_due(clock.now + 30)
+
+    assert([(c.user_id, c.text) for c in due] == [("+12065550001", "/daily_event"),
+                                                    ("+12065550002", "/weekly_event")])
+    assert(scheduler.next_due() == clock.now + 10 + DAY)
+
+
+def test_rescheduling_replaces_entry_and_missed_periods_are_skipped():
+    clock = FakeClock()
+    scheduler = CheckinScheduler(no_trigger, spread=0, timer=clock)
+    scheduler.schedule("+12065550001", "daily_form", clock.now)
+    scheduler.schedule("+12065550001", "daily_form", clock.now + 100)
+
+    due = scheduler.pop_due(clock.now + 3 * DAY + 200)
+
+    assert(len(due) == 1)
+    assert(scheduler.next_due() == clock.now + 100 + 4 * DAY)
+
+
+def test_spread_offsets_are_stable_and_bounded():
+    scheduler = CheckinScheduler(no_trigger, spread=900)
+    offsets = {scheduler.offset(f"+1206555{i:04d}", "daily_form") for i in range(200)}
+
+    assert(all(0 <= o < 900 for o in offsets))
+    assert(len(offsets) > 150)
+    assert(scheduler.offset("+12065550001", "daily_form") == scheduler.offset("+12065550001", "daily_form"))
+
+
+def test_unknown_checkin_needs_text():
+    scheduler = CheckinScheduler(no_trigger)
+    with pytest.raises(ValueError):
+        scheduler.schedule("+12065550001", "followup_form", 0)
+
+
+def test_schedule_survives_restart(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "checkins.sqlite")
+    scheduler = CheckinScheduler(no_trigger, path=path, spread=0, timer=clock)
+    scheduler.schedule("+12065550001", "daily_form", clock.now + 10)
+    scheduler.schedule("+12065550002", "daily_form", clock.now + 10)
+    scheduler.unschedule("+12065550002", "daily_form")
+    asyncio.run(scheduler.stop())
+
+    restarted = CheckinScheduler(no_trigger, path=path, spread=0, timer=clock)
+
+    assert(restarted.stats()["scheduled"] == 1)
+    assert(restarted.next_due() == clock.now + 10)
+
+
+def test_fire_records_lag():
+    clock = FakeClock()
+    fired = []
+
+    async def trigger(user_id, text):
+        fired.append((user_id, text))
+
+    scheduler = CheckinScheduler(trigger, spread=0, timer=clock)
+    scheduler.schedule("+12065550001", "daily_form", clock.now - 2)
+    asyncio.run(scheduler.fire(scheduler.pop_due(clock.now)))
+
+    assert(fired == [("+12065550001", "/daily_event")])
+    assert(scheduler.stats()["max_lag_seconds"] == 2)
+
+
+def test_lag_measured_when_checkin_starts():
+    clock = FakeClock()
+    loop = asyncio.new_event_loop()
+    started = loop.create_future()
+
+    async def trigger(user_id, text):
+        return started
+
+    scheduler = CheckinScheduler(trigger, spread=0, timer=clock)
+    scheduler.schedule("+12065550001", "daily_form", clock.now - 2)
+    loop.run_until_complete(scheduler.fire(scheduler.pop_due(clock.now)))
+    assert(scheduler.stats()["fired"] == 0)
+
+    clock.now += 5
+    started.set_result(None)
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    assert(scheduler.stats()["fired"] == 1)
+    assert(scheduler.stats()["max_lag_seconds"] == 7)
+
+
+def test_failed_checkin_retried_before_next_period():
+    clock = FakeClock()
+    outcomes = [RuntimeError("Worker queue full"), None]
+
+    async def trigger(user_id, text):
+        outcome = outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+    scheduler = CheckinScheduler(trigger, spread=0, timer=clock)
+    scheduler.schedule("+12065550001", "daily_form", clock.now - 2)
+    asyncio.run(scheduler.fire(scheduler.pop_due(clock.now)))
+    assert(scheduler.stats()["retrying"] == 1)
+    assert(scheduler.next_due() <= clock.now + 2)
+
+    clock.now += scheduler.max_retry_delay
+    retries = scheduler.pop_retries(clock.now)
+    assert([entry.due for entry, _ in retries] == [clock.now - scheduler.max_retry_delay - 2])
+    asyncio.run(scheduler.fire([entry for entry, _ in retries], [attempts for _, attempts in retries]))
+
+    stats = scheduler.stats()
+    assert(stats["failed"] == 1 and stats["retried"] == 1 and stats["fired"] == 1 and stats["retrying"] == 0)
+    assert(scheduler.next_due() == clock.now - scheduler.max_retry_delay - 2 + DAY)
+
+
+def test_unscheduling_with_retries_outstanding():
+    clock = FakeClock()
+    scheduler = CheckinScheduler(no_trigger, spread=0, timer=clock)
+    for user_id in ("+12065550001", "+12065550002"):
+        scheduler.schedule(user_id, "daily_form", clock.now - 2)
+    for entry in scheduler.pop_due(clock.now):
+        assert(scheduler.retry(entry, 1))
+        scheduler.unschedule(entry.user_id, entry.checkin)
+
+    # Only the retries are left, the heap holds nothing but stale entries
+    assert(scheduler.pop_retries(clock.now) == [])
+    assert(scheduler.pop_due(clock.now) == [])
+    assert(scheduler.next_due() is not None)
+
+    clock.now += scheduler.max_retry_delay
+    assert(scheduler.pop_retries(clock.now) == [])
+    assert(scheduler.next_due() is None)
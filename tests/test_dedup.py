@@ -0,0 +1,45 @@
+from cora.connectors.dedup import MessageDeduplicator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1573853184.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_message_key_prefers_id_over_fingerprint():
+    assert(MessageDeduplicator.message_key({"id": 1195453017123205120, "fingerprint": "1514465037"})
+           == "id:1195453017123205120")
+    assert(MessageDeduplicator.message_key({"fingerprint": "1514465037"}) == "fingerprint:1514465037")
+    assert(MessageDeduplicator.message_key({"body": "hi"}) is None)
+
+
+def test_redelivery_is_suppressed_within_window():
+    clock = FakeClock()
+    deduplicator = MessageDeduplicator(ttl=60, timer=clock)
+
+    assert(not deduplicator.is_duplicate("id:1"))
+    deduplicator.mark_seen("id:1")
+    assert(deduplicator.is_duplicate("id:1"))
+
+    clock.now += 61
+    assert(not deduplicator.is_duplicate("id:1"))
+    assert(deduplicator.suppressed == 1)
+
+
+def test_seen_ids_survive_restart(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "dedup.sqlite")
+    deduplicator = MessageDeduplicator(ttl=60, path=path, timer=clock)
+    deduplicator.mark_seen("id:1")
+    clock.now += 30
+    deduplicator.mark_seen("id:2")
+    deduplicator.close()
+
+    clock.now += 40
+    restarted = MessageDeduplicator(ttl=60, path=path, timer=clock)
+
+    assert(not restarted.is_duplicate("id:1"))
+    assert(restarted.is_duplicate("id:2"))
@@ -0,0 +1,55 @@
+import json
+from urllib.request import Request, urlopen
+
+from cora.fake_api import FakeRecordsApi
+from cora.models import UserRecord
+from cora.responses import UserRecordResponse
+
+
+def test_latest_record_and_partial_update():
+    api = FakeRecordsApi(seed_records=5)
+
+    status, body = api.handle("GET", "/users", {"userId": "2065551212", "limit": "1", "sort": "desc"}, None)
+    record = UserRecordResponse().load_from_model(body).most_recent()
+    assert(status == 200)
+    assert(len(body["data"]) == 1)
+    assert(record.timestamp == max(api.users["2065551212"]))
+
+    record.symptoms[1].severity = 9
+    assert(api.handle("PATCH", "/users", {}, record.to_dynamo_delta())[0] == 200)
+    assert(api.users["2065551212"][record.timestamp]["symptoms"][1]["severity"] == 9)
+
+
+def test_injected_errors():
+    api = FakeRecordsApi(error_rate=0.5, rand=iter([0.2, 0.7]).__next__)
+
+    assert(api.handle("POST", "/surveys", {}, {"userId": "2065551212", "answers": {}})[0] == 503)
+    assert(api.handle("POST", "/surveys", {}, {"userId": "2065551212", "answers": {}})[0] == 200)
+    assert(api.stats()["requests"] == {"POST /surveys": 2})
+
+
+def test_http_round_trip():
+    api = FakeRecordsApi()
+    url = api.start()
+    try:
+        record = UserRecord(user_id="2065551212", timestamp=1584818778).to_dynamo_model()
+        post = Request(url + "/users", data=json.dumps(record).encode(), method="POST",
+                       headers={"Content-Type": "application/json", "Authorization": "AWS4-HMAC-SHA256 anything"})
+        assert(urlopen(post).status == 200)
+
+        with urlopen(url + "/users?userId=2065551212") as response:
+            assert(json.loads(response.read())["data"] == [record])
+    finally:
+        api.stop()
+
+
+def test_writes_do_not_seed_records():
+    api = FakeRecordsApi(seed_records=5)
+    record = UserRecord(user_id="2065551212", timestamp=1584818778).to_dynamo_model()
+
+    assert(api.handle("PATCH", "/users", {}, {"userId": "2065551213", "timestamp": 1584818778, "set": {}})[0] == 404)
+    assert(api.handle("POST", "/users", {}, record)[0] == 200)
+    status, body = api.handle("GET", "/users", {"userId": "2065551212"}, None)
+    assert([r["timestamp"] for r in body["data"]] == [1584818778])
+    # A user only patched is still seeded on its first read
+    assert(len(api.handle("GET", "/users", {"userId": "2065551213"}, None)[1]["data"]) == 5)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import logging
+from typing import Any, List, Text
+
+from cora import instrumentation, metrics
+from cora.instrumentation import ActionReport, instrument_action, timed
+
+
+class Tracker:
+    sender_id = "2065550100"
+
+
+@timed
+def lookup() -> None:
+    metrics.observe_api_call("GET", "/users", 200, 0.01, 0, 1500)
+
+
+class BaseForm:
+    def request_next_slot(self, tracker: Tracker) -> None:
+        return None
+
+
+@instrument_action
+class ExampleForm(BaseForm):
+    def name(self) -> Text:
+        return "example_form"
+
+    @staticmethod
+    def required_slots(tracker: Tracker) -> List[Text]:
+        return ["fever"]
+
+    async def validate_fever(self, value: Text, tracker: Tracker) -> Any:
+        lookup()
+        return {"fever": value}
+
+    async def submit(self, tracker: Tracker) -> List[Any]:
+        metrics.observe_api_call("PATCH", "/users", 200, 0.02, 300, 200)
+        return []
+
+    async def run(self, tracker: Tracker) -> List[Any]:
+        self.required_slots(tracker)
+        self.request_next_slot(tracker)
+        await self.validate_fever("101", tracker)
+        return await self.submit(tracker)
+
+
+def test_turn_counts_calls_and_bytes(monkeypatch, caplog):
+    report = ActionReport()
+    monkeypatch.setattr(instrumentation, "report", report)
+
+    with caplog.at_level(logging.INFO, logger="cora.instrumentation"):
+        asyncio.run(ExampleForm().run(Tracker()))
+    turn = json.loads(caplog.records[-1].getMessage())
+    stats = report.stats()["example_form"]
+
+    assert(turn["action"] == "example_form" and turn["sender_id"] == "2065550100")
+    assert(turn["api_calls"] == 2 and turn["bytes_sent"] == 300 and turn["bytes_received"] == 1700)
+    assert(set(turn["methods"]) == {"run", "required_slots", "request_next_slot", "validate_fever", "lookup", "submit"})
+    assert(stats["turns"] == 1 and stats["api_calls_per_turn"] == 2)
+    assert("example_form" in report.format())
+
+
+def test_each_outer_call_is_a_turn(monkeypatch):
+    report = ActionReport()
+    monkeypatch.setattr(instrumentation, "report", report)
+
+    assert(ExampleForm.required_slots(Tracker()) == ["fever"])
+    asyncio.run(ExampleForm().validate_fever("101", Tracker()))
+    lookup()
+    stats = report.stats()["example_form"]
+
+    assert(stats["turns"] == 2)
+    assert(stats["methods"]["validate_fever"]["calls"] == 1)
+    assert(stats["methods"]["lookup"]["calls"] == 1)
+
+
+def test_failed_turn_counted_as_error(monkeypatch):
+    report = ActionReport()
+    monkeypatch.setattr(instrumentation, "report", report)
+
+    @instrument_action
+    class Failing:
+        def name(self) -> Text:
+            return "action_failing"
+
+        def run(self, tracker: Tracker) -> None:
+            raise ValueError("no records")
+
+    try:
+        Failing().run(Tracker())
+    except ValueError:
+        pass
+    assert(report.stats()["action_failing"]["errors"] == 1)
+    assert(instrumentation.current_turn() is None)
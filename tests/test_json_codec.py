@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+
+from cora.json_codec import JsonCodec, load_codec
+from tests.test_serialization import MODEL
+
+
+def test_backends_agree():
+    body = {"userId": "2065551212", "data": [MODEL], "note": "fièvre"}
+    for name in ("json", "orjson"):
+        codec = load_codec(name)
+        assert(codec.loads(codec.dumps_bytes(body)) == body)
+        assert(codec.loads(codec.dumps(body)) == body)
+        assert(codec.dumps(body) == JsonCodec().dumps(body))
+
+
+def test_values_orjson_rejects_fall_back():
+    codec = load_codec("orjson")
+    assert(codec.loads(codec.dumps({"id": 2 ** 70})) == {"id": 2 ** 70})
+
+
+def test_missing_backend_falls_back(monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert(load_codec("auto").name == "json")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_codec("simplejson")
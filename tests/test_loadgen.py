@@ -0,0 +1,71 @@
+import random
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from cora.loadgen import (
+    FORM_SLOTS, LoadGenerator, ReplySink, Story, arrivals, parse_stories, percentiles, script, zipwhip_payload
+)
+
+
+def test_stories_scripted_to_messages():
+    stories = {story.name: story for story in parse_stories()}
+    daily = stories["Daily Event"]
+    messages = script(daily, random.Random(1))
+
+    assert(daily.intent == "daily_event")
+    assert(daily.forms == ["daily_form", "short_response_form"])
+    assert(messages[0] == "/daily_event")
+    assert(len(messages) == 1 + len(FORM_SLOTS["daily_form"]) + len(FORM_SLOTS["short_response_form"]))
+    assert(all(1 <= int(m) <= 10 for m in messages[1:5]))
+    assert(stories["Mistake"].forms == [])
+
+
+def test_payload_and_arrivals():
+    payload = zipwhip_payload(7, "+12065550100", "/daily_event")
+    assert(payload["finalSource"] == "+12065550100")
+    assert(payload["address"] == "ptn:/+12065550100")
+    assert(payload["bodySize"] == len("/daily_event"))
+
+    offsets = list(arrivals(200, 5, random.Random(2)))
+    assert(offsets == sorted(offsets) and offsets[-1] < 5)
+    assert(800 < len(offsets) < 1200)
+
+
+def test_percentiles():
+    summary = percentiles([float(i) for i in range(1, 101)])
+    assert(summary["p50"] == 50 and summary["p99"] == 99 and summary["max"] == 100)
+    assert(percentiles([]) == {})
+
+
+def test_sink_matches_replies_to_messages():
+    clock = iter([5.0, 6.5]).__next__
+    sink = ReplySink(timer=clock)
+    url = sink.start()
+    try:
+        sink.expect("+12065550100", 1.0)
+        sink.expect("+12065550100", 2.0)
+        for _ in range(2):
+            data = urlencode({"session": "s", "contacts": "+12065550100", "body": "Hi"}).encode()
+            assert(urlopen(url, data=data).status == 200)
+    finally:
+        sink.stop()
+    assert(sink.replies == 2)
+    assert(sink.latencies == [4.0, 4.5])
+    assert(sink.unanswered() == 0)
+
+
+def test_pick_continues_idle_conversations():
+    story = Story("Daily Event", "daily_event", ["daily_form"])
+    generator = LoadGenerator("http://localhost/webhook", [story], rate=10, duration=1, users=2, seed=3)
+
+    first = generator.pick()
+    assert(first.in_flight)
+    first.next_message()
+    second = generator.pick()
+    assert(second is not first and generator.started_conversations == 2)
+    # Both users are waiting on a request, the arrival is dropped rather than sent twice
+    assert(generator.pick() is None)
+
+    first.in_flight = False
+    assert(generator.pick() is first)
+    assert(first.position == 1 and generator.started_conversations == 2)
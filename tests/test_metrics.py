@@ -0,0 +1,54 @@
+import threading
+from urllib.request import urlopen
+
+from cora.metrics import Registry, start_http_server
+
+
+def test_counter_sums_thread_shards():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Calls.", ["endpoint", "status"])
+
+    def work():
+        for _ in range(1000):
+            counter.inc("GET /users", "200")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("GET /users", "503", amount=2)
+
+    assert(counter.collect() == {("GET /users", "200"): 4000, ("GET /users", "503"): 2})
+    assert('calls_total{endpoint="GET /users",status="503"} 2' in registry.render())
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("call_seconds", "Call duration.", buckets=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+
+    assert('call_seconds_bucket{le="0.1"} 2' in lines)
+    assert('call_seconds_bucket{le="1"} 3' in lines)
+    assert('call_seconds_bucket{le="+Inf"} 4' in lines)
+    assert("call_seconds_sum 3.65" in lines)
+    assert("call_seconds_count 4" in lines)
+
+
+def test_stats_exported_as_gauges():
+    registry = Registry()
+    registry.register_stats("cora_workers", lambda: {"queue_depth": 3, "avg_wait_seconds": 0.5, "name": "x"})
+    registry.register_stats("cora_outbox", lambda: None)
+    server = start_http_server(0, "127.0.0.1", registry)
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            lines = response.read().decode().splitlines()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert("cora_workers_queue_depth 3" in lines)
+    assert("cora_workers_avg_wait_seconds 0.5" in lines)
+    assert(not any(line.startswith("cora_workers_name") or line.startswith("cora_outbox") for line in lines))
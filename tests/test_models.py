@@ -26,3 +26,57 @@ def test_symptom_severity():
     assert(symptoms_by_severity[0].severity == 9)
     assert(symptoms_by_severity[1].severity == 3)
     assert(symptoms_by_severity[2].severity == 0)
+
+
+def test_loaded_record_delta_contains_only_changes():
+    record = UserRecord().load_from_model({"userId": "14252210134",
+                                           "timestamp": 1584818778,
+                                           "age": 26,
+                                           "zipCode": "98028",
+                                           "symptoms": [{"name": "Fever", "severity": 8},
+                                                        {"name": "Cough", "severity": 3}]})
+    assert(record.to_dynamo_delta()["set"] == {})
+
+    record.age = 27
+    record.symptoms[1].severity = 5
+    record.symptoms[1].description = "Follow-up Form"
+
+    assert(record.to_dynamo_delta() == {"userId": "14252210134",
+                                        "timestamp": 1584818778,
+                                        "set": {"age": 27,
+                                                "symptoms[1].severity": 5,
+                                                "symptoms[1].description": "Follow-up Form"}})
+
+
+def test_delta_sends_whole_symptom_list_when_symptoms_are_added():
+    record = UserRecord().load_from_model({"userId": "14252210134",
+                                           "timestamp": 1584818778,
+                                           "symptoms": [{"name": "Fever", "severity": 8}]})
+    record.symptoms.append(Symptom("Cough", severity=2))
+
+    assert(record.to_dynamo_delta()["set"] == {"symptoms": [{"name": "Fever", "startDate": 0, "endDate": 0,
+                                                             "severity": 8},
+                                                            {"name": "Cough", "startDate": 0, "endDate": 0,
+                                                             "severity": 2}]})
+
+
+def test_unknown_keys_kept_in_extra():
+    record = UserRecord().load_from_model({"userId": "test_user", "timestamp": 1584818778, "riskScore": 3,
+                                           "symptoms": [{"name": "Fever", "severity": 4, "bodyPart": "head"}]})
+
+    assert(record.extra == {"risk_score": 3})
+    assert(record.symptoms[0].extra == {"body_part": "head"})
+    assert(not record.is_dirty())
+    assert("riskScore" not in record.to_dynamo_model())
+
+
+def test_symptom_history():
+    history = UserRecordResponse("test_user", [
+        UserRecord(timestamp=1584918778, symptoms=[Symptom(name="Fever", severity=2), Symptom(name="Cough")]),
+        UserRecord(timestamp=1584818778, symptoms=[Symptom(name="fever", severity=6, description="Follow-up Form")]),
+    ]).symptom_history()
+
+    assert(len(history) == 3)
+    assert(history.severities_of("Fever") == [(1584818778, 6), (1584918778, 2)])
+    assert(history.symptom(0).description == "Follow-up Form")
+    assert(history.symptom(2).severity == 0)
@@ -0,0 +1,113 @@
+import asyncio
+
+from cora.connectors.outbox import Outbox, OutboxSender
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1585000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_recipient_messages_are_claimed_in_order(tmp_path):
+    clock = FakeClock()
+    outbox = Outbox(str(tmp_path / "outbox.sqlite"), lease=60, timer=clock)
+    outbox.put_all("+12065550001", ["one", "two"])
+    outbox.put_all("+12065550002", ["three", "", None])
+
+    first = outbox.claim(1)
+    assert([m.body for m in first] == ["one"])
+    # "two" waits behind the leased "one", the other recipient does not
+    assert([m.body for m in outbox.claim(10)] == ["three"])
+
+    outbox.ack([first[0].id])
+    assert([m.body for m in outbox.claim(10)] == ["two"])
+    assert(outbox.backlog() == 2)
+
+
+def test_unacknowledged_messages_are_redelivered(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "outbox.sqlite")
+    outbox = Outbox(path, lease=60, timer=clock)
+    outbox.put_all("+12065550001", ["one"])
+    assert(len(outbox.claim(10)) == 1)
+    assert(outbox.claim(10) == [])
+    outbox.close()
+
+    restarted = Outbox(path, lease=60, timer=clock)
+    assert(restarted.recover() == 1)
+    assert([m.body for m in restarted.claim(10)] == ["one"])
+
+    clock.now += 61
+    assert([m.body for m in restarted.claim(10)] == ["one"])
+
+
+def test_failed_message_is_retried_then_set_aside(tmp_path):
+    clock = FakeClock()
+    outbox = Outbox(str(tmp_path / "outbox.sqlite"), max_attempts=2, timer=clock)
+    outbox.put_all("+12065550001", ["one"])
+
+    outbox.retry(outbox.claim(1)[0], delay=5)
+    assert(outbox.claim(1) == [])
+    clock.now += 5
+    outbox.retry(outbox.claim(1)[0], delay=5)
+
+    assert(outbox.backlog() == 0)
+    assert(outbox.dead() == 1)
+
+
+def test_sender_delivers_in_order_and_holds_back_after_failure(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite"))
+    outbox.put_all("+12065550001", ["one", "two", "three"])
+    outbox.put_all("+12065550002", ["four"])
+    sent = []
+
+    async def send(recipient, body, delivery_time):
+        if body == "two" and "two" not in [b for _, b in sent]:
+            sent.append((recipient, "two"))
+            return 503
+        sent.append((recipient, body))
+        return 200
+
+    sender = OutboxSender(outbox, send, delay=0)
+    asyncio.run(sender.drain(outbox.claim(10)))
+
+    assert([b for r, b in sent if r == "+12065550001"] == ["one", "two"])
+    assert([b for r, b in sent if r == "+12065550002"] == ["four"])
+    assert(sender.stats()["sent"] == 2)
+    assert(sender.stats()["failed"] == 1)
+    assert(outbox.backlog() == 2)
+
+
+def test_slow_recipient_does_not_hold_up_others(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.sqlite"))
+    outbox.put_all("+12065550001", ["slow"])
+    sent = []
+    stuck = None
+
+    async def send(recipient, body, delivery_time):
+        if body == "slow":
+            await stuck.wait()
+        sent.append(body)
+        return 200
+
+    async def run():
+        nonlocal stuck
+        stuck = asyncio.Event()
+        sender = OutboxSender(outbox, send, poll_interval=0.01, delay=0)
+        sender.start()
+        await asyncio.sleep(0.02)
+        outbox.put_all("+12065550002", ["fast"])
+        outbox.put_all("+12065550001", ["queued"])
+        sender.notify()
+        await asyncio.sleep(0.05)
+        assert(sent == ["fast"])
+        stuck.set()
+        await asyncio.sleep(0.05)
+        await sender.stop()
+
+    asyncio.run(run())
+    assert(sent == ["fast", "slow", "queued"])
+    assert(outbox.backlog() == 0)
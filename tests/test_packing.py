@@ -0,0 +1,33 @@
+from cora.connectors.packing import byte_length, pack_messages, split_message
+
+
+def test_consecutive_replies_are_packed():
+    messages = [{"recipient_id": "+12065550001", "text": "Hi, it's Cora."},
+                {"recipient_id": "+12065550001", "text": "How happy did you feel today? (1-10)"}]
+
+    assert(pack_messages(messages) == [{"recipient_id": "+12065550001",
+                                        "text": "Hi, it's Cora.\nHow happy did you feel today? (1-10)"}])
+
+
+def test_packing_respects_limit_and_non_text_messages():
+    messages = [{"text": "a" * 8}, {"text": "b" * 8}, {"text": "c" * 8},
+                {"image": "https://i.imgur.com/nGF1K8f.jpg"}, {"text": "d"}]
+
+    packed = pack_messages(messages, limit=20)
+
+    assert([m.get("text") for m in packed] == ["a" * 8 + "\n" + "b" * 8, "c" * 8, None, "d"])
+
+
+def test_long_message_is_split_at_sentence_boundaries():
+    text = "First sentence here. Second sentence here! Third one?"
+
+    assert(split_message(text, limit=25) == ["First sentence here.", "Second sentence here!", "Third one?"])
+
+
+def test_split_never_exceeds_byte_limit():
+    text = "✏️" * 50 + " done."
+
+    parts = split_message(text, limit=32)
+
+    assert(all(byte_length(p) <= 32 for p in parts))
+    assert("".join(parts).replace(" ", "") == text.replace(" ", ""))
@@ -0,0 +1,78 @@
+from cora.connectors.ratelimit import RateLimiter, TokenBucket, backoff, retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, timer=clock)
+
+    for _ in range(3):
+        assert(bucket.delay() == 0)
+        bucket.consume()
+    assert(bucket.delay() == 0.5)
+
+    clock.now = 0.5
+    assert(bucket.delay() == 0)
+
+
+def test_recipient_bucket_throttles_without_blocking_others():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=100, recipient_rate=1, recipient_burst=2, timer=clock)
+
+    assert(limiter.try_acquire("+12065550001") == 0)
+    assert(limiter.try_acquire("+12065550001") == 0)
+    assert(limiter.try_acquire("+12065550001") == 1.0)
+    assert(limiter.try_acquire("+12065550002") == 0)
+    assert(limiter.throttled == 1)
+
+
+def test_global_bucket_caps_all_recipients():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=2, recipient_rate=10, timer=clock)
+
+    assert(limiter.try_acquire("a") == 0)
+    assert(limiter.try_acquire("b") == 0)
+    assert(limiter.try_acquire("c") == 0.5)
+
+
+def test_recipient_buckets_are_bounded():
+    limiter = RateLimiter(max_recipients=2)
+    for recipient in ("a", "b", "c"):
+        limiter.try_acquire(recipient)
+
+    assert(list(limiter._recipients) == ["b", "c"])
+
+
+def test_backoff_is_jittered_and_capped():
+    assert(backoff(0, base=0.5, rand=lambda: 1.0) == 0.5)
+    assert(backoff(3, base=0.5, rand=lambda: 1.0) == 4.0)
+    assert(backoff(10, base=0.5, cap=30, rand=lambda: 1.0) == 30)
+    assert(backoff(3, base=0.5, rand=lambda: 0.25) == 1.0)
+
+
+def test_retry_after_header():
+    assert(retry_after({"Retry-After": "3"}) == 3.0)
+    assert(retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None)
+    assert(retry_after(None) is None)
+
+
+def test_contact_list_takes_a_token_per_contact():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=4, recipient_rate=1, recipient_burst=1, timer=clock)
+
+    assert(limiter.try_acquire("a,b,c") == 0)
+    assert(limiter.try_acquire("d,e") == 0.5)
+    # Each contact's own bucket is used up as well
+    assert(limiter.try_acquire("a") == 1.0)
+
+    # A list longer than the burst waits for a full bucket and leaves it in debt
+    clock.now = 10.0
+    assert(limiter.try_acquire(",".join(str(i) for i in range(6))) == 0)
+    assert(limiter.bucket.delay() == 1.5)
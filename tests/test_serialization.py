@@ -0,0 +1,54 @@
+from cora.models import Symptom, SurveyResponse, UserRecord
+from cora.responses import UserRecordResponse
+from cora.serialization import INT, VALUE, Field, Schema
+
+MODEL = {"userId": "2065551212",
+         "timestamp": 1584818778,
+         "phoneNumber": "2065551212",
+         "age": 34,
+         "zipCode": "98105",
+         "dob": 0,
+         "gender": "female",
+         "healthCondition": False,
+         "internationalTravel": False,
+         "covidContact": True,
+         "symptoms": [{"name": "Fever", "startDate": 1584818778, "endDate": 0, "severity": 4,
+                       "description": "Follow-up Form"}]}
+
+
+def test_round_trip():
+    assert(UserRecord().load_from_model(MODEL).to_dynamo_model() == MODEL)
+
+
+def test_encode_defaults():
+    model = UserRecord(user_id="2065551212", zip_code="", symptoms=[Symptom(name="Cough")]).to_dynamo_model()
+
+    assert(model == {"userId": "2065551212", "timestamp": 0, "age": 0, "dob": 0,
+                     "symptoms": [{"name": "Cough", "startDate": 0, "endDate": 0, "severity": 0}]})
+    assert(list(model) == ["userId", "timestamp", "age", "dob", "symptoms"])
+    assert(SurveyResponse("2065551212", {}, 1.5).to_dynamo_model() == {"userId": "2065551212", "date": 1.5,
+                                                                       "answers": {}})
+
+
+def test_decode_snake_case_and_unknown_keys():
+    record = UserRecord().load_from_model({"user_id": "2065551212", "ZipCode": "98105", "riskScore": 2})
+
+    assert(record.user_id == "2065551212")
+    assert(record.zip_code == "98105")
+    assert(record.extra == {"risk_score": 2})
+
+
+def test_response_decode():
+    response = UserRecordResponse().load_from_model({"userId": "2065551212", "data": [MODEL], "count": 1})
+
+    assert(response.user_id == "2065551212")
+    assert(response.most_recent().symptoms[0].severity == 4)
+    assert(response.extra == {"count": 1})
+
+
+def test_schema_rejects_invalid_names():
+    try:
+        Schema([Field("zip-code", "zipCode", VALUE), Field("age", "age", INT)])
+        assert(False)
+    except ValueError:
+        pass
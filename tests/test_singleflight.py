@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+from cora.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    executions = []
+    results = []
+
+    def fetch():
+        executions.append(1)
+        started.set()
+        release.wait()
+        return "records"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("14252210134", fetch)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("14252210134", fetch)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flight.coalesced < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert(len(executions) == 1)
+    assert(results == ["records"] * 4)
+    assert(flight.stats() == {"calls": 4, "coalesced": 3, "in_flight": 0})
+
+
+def test_async_calls_share_one_task():
+    flight = AsyncSingleFlight()
+    executions = []
+
+    async def fetch():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return "records"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("14252210134", fetch) for _ in range(5)])
+
+    results = asyncio.run(run())
+
+    assert(len(executions) == 1)
+    assert(results == ["records"] * 5)
+    assert(flight.coalesced == 4)
+
+
+def test_async_error_is_shared_and_key_released():
+    flight = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(flight.do("a", fail), flight.do("a", fail), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert(all(isinstance(r, ValueError) for r in results))
+    assert(flight.stats()["in_flight"] == 0)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from cora.responses import UserRecordResponse
+from cora.streaming import ArrayFieldParser, iter_records, iter_user_records
+
+RESPONSE = {
+    "userId": "2065551212",
+    "data": [{"userId": "2065551212", "timestamp": 1584818778, "gender": "féminin \"}]\"",
+              "symptoms": [{"name": "Fever", "severity": 4}]},
+             {"userId": "2065551212", "timestamp": 1584918778, "symptoms": []},
+             {"userId": "2065551212", "timestamp": 1584810778, "symptoms": []}],
+    "count": 3,
+}
+
+
+def chunked(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_records_across_chunk_boundaries():
+    body = json.dumps(RESPONSE, ensure_ascii=False).encode("utf-8")
+    for size in (1, 7, len(body)):
+        assert(list(iter_records(chunked(body, size))) == RESPONSE["data"])
+
+
+def test_data_after_other_fields():
+    body = json.dumps({"count": {"data": [1]}, "note": "data", "data": [{"a": 1}]}).encode("utf-8")
+    assert(list(iter_records(chunked(body, 3))) == [{"a": 1}])
+
+
+def test_missing_or_null_data():
+    assert(list(iter_records([b'{"userId": "x"}'])) == [])
+    assert(list(iter_records([b'{"data": null}'])) == [])
+
+
+def test_stops_reading_after_early_termination():
+    body = json.dumps(RESPONSE).encode("utf-8")
+    read = []
+
+    def chunks():
+        for chunk in chunked(body, 16):
+            read.append(chunk)
+            yield chunk
+
+    first = next(iter_user_records(chunks()))
+
+    assert(first.timestamp == 1584818778)
+    assert(first.symptoms[0].severity == 4)
+    assert(sum(map(len, read)) < len(body))
+
+
+def test_truncated_body_raises():
+    parser = ArrayFieldParser()
+    assert(parser.feed(b'{"data": [{"a": 1}, {"b"') == [{"a": 1}])
+    with pytest.raises(json.JSONDecodeError):
+        parser.close()
+
+
+def test_latest_record_from_stream():
+    body = json.dumps(RESPONSE).encode("utf-8")
+    records = UserRecordResponse("2065551212").load_from_records(iter_records(chunked(body, 5)), latest_only=True)
+
+    assert(len(records.data) == 1)
+    assert(records.most_recent().timestamp == 1584918778)
@@ -0,0 +1,83 @@
+import asyncio
+
+from cora.connectors.workers import WorkerPool
+
+
+def test_jobs_run_in_background_and_are_counted():
+    pool = WorkerPool(workers=2, max_queue=10)
+    done = []
+
+    async def job(i):
+        await asyncio.sleep(0)
+        done.append(i)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def run():
+        for i in range(5):
+            assert(pool.submit(i, lambda i=i: job(i)) is not None)
+        pool.submit("x", fail)
+        await pool.stop()
+
+    asyncio.run(run())
+
+    stats = pool.stats()
+    assert(sorted(done) == [0, 1, 2, 3, 4])
+    assert(stats["processed"] == 6)
+    assert(stats["failed"] == 1)
+    assert(stats["queue_depth"] == 0)
+    assert(stats["active_keys"] == 0)
+
+
+def test_full_queue_rejects_submissions():
+    pool = WorkerPool(workers=1, max_queue=1)
+    release = None
+
+    async def block():
+        await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        accepted = [pool.submit(i, block) is not None for i in range(3)]
+        await asyncio.sleep(0)
+        accepted.append(pool.submit(3, block) is not None)
+        release.set()
+        await pool.stop()
+        return accepted
+
+    accepted = asyncio.run(run())
+
+    assert(accepted == [True, False, False, True])
+    assert(pool.rejected == 2)
+
+
+def test_same_sender_runs_in_order_while_senders_overlap():
+    pool = WorkerPool(workers=4, max_queue=100)
+    running = {}
+    overlap = []
+    order = []
+
+    async def job(sender, i):
+        running[sender] = running.get(sender, 0) + 1
+        overlap.append(sum(1 for v in running.values() if v))
+        assert(running[sender] == 1)
+        await asyncio.sleep(0.001)
+        order.append((sender, i))
+        running[sender] -= 1
+
+    async def run():
+        futures = []
+        for i in range(5):
+            for sender in ("+12065550001", "+12065550002"):
+                futures.append(pool.submit(sender, lambda s=sender, i=i: job(s, i)))
+        await asyncio.gather(*futures)
+        await pool.stop()
+
+    asyncio.run(run())
+
+    for sender in ("+12065550001", "+12065550002"):
+        assert([i for s, i in order if s == sender] == [0, 1, 2, 3, 4])
+    assert(max(overlap) == 2)
+    assert(pool.stats()["active_keys"] == 0)
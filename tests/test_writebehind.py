@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+
+from cora.models import SurveyResponse
+from cora.writebehind import SurveyWriteBuffer
+
+
+class Result:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_responses_are_flushed_in_batches(tmp_path):
+    written = []
+
+    async def put(response):
+        written.append(response.user_id)
+        return Result(200)
+
+    buffer = SurveyWriteBuffer(put, batch_size=2, flush_interval=0.01, spill_path=str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        for i in range(3):
+            buffer.add(SurveyResponse(f"+1206555000{i}", {"happy": 7}))
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+
+    assert(written == ["+12065550000", "+12065550001", "+12065550002"])
+    assert(buffer.stats()["written"] == 3)
+    assert(buffer.stats()["buffered"] == 0)
+
+
+def test_failed_writes_are_spilled_and_replayed(tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    statuses = [503, 200]
+
+    async def put(response):
+        return Result(statuses.pop(0))
+
+    buffer = SurveyWriteBuffer(put, spill_path=spill_path)
+    response = SurveyResponse("+12065550001", {"happy": 7}, date=1585000000)
+
+    async def run():
+        buffer._buffer.append(response)
+        await buffer.flush()
+        assert(buffer.replay() == 1)
+        await buffer.flush()
+
+    asyncio.run(run())
+
+    assert(buffer.stats() == {"buffered": 0, "written": 1, "failed": 1, "spilled": 1, "replayed": 1, "corrupt": 0})
+    assert(not os.path.exists(spill_path + ".replaying"))
+
+
+def test_overflow_and_exit_spill_to_disk(tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+
+    async def put(response):
+        return Result(200)
+
+    buffer = SurveyWriteBuffer(put, max_buffered=1, flush_interval=60, spill_path=str(spill_path))
+
+    async def run():
+        buffer.add(SurveyResponse("+12065550001", {"happy": 7}))
+        buffer.add(SurveyResponse("+12065550002", {"happy": 8}))
+
+    asyncio.run(run())
+    buffer._spill_buffer()
+
+    lines = spill_path.read_text().splitlines()
+    assert(len(lines) == 2)
+    assert(json.loads(lines[0])["userId"] == "+12065550001")
+
+
+def test_replay_file_kept_until_written_and_corrupt_lines_skipped(tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    spill_path.write_text('{"userId": "+12065550001", "answers": {"happy": 7}, "date": 1585000000}\n'
+                          '{"userId": "+12065550002", "ans')
+
+    async def put(response):
+        return Result(200)
+
+    buffer = SurveyWriteBuffer(put, spill_path=str(spill_path))
+    assert(buffer.replay() == 1)
+    # A crash now loses nothing, the next process loads the replay file again
+    assert(os.path.exists(str(spill_path) + ".replaying"))
+    assert((tmp_path / "spill.jsonl.corrupt").read_text().startswith('{"userId": "+12065550002"'))
+
+    asyncio.run(buffer.flush())
+    assert(buffer.stats()["written"] == 1 and buffer.stats()["corrupt"] == 1)
+    assert(not os.path.exists(str(spill_path) + ".replaying"))
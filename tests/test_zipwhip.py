@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+pytest.importorskip("rasa")
+pytest.importorskip("sanic")
+pytest.importorskip("aiohttp")
+
+from cora.connectors import zipwhip  # noqa: E402
+from cora.connectors.zipwhip import ZipwhipConnector  # noqa: E402
+
+
+class SendHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        self.server.sends.append(form)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        data = b'{"success": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def zipwhip_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SendHandler)
+    server.sends = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    monkeypatch.setattr(zipwhip, "ZIPWHIP_SEND_URL", f"http://{host}:{port}/message/send")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_send_async_retries_unavailable(zipwhip_server):
+    zipwhip_server.statuses = [503, 200]
+    connector = ZipwhipConnector("session-key")
+
+    async def run():
+        try:
+            return await connector.send_async("+12065550100", "Hi", 1585000000.0)
+        finally:
+            await connector.http.close()
+
+    assert(asyncio.run(run()) == 200)
+    assert(len(zipwhip_server.sends) == 2)
+    assert(zipwhip_server.sends[0] == {
+        "session": "session-key", "contacts": "+12065550100", "body": "Hi", "scheduledDate": "1585000000.0"
+    })
+    assert(connector.outbound_stats()["sent"] == 1 and connector.outbound_stats()["retries"] == 1)
+
+
+def test_send_async_gives_up_on_client_errors(zipwhip_server):
+    zipwhip_server.statuses = [400]
+    connector = ZipwhipConnector("session-key")
+
+    async def run():
+        try:
+            return await connector.send_async("+12065550100", "Hi")
+        finally:
+            await connector.http.close()
+
+    assert(asyncio.run(run()) == 400)
+    assert(len(zipwhip_server.sends) == 1)
+    assert(connector.outbound_stats()["failures"] == 1)
+
+
+def test_send_all_async_keeps_each_recipients_messages_in_order():
+    connector = ZipwhipConnector("session-key")
+    sent = []
+
+    async def send_async(recipient, message, delivery_time=None):
+        sent.append((recipient, message))
+        await asyncio.sleep(0.01)
+        return 200
+
+    connector.send_async = send_async
+
+    async def run():
+        await asyncio.gather(
+            connector.send_all_async("+12065550100", [{"text": "1"}, {"text": "2"}], delay=0),
+            connector.send_all_async("+12065550100", [{"text": "3"}, {"text": "4"}], delay=0),
+            connector.send_all_async("+12065550101", [{"text": "5"}], delay=0),
+        )
+
+    asyncio.run(run())
+    assert([message for recipient, message in sent if recipient == "+12065550100"] == ["1", "2", "3", "4"])
+    # The other recipient is not held up behind the first one's messages
+    assert(sent.index(("+12065550101", "5")) < sent.index(("+12065550100", "2")))
+    assert(connector._recipient_locks == {})
+
+
+def test_send_all_async_with_non_text_reply(zipwhip_server, caplog):
+    caplog.set_level(logging.DEBUG)
+    connector = ZipwhipConnector("session-key")
+
+    async def run():
+        try:
+            await connector.send_all_async("+12065550100", [{"image": "https://example.com/chart.png"}], delay=0)
+        finally:
+            await connector.http.close()
+
+    asyncio.run(run())
+    assert(len(zipwhip_server.sends) == 1)
+    assert("session-key" not in caplog.text)